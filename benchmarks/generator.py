@@ -0,0 +1,80 @@
+import random
+from typing import Generator
+
+from src.organization_cards.models import OrganizationCard
+
+BRAND_WORDS = [
+    "пятерочка",
+    "магнит",
+    "перекресток",
+    "вкусвилл",
+    "дикси",
+    "лента",
+    "ozon",
+    "wildberries",
+    "сбербанк",
+    "аптека",
+]
+NAME_WORDS = [
+    "кафе",
+    "ресторан",
+    "салон",
+    "красоты",
+    "магазин",
+    "продукты",
+    "стоматология",
+    "автосервис",
+    "шиномонтаж",
+    "цветы",
+    "пекарня",
+    "ооо",
+    "ип",
+    "центр",
+    "студия",
+    "клиника",
+    "фитнес",
+    "hotel",
+    "bar",
+    "pizza",
+]
+
+
+def generate_organization_cards(
+    cards_count: int,
+    domains_count: int,
+    zipf_exponent: float = 1.1,
+    duplicate_ratio: float = 0.2,
+    chain_ratio: float = 0.3,
+    seed: int = 0,
+) -> Generator[OrganizationCard, None, None]:
+    """
+    Generate cards ordered by id, like the organization cards stream.
+
+    Domains are drawn with Zipf-like weights, so a few domains get most names.
+    A chain_ratio share of domains are brand chains repeating one name, the rest
+    look like aggregators with mostly unique names. A duplicate_ratio share of
+    cards is emitted twice, as the join in the stream query does.
+    """
+    rng = random.Random(seed)
+    domains = [f"site{index}.example.ru" for index in range(domains_count)]
+    weights = [1 / (rank + 1) ** zipf_exponent for rank in range(domains_count)]
+    chain_names = {
+        domain: f"{rng.choice(BRAND_WORDS)} {rng.choice(NAME_WORDS)}"
+        for domain in domains
+        if rng.random() < chain_ratio
+    }
+
+    card_id = 0
+    while card_id < cards_count:
+        batch_size = min(10000, cards_count - card_id)
+        for domain in rng.choices(domains, weights=weights, k=batch_size):
+            card_id += 1
+            organization_name = chain_names.get(domain) or " ".join(
+                rng.choices(NAME_WORDS, k=rng.randint(1, 3))
+                + [str(rng.randint(1, 999))]
+            )
+            link = f"https://{'www.' if rng.random() < 0.5 else ''}{domain}/{card_id}"
+            organization_card = OrganizationCard(card_id, organization_name, link)
+            yield organization_card
+            if rng.random() < duplicate_ratio:
+                yield organization_card
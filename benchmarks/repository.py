@@ -0,0 +1,257 @@
+import heapq
+from contextlib import contextmanager
+from itertools import batched, chain, groupby, zip_longest
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Generator,
+    Iterable,
+    NamedTuple,
+)
+
+from src.config.repository import RepositoryProtocol
+from src.config.settings import settings
+from src.meta.models import SocialMedia
+from src.organization_cards.models import OrganizationCard, SourceOrganizationCard
+
+
+class InMemoryRepository(RepositoryProtocol):
+    """
+    Repository over in-memory lists, for benchmarks without Postgres.
+
+    organization_cards are the cards of source_id. Cards of other sources
+    for the multi-source scan are passed in organization_cards_by_sources,
+    and for_source returns a repository with the result table of that source.
+    """
+
+    def __init__(
+        self,
+        organization_cards: list[OrganizationCard],
+        social_medias: list[SocialMedia] | None = None,
+        top_source_categories: list[str] | None = None,
+        stop_words: list[str] | None = None,
+        source_id: int | None = None,
+        organization_cards_by_sources: dict[int, list[OrganizationCard]] | None = None,
+    ) -> None:
+        self.organization_cards = organization_cards
+        self.social_medias = social_medias or []
+        self.top_source_categories = top_source_categories or []
+        self.stop_words = stop_words or []
+        self.aggregate_domains: dict[str, NamedTuple] = {}
+        # Обновленные и удаленные домены последней записи изменений
+        self.delta_counts: tuple[int, int] = (0, 0)
+        self.watermark: int | None = None
+        self.source_id = settings.SOURCE_ID if source_id is None else source_id
+        self.organization_cards_by_sources = organization_cards_by_sources or {}
+        # Репозитории источников общие, чтобы результаты каждого источника были видны
+        self.source_repositories: dict[int, InMemoryRepository] = {self.source_id: self}
+
+    def get_source_organization_cards(self, source_id: int) -> list[OrganizationCard]:
+        if source_id == self.source_id:
+            return self.organization_cards
+        return self.organization_cards_by_sources.get(source_id, [])
+
+    def for_source(self, source_id: int) -> "InMemoryRepository":
+        source_repository = self.source_repositories.get(source_id)
+        if source_repository is None:
+            source_repository = InMemoryRepository(
+                self.get_source_organization_cards(source_id),
+                social_medias=self.social_medias,
+                top_source_categories=self.top_source_categories,
+                stop_words=self.stop_words,
+                source_id=source_id,
+                organization_cards_by_sources=self.organization_cards_by_sources,
+            )
+            source_repository.source_repositories = self.source_repositories
+            self.source_repositories[source_id] = source_repository
+        return source_repository
+
+    def stream_source_organization_cards(
+        self,
+        source_ids: list[int],
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+    ) -> Generator[SourceOrganizationCard, None, None]:
+        for source_organization_card in heapq.merge(
+            *(
+                self.iter_source_organization_cards(source_id)
+                for source_id in source_ids
+            ),
+            key=lambda source_organization_card: source_organization_card.id,
+        ):
+            if source_organization_card.id <= after_card_id:
+                continue
+            if (
+                until_card_id is not None
+                and source_organization_card.id > until_card_id
+            ):
+                break
+            yield source_organization_card
+
+    def iter_source_organization_cards(
+        self, source_id: int
+    ) -> Generator[SourceOrganizationCard, None, None]:
+        for organization_card in self.get_source_organization_cards(source_id):
+            yield SourceOrganizationCard(source_id, *organization_card)
+
+    def get_max_source_organization_card_id(self, source_ids: list[int]) -> int | None:
+        return max(
+            (
+                organization_cards[-1].id
+                for source_id in source_ids
+                if (organization_cards := self.get_source_organization_cards(source_id))
+            ),
+            default=None,
+        )
+
+    def stream_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        readers: int = 1,
+    ) -> Generator[OrganizationCard, None, None]:
+        """
+        Cards ordered by id, or with several readers the cards of equal id ranges
+        interleaved card by card, as parallel range readers deliver them.
+        """
+        organization_cards = [
+            organization_card
+            for organization_card in self.organization_cards
+            if organization_card.id > after_card_id
+            and (until_card_id is None or organization_card.id <= until_card_id)
+        ]
+        if readers <= 1 or until_card_id is None or not organization_cards:
+            yield from organization_cards
+            return
+
+        from src.organization_cards.repository import split_card_id_range
+
+        range_cards: list[list[list[OrganizationCard]]] = [
+            [
+                list(card_rows)
+                for _, card_rows in groupby(
+                    (
+                        organization_card
+                        for organization_card in organization_cards
+                        if lower < organization_card.id <= upper
+                    ),
+                    key=lambda organization_card: organization_card.id,
+                )
+            ]
+            for lower, upper in split_card_id_range(
+                organization_cards[0].id - 1, until_card_id, readers
+            )
+        ]
+        for card_rows in chain.from_iterable(zip_longest(*range_cards)):
+            if card_rows is not None:
+                yield from card_rows
+
+    async def stream_organization_card_batches(
+        self, after_card_id: int = 0, until_card_id: int | None = None
+    ) -> AsyncGenerator[list[OrganizationCard], None]:
+        for organization_cards in batched(
+            self.stream_organization_cards(after_card_id, until_card_id), 100000
+        ):
+            yield list(organization_cards)
+
+    def get_max_organization_card_id(self) -> int | None:
+        if not self.organization_cards:
+            return None
+        return self.organization_cards[-1].id
+
+    def get_social_medias(self) -> list[SocialMedia]:
+        return self.social_medias
+
+    def get_top_source_categories(self) -> list[str]:
+        return self.top_source_categories
+
+    def get_stop_words(self) -> list[str]:
+        return self.stop_words
+
+    def insert_aggregate_domains(self, aggregate_domains: Iterable[NamedTuple]) -> None:
+        self.aggregate_domains = {
+            aggregate_domain[0]: aggregate_domain
+            for aggregate_domain in aggregate_domains
+        }
+        self.watermark = None
+
+    @contextmanager
+    def write_aggregate_domains(
+        self, last_card_id: int | None
+    ) -> Generator[Callable[[Iterable[NamedTuple]], None], None, None]:
+        aggregate_domains: dict[str, NamedTuple] = {}
+
+        def write(aggregate_domains_batch: Iterable[NamedTuple]) -> None:
+            for aggregate_domain in aggregate_domains_batch:
+                aggregate_domains[aggregate_domain[0]] = aggregate_domain
+
+        yield write
+        self.aggregate_domains = aggregate_domains
+        self.watermark = last_card_id
+
+    @contextmanager
+    def write_aggregate_domains_delta(
+        self, last_card_id: int | None
+    ) -> Generator[Callable[[Iterable[NamedTuple]], None], None, None]:
+        """
+        Same table as write_aggregate_domains. The upserted and deleted domains
+        are counted into delta_counts by content hash, as the database does.
+        """
+        from src.organization_cards.repository import get_content_hash
+
+        stored_hashes: dict[str, int] = {
+            domain: get_content_hash(aggregate_domain)
+            for domain, aggregate_domain in self.aggregate_domains.items()
+        }
+        upserted_count = 0
+
+        with self.write_aggregate_domains(last_card_id) as write:
+
+            def write_delta(aggregate_domains_batch: Iterable[NamedTuple]) -> None:
+                nonlocal upserted_count
+                aggregate_domains_batch = list(aggregate_domains_batch)
+                for aggregate_domain in aggregate_domains_batch:
+                    content_hash = get_content_hash(aggregate_domain)
+                    if stored_hashes.pop(aggregate_domain[0], None) != content_hash:
+                        upserted_count += 1
+                write(aggregate_domains_batch)
+
+            yield write_delta
+        self.delta_counts = (upserted_count, len(stored_hashes))
+
+    async def insert_aggregate_domain_batches(
+        self,
+        aggregate_domain_batches: AsyncIterable[list[NamedTuple]],
+        last_card_id: int | None,
+    ) -> None:
+        aggregate_domains: dict[str, NamedTuple] = {}
+        async for batch in aggregate_domain_batches:
+            for aggregate_domain in batch:
+                aggregate_domains[aggregate_domain[0]] = aggregate_domain
+        self.aggregate_domains = aggregate_domains
+        self.watermark = last_card_id
+
+    def get_aggregator_domains(self) -> list[str]:
+        return [
+            aggregate_domain[0]
+            for aggregate_domain in self.aggregate_domains.values()
+            if aggregate_domain[-1]
+        ]
+
+    def get_aggregate_domain_names(self, domains: list[str]) -> dict[str, list[str]]:
+        return {
+            domain: self.aggregate_domains[domain][1]
+            for domain in domains
+            if domain in self.aggregate_domains
+        }
+
+    def upsert_aggregate_domains(
+        self, aggregate_domains: list[NamedTuple], last_card_id: int
+    ) -> None:
+        for aggregate_domain in aggregate_domains:
+            self.aggregate_domains[aggregate_domain[0]] = aggregate_domain
+        self.watermark = last_card_id
+
+    def get_aggregate_domains_watermark(self) -> int | None:
+        return self.watermark
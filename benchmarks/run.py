@@ -0,0 +1,205 @@
+"""
+Benchmarks of the aggregation stages on synthetic cards.
+
+    python -m benchmarks.run --cards 1000000 --domains 50000 --engine encoded
+    python -m benchmarks.run --cards 1000000 --sources 3
+"""
+
+import argparse
+import json
+import resource
+import time
+import tracemalloc
+from contextlib import contextmanager
+from typing import Any, Generator, NamedTuple
+
+from benchmarks.generator import generate_organization_cards
+from benchmarks.repository import InMemoryRepository
+from src.config.logging import configure_logging
+from src.config.settings import settings
+from src.meta.models import SocialMedia
+from src.organization_cards.models import OrganizationCard
+
+
+class StageResult(NamedTuple):
+    stage: str
+    rows: int
+    seconds: float
+    cards_per_second: float
+    peak_memory_mb: float
+
+
+class Benchmark:
+    def __init__(self, cards_count: int, trace_memory: bool = True) -> None:
+        self.cards_count = cards_count
+        self.trace_memory = trace_memory
+        self.results: list[StageResult] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[dict[str, int], None, None]:
+        counters = {"rows": 0}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+        start_time = time.perf_counter()
+        yield counters
+        seconds = time.perf_counter() - start_time
+        peak_memory = 0
+        if self.trace_memory:
+            peak_memory = tracemalloc.get_traced_memory()[1] - start_memory
+        self.results.append(
+            StageResult(
+                stage=name,
+                rows=counters["rows"],
+                seconds=round(seconds, 3),
+                cards_per_second=round(self.cards_count / seconds) if seconds else 0,
+                peak_memory_mb=round(peak_memory / 1024 / 1024, 1),
+            )
+        )
+
+    def run(self, repository: InMemoryRepository) -> list[StageResult]:
+        # Сервис импортируется после загрузки .env, как в точках входа src.cli
+        from src.aggregators.services import AggregatorService
+
+        if self.trace_memory:
+            tracemalloc.start()
+
+        service = AggregatorService(repository=repository)
+        social_media_domains = {
+            social_media.primary_domain for social_media in repository.social_medias
+        }
+        top_source_categories = set(repository.top_source_categories)
+        stop_words = set(repository.stop_words)
+
+        with self.stage("get_domain/clear_domain") as counters:
+            for organization_card in repository.organization_cards:
+                domain = service.get_domain(
+                    organization_card.link, social_media_domains
+                )
+                if domain and service.clear_domain(domain):
+                    counters["rows"] += 1
+        # Кэш доменов не должен ускорять следующий этап
+        service.domain_extractor.split_host.cache_clear()
+
+        with self.stage("grouping_organization_names_by_domain") as counters:
+            organization_names_by_domains = (
+                service.grouping_organization_names_by_domain(
+                    repository.stream_organization_cards(), social_media_domains
+                )
+            )
+            counters["rows"] = len(organization_names_by_domains)
+
+        with self.stage("get_words_out_names") as counters:
+            for variant_names in organization_names_by_domains.values():
+                cleaned_variant_names = service.clear_variant_names(
+                    variant_names, top_source_categories
+                )
+                service.get_words_out_names(cleaned_variant_names, stop_words)
+                counters["rows"] += len(cleaned_variant_names)
+        # Кэш токенизатора тоже не должен ускорять следующий этап
+        service.get_tokenizer(stop_words).tokenize.cache_clear()
+
+        with self.stage("adding_in_models") as counters:
+            models = service.adding_in_models(
+                organization_names_by_domains, top_source_categories, stop_words
+            )
+            counters["rows"] = len(models)
+
+        with self.stage("insert_aggregate_domains") as counters:
+            repository.insert_aggregate_domains(models)
+            counters["rows"] = len(repository.aggregate_domains)
+
+        del organization_names_by_domains, models
+
+        with self.stage(
+            f"get_aggregate_domains[{settings.AGGREGATION_ENGINE}]"
+        ) as counters:
+            service.get_aggregate_domains()
+            counters["rows"] = sum(
+                len(source_repository.aggregate_domains)
+                for source_repository in repository.source_repositories.values()
+            )
+
+        if self.trace_memory:
+            tracemalloc.stop()
+        return self.results
+
+
+def main(argv: list[str] | None = None) -> list[StageResult]:
+    settings.load_env_file()
+    configure_logging()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cards", type=int, default=200000)
+    parser.add_argument("--domains", type=int, default=20000)
+    parser.add_argument("--zipf-exponent", type=float, default=1.1)
+    parser.add_argument("--duplicate-ratio", type=float, default=0.2)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", default=settings.AGGREGATION_ENGINE)
+    parser.add_argument(
+        "--sources",
+        type=int,
+        default=1,
+        help="spread the cards over this many sources and aggregate them in one scan; "
+        "the stages before get_aggregate_domains use the cards of the first source",
+    )
+    parser.add_argument(
+        "--no-trace-memory",
+        action="store_true",
+        help="skip tracemalloc, which slows down every stage",
+    )
+    parser.add_argument("--json", help="write the results to this file")
+    args = parser.parse_args(argv)
+
+    settings.AGGREGATION_ENGINE = args.engine
+    organization_cards = list(
+        generate_organization_cards(
+            args.cards,
+            args.domains,
+            zipf_exponent=args.zipf_exponent,
+            duplicate_ratio=args.duplicate_ratio,
+            seed=args.seed,
+        )
+    )
+    # Карточки распределяются по источникам по id, первый источник — SOURCE_ID
+    source_ids = [settings.SOURCE_ID + index for index in range(args.sources)]
+    organization_cards_by_sources: dict[int, list[OrganizationCard]] = {
+        source_id: [] for source_id in source_ids
+    }
+    for organization_card in organization_cards:
+        organization_cards_by_sources[
+            source_ids[organization_card.id % len(source_ids)]
+        ].append(organization_card)
+    settings.SOURCE_IDS = source_ids
+    repository = InMemoryRepository(
+        organization_cards_by_sources[settings.SOURCE_ID],
+        social_medias=[SocialMedia(1, "vk", "site0.example.ru")],
+        top_source_categories=["кафе", "ресторан", "аптека"],
+        stop_words=["ооо", "ип"],
+        organization_cards_by_sources=organization_cards_by_sources,
+    )
+
+    benchmark = Benchmark(args.cards, trace_memory=not args.no_trace_memory)
+    results = benchmark.run(repository)
+
+    print(f"{'stage':45} {'rows':>10} {'seconds':>9} {'cards/s':>10} {'peak MB':>9}")
+    for result in results:
+        print(
+            f"{result.stage:45} {result.rows:>10} {result.seconds:>9} "
+            f"{result.cards_per_second:>10} {result.peak_memory_mb:>9}"
+        )
+    max_rss_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"max RSS: {max_rss_mb:.1f} MB")
+
+    if args.json:
+        report: dict[str, Any] = {
+            "arguments": vars(args),
+            "stages": [result._asdict() for result in results],
+            "max_rss_mb": round(max_rss_mb, 1),
+        }
+        with open(args.json, "w") as json_file:
+            json.dump(report, json_file, ensure_ascii=False, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+from collections import defaultdict
+from typing import Generator, Iterable
+
+from src.aggregators.calculator import (
+    AggregatorCalculator,
+    DomainName,
+    VariantNamesByDomain,
+)
+from src.aggregators.dedup import DomainNameDeduplicator
+from src.aggregators.models import OrganizationNamesByDomain
+from src.aggregators.sketches import HeavyHitters, HyperLogLog, ReservoirSample
+from src.config.logging import logging
+from src.config.metrics import metrics
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class ApproximateNames:
+    """
+    Bounded summary of the names of one giant domain.
+
+    Name and first word counts stay exact, unique counts are HyperLogLog
+    estimates, word counts come from a heavy hitters summary, and only
+    a reservoir sample of the names is kept for the result arrays.
+    """
+
+    def __init__(
+        self,
+        domain: str,
+        sample_size: int,
+        precision: int,
+        keyword_counters: int,
+    ) -> None:
+        self.names_count = 0
+        self.names = HyperLogLog(precision)
+        self.first_words_count = 0
+        self.first_words = HyperLogLog(precision)
+        self.words = HeavyHitters(keyword_counters)
+        self.names_sample = ReservoirSample(sample_size, domain)
+
+    def update(
+        self,
+        cleaned_variant_names: list[str],
+        first_word_of_names: list[str],
+        words: list[str],
+    ) -> None:
+        self.names_count += len(cleaned_variant_names)
+        self.names.update(cleaned_variant_names)
+        self.names_sample.update(cleaned_variant_names)
+        self.first_words_count += len(first_word_of_names)
+        self.first_words.update(first_word_of_names)
+        self.words.update(words)
+
+
+class ApproximateGrouper:
+    """
+    Groups names exactly until a domain reaches min_names, then summarizes it.
+
+    Names of a summarized domain are buffered up to min_names and folded
+    into its ApproximateNames, so memory per domain is bounded. Small domains
+    get exact models, as without the approximate mode.
+    """
+
+    def __init__(
+        self,
+        calculator: AggregatorCalculator,
+        top_source_categories: set[str],
+        stop_words: set[str],
+        min_names: int | None = None,
+        sample_size: int | None = None,
+        precision: int | None = None,
+        keyword_counters: int | None = None,
+    ) -> None:
+        self.calculator = calculator
+        self.top_source_categories = top_source_categories
+        self.stop_words = stop_words
+        self.min_names = min_names or settings.APPROXIMATE_MIN_NAMES
+        self.sample_size = sample_size or settings.APPROXIMATE_SAMPLE_SIZE
+        self.precision = precision or settings.APPROXIMATE_HLL_PRECISION
+        self.keyword_counters = (
+            keyword_counters or settings.APPROXIMATE_KEYWORD_COUNTERS
+        )
+        self.organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        self.approximate_names_by_domains: dict[str, ApproximateNames] = {}
+
+    def __len__(self) -> int:
+        return len(self.organization_names_by_domains)
+
+    def group(self, domain_names: Iterable[DomainName]) -> None:
+        deduplicator = DomainNameDeduplicator(self.calculator.ordered_stream)
+        for domain, _, organization_name in deduplicator.iter_unique(domain_names):
+            variant_names = self.organization_names_by_domains[domain]
+            variant_names.append(organization_name)
+            if len(variant_names) >= self.min_names:
+                self.summarize(domain, variant_names)
+
+    def summarize(self, domain: str, variant_names: list[str]) -> None:
+        approximate_names = self.approximate_names_by_domains.get(domain)
+        if approximate_names is None:
+            approximate_names = self.approximate_names_by_domains[domain] = (
+                ApproximateNames(
+                    domain, self.sample_size, self.precision, self.keyword_counters
+                )
+            )
+        cleaned_variant_names = self.calculator.clear_variant_names(
+            variant_names, self.top_source_categories
+        )
+        first_word_of_names, words = self.calculator.get_words_out_names(
+            cleaned_variant_names, self.stop_words
+        )
+        approximate_names.update(cleaned_variant_names, first_word_of_names, words)
+        variant_names.clear()
+
+    def iter_models(self) -> Generator[OrganizationNamesByDomain, None, None]:
+        approximate_names_by_domains = self.approximate_names_by_domains
+        for domain in approximate_names_by_domains:
+            self.summarize(domain, self.organization_names_by_domains[domain])
+        logger.info(
+            f"Approximated {len(approximate_names_by_domains)} domains "
+            f"with at least {self.min_names} names"
+        )
+        metrics.set("approximate_domains", len(approximate_names_by_domains))
+
+        yield from self.calculator.iter_models(
+            (
+                (domain, variant_names)
+                for domain, variant_names in self.organization_names_by_domains.items()
+                if domain not in approximate_names_by_domains
+            ),
+            self.top_source_categories,
+            self.stop_words,
+        )
+        for domain, approximate_names in approximate_names_by_domains.items():
+            if approximate_names.names_count:
+                yield self.build_model(domain, approximate_names)
+
+    def build_model(
+        self, domain: str, approximate_names: ApproximateNames
+    ) -> OrganizationNamesByDomain:
+        calculator = self.calculator
+        names_count = approximate_names.names_count
+        first_words_count = approximate_names.first_words_count
+        # Оценка HyperLogLog может немного превысить точное количество
+        names_unique_count = min(approximate_names.names.count(), names_count)
+        first_words_unique_count = min(
+            approximate_names.first_words.count(), first_words_count
+        )
+
+        names_sample = approximate_names.names_sample.values
+        first_word_of_names_sample, _ = calculator.get_words_out_names(
+            names_sample, self.stop_words
+        )
+
+        word_counts = approximate_names.words.counters
+        keywords = calculator.get_keywords(word_counts, names_count)
+        keyword_score = calculator.get_keyword_score(word_counts, names_count)
+        unique_names_ratio = calculator.calculate_unique_ratio(
+            names_unique_count, names_count
+        )
+        unique_first_words_ratio = calculator.calculate_unique_ratio(
+            first_words_unique_count, first_words_count
+        )
+
+        model = OrganizationNamesByDomain(
+            domain=domain,
+            organization_names=names_sample,
+            organization_names_count=names_count,
+            organization_names_unique=list(set(names_sample)),
+            organization_names_unique_count=names_unique_count,
+            first_word_of_names=first_word_of_names_sample,
+            first_word_of_names_count=first_words_count,
+            first_word_of_names_unique=list(set(first_word_of_names_sample)),
+            first_word_of_names_unique_count=first_words_unique_count,
+            unique_names_ratio=unique_names_ratio,
+            unique_first_words_ratio=unique_first_words_ratio,
+            keywords=keywords,
+            keyword_score=keyword_score,
+            is_aggregator=calculator.is_aggregator(
+                names_count,
+                unique_names_ratio,
+                unique_first_words_ratio,
+                keyword_score,
+            ),
+        )
+        if not calculator.writes_arrays(model.is_aggregator):
+            model = calculator.without_arrays(model)
+        return model
@@ -0,0 +1,517 @@
+from array import array
+from collections import Counter, defaultdict
+from typing import DefaultDict, Generator, Iterable, NamedTuple
+
+from src.aggregators.dedup import DomainNameDeduplicator
+from src.aggregators.domains import DomainExtractor
+from src.aggregators.encoding import EncodedNamesByDomain, StringTable
+from src.aggregators.models import OrganizationNamesByDomain
+from src.aggregators.tokenizer import Tokenizer
+from src.config.logging import logging
+from src.config.metrics import metrics
+from src.config.settings import settings
+from src.organization_cards.models import OrganizationCardRow, SourceOrganizationCard
+
+logger = logging.getLogger(__name__)
+
+VariantNamesByDomain = DefaultDict[str, list[str]]
+# Домен, id карточки и название организации в нижнем регистре
+DomainName = tuple[str, int, str]
+# То же с ключом (источник, домен) для нескольких источников
+SourceDomainName = tuple[tuple[int, str], int, str]
+
+# Пороги признаков агрегатора
+KEYWORD_MIN_RATIO = 0.3
+AGGREGATOR_MIN_NAMES_COUNT = 10
+AGGREGATOR_MIN_UNIQUE_NAMES_RATIO = 0.7
+AGGREGATOR_MIN_UNIQUE_FIRST_WORDS_RATIO = 0.4
+AGGREGATOR_MAX_KEYWORD_SCORE = 0.3
+
+
+class AggregatorThresholds(NamedTuple):
+    keyword_min_ratio: float = KEYWORD_MIN_RATIO
+    min_names_count: int = AGGREGATOR_MIN_NAMES_COUNT
+    min_unique_names_ratio: float = AGGREGATOR_MIN_UNIQUE_NAMES_RATIO
+    min_unique_first_words_ratio: float = AGGREGATOR_MIN_UNIQUE_FIRST_WORDS_RATIO
+    max_keyword_score: float = AGGREGATOR_MAX_KEYWORD_SCORE
+
+
+class EncodedNameWords(NamedTuple):
+    words: StringTable
+    # Названия, отфильтрованные по топ-категориям
+    excluded_name_ids: set[int]
+    # Id первого слова названия или -1, если слов нет
+    first_word_ids_by_name: list[int]
+    word_ids_by_name: list[tuple[int, ...]]
+
+
+class CalculateRatio:
+    thresholds = AggregatorThresholds()
+
+    def get_keywords(self, word_counts: Counter, names_count: int) -> list[str]:
+        keyword_min_ratio = self.thresholds.keyword_min_ratio
+        keywords: list[str] = [
+            word
+            for word, count in word_counts.items()
+            if count / names_count >= keyword_min_ratio
+        ]
+        return keywords
+
+    def get_keyword_score(self, word_counts: Counter, names_count: int) -> float:
+        keyword_score: float = (
+            max(word_counts.values()) / names_count if word_counts else 0.0
+        )
+        return keyword_score
+
+    def calculate_unique_ratio(
+        self, unique_names_count: int, names_count: int
+    ) -> float:
+        unique_names_ratio: float = (
+            unique_names_count / names_count if names_count > 0 else 0.0
+        )
+        return unique_names_ratio
+
+
+class AggregatorCalculator(CalculateRatio):
+    """
+    Computes aggregator features. Holds no repository, so it can run in worker processes.
+    """
+
+    def __init__(
+        self,
+        domain_extractor: DomainExtractor | None = None,
+        thresholds: AggregatorThresholds | None = None,
+    ):
+        self.domain_extractor = domain_extractor or DomainExtractor()
+        self.thresholds = thresholds or AggregatorThresholds()
+        self.tokenizer: Tokenizer | None = None
+        # Поток карточек упорядочен по id: дубликаты карточки идут подряд
+        self.ordered_stream = True
+        self.output_arrays = settings.OUTPUT_ARRAYS
+
+    def clear_variant_names(
+        self, variant_names: list[str], top_source_categories: set[str]
+    ) -> list[str]:
+        cleaned_variant_names: list[str] = []
+        for variant_name in variant_names:
+            if not variant_name:
+                continue
+            if variant_name in top_source_categories:
+                continue
+            cleaned_variant_names.append(variant_name)
+        return cleaned_variant_names
+
+    def get_tokenizer(self, stop_words: set[str]) -> Tokenizer:
+        if self.tokenizer is None or not self.tokenizer.matches(stop_words):
+            self.tokenizer = Tokenizer(stop_words)
+        return self.tokenizer
+
+    def get_words_out_names(
+        self, cleaned_variant_names: list[str], stop_words: set[str]
+    ) -> tuple[list[str], list[str]]:
+        """First words and all words of names already filtered by clear_variant_names"""
+        return self.get_tokenizer(stop_words).tokenize_names(cleaned_variant_names)
+
+    def report_tokenizer(self) -> None:
+        if self.tokenizer is None:
+            return
+        tokenizer = self.tokenizer
+        cache_info = tokenizer.tokenize.cache_info()
+        lookups = cache_info.hits + cache_info.misses
+        metrics.set("tokenizer_calls", tokenizer.calls)
+        metrics.set(
+            "tokenizer_calls_per_second",
+            round(tokenizer.calls / tokenizer.seconds) if tokenizer.seconds else 0,
+        )
+        metrics.set(
+            "tokenizer_cache_hit_rate", cache_info.hits / lookups if lookups else 0.0
+        )
+        logger.info(
+            f"Tokenizer: {tokenizer.calls} names in {tokenizer.seconds:.1f}s, "
+            f"{cache_info.hits} cache hits, {cache_info.currsize} names cached"
+        )
+
+    def is_aggregator(
+        self,
+        cleaned_variant_names_count: int,
+        unique_names_ratio: float,
+        unique_first_words_ratio: float,
+        keyword_score: float,
+    ) -> bool:
+        thresholds = self.thresholds
+        return (
+            (cleaned_variant_names_count > thresholds.min_names_count)
+            and (unique_names_ratio > thresholds.min_unique_names_ratio)
+            and (
+                (unique_first_words_ratio > thresholds.min_unique_first_words_ratio)
+                or (keyword_score < thresholds.max_keyword_score)
+            )
+        )
+
+    def is_counted_only(self, cleaned_variant_names_count: int) -> bool:
+        """A small domain in a lean output mode can never be an aggregator"""
+        return (
+            self.output_arrays != "all"
+            and cleaned_variant_names_count <= self.thresholds.min_names_count
+        )
+
+    def get_counted_model(
+        self,
+        domain: str,
+        cleaned_variant_names_count: int,
+        cleaned_variant_names_unique_count: int,
+    ) -> OrganizationNamesByDomain:
+        """Model of a small domain, without splitting its names into words"""
+        return OrganizationNamesByDomain(
+            domain=domain,
+            organization_names=None,
+            organization_names_count=cleaned_variant_names_count,
+            organization_names_unique=None,
+            organization_names_unique_count=cleaned_variant_names_unique_count,
+            first_word_of_names=None,
+            first_word_of_names_count=None,
+            first_word_of_names_unique=None,
+            first_word_of_names_unique_count=None,
+            unique_names_ratio=self.calculate_unique_ratio(
+                cleaned_variant_names_unique_count, cleaned_variant_names_count
+            ),
+            unique_first_words_ratio=None,
+            keywords=None,
+            keyword_score=None,
+            is_aggregator=False,
+        )
+
+    def writes_arrays(self, is_aggregator: bool) -> bool:
+        return self.output_arrays == "all" or (
+            self.output_arrays == "candidates" and is_aggregator
+        )
+
+    def writes_all_names(self) -> bool:
+        """Every domain is written with the arrays of all its organization names"""
+        return self.output_arrays == "all" and settings.APPROXIMATE_MIN_NAMES == 0
+
+    def get_watermark(self, until_card_id: int) -> int | None:
+        """
+        Watermark stored with the result table. INCREMENTAL appends new names
+        to the stored arrays, so a table written without all names gets no
+        watermark and the next incremental run rebuilds it.
+        """
+        if self.writes_all_names():
+            return until_card_id
+        logger.info(
+            "Aggregate domains are written without all organization names, "
+            "removing the watermark"
+        )
+        return None
+
+    def without_arrays(
+        self, model: OrganizationNamesByDomain
+    ) -> OrganizationNamesByDomain:
+        return model._replace(
+            organization_names=None,
+            organization_names_unique=None,
+            first_word_of_names=None,
+            first_word_of_names_unique=None,
+        )
+
+    def adding_in_models(
+        self,
+        organization_names_by_domains: VariantNamesByDomain,
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> list[OrganizationNamesByDomain]:
+        with metrics.stage("adding_in_models") as stage:
+            models: list[OrganizationNamesByDomain] = list(
+                self.iter_models(
+                    organization_names_by_domains.items(),
+                    top_source_categories,
+                    stop_words,
+                )
+            )
+            stage.rows_in = len(organization_names_by_domains)
+            stage.rows_out = len(models)
+        return models
+
+    def iter_models(
+        self,
+        variant_names_by_domain: Iterable[tuple[str, list[str]]],
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> Generator[OrganizationNamesByDomain, None, None]:
+        for domain, variant_names in variant_names_by_domain:
+            cleaned_variant_names: list[str] = self.clear_variant_names(
+                variant_names, top_source_categories
+            )
+            if not cleaned_variant_names:
+                continue
+            if self.is_counted_only(len(cleaned_variant_names)):
+                yield self.get_counted_model(
+                    domain, len(cleaned_variant_names), len(set(cleaned_variant_names))
+                )
+                continue
+
+            first_word_of_names, words = self.get_words_out_names(
+                cleaned_variant_names, stop_words
+            )
+
+            # 1. Количество названий организаций после фильтрации по топ-категориям
+            cleaned_variant_names_count: int = len(cleaned_variant_names)
+            # 2. Количество уникальных названий организаций после фильтрации по топ-категориям
+            cleaned_variant_names_unique_count: int = len(
+                list(set(cleaned_variant_names))
+            )
+
+            # 3. Количество первых слов в названиях организаций
+            first_word_of_names_count: int = len(first_word_of_names)
+            # 4. Количество уникальных первых слов в названиях организаций
+            first_word_of_names_unique_count: int = len(list(set(first_word_of_names)))
+
+            # 5. Подсчет слов, которые встречаются в ≥30% названий
+            word_counts = Counter(words)
+            keywords: list[str] = self.get_keywords(
+                word_counts, cleaned_variant_names_count
+            )
+            keyword_score: float = self.get_keyword_score(
+                word_counts, cleaned_variant_names_count
+            )
+
+            # 6. Подсчет уникальных названий организаций
+            unique_names_ratio: float = self.calculate_unique_ratio(
+                cleaned_variant_names_unique_count, cleaned_variant_names_count
+            )
+            # 7. Подсчет уникальных первых слов в названиях организаций
+            unique_first_words_ratio: float = self.calculate_unique_ratio(
+                first_word_of_names_unique_count, first_word_of_names_count
+            )
+
+            is_aggregator = self.is_aggregator(
+                cleaned_variant_names_count,
+                unique_names_ratio,
+                unique_first_words_ratio,
+                keyword_score,
+            )
+
+            model = OrganizationNamesByDomain(
+                domain=domain,
+                organization_names=cleaned_variant_names,
+                organization_names_count=len(cleaned_variant_names),
+                organization_names_unique=list(set(cleaned_variant_names)),
+                organization_names_unique_count=len(list(set(cleaned_variant_names))),
+                first_word_of_names=first_word_of_names,
+                first_word_of_names_count=len(first_word_of_names),
+                first_word_of_names_unique=list(set(first_word_of_names)),
+                first_word_of_names_unique_count=len(list(set(first_word_of_names))),
+                unique_names_ratio=unique_names_ratio,
+                unique_first_words_ratio=unique_first_words_ratio,
+                keywords=keywords,
+                keyword_score=keyword_score,
+                is_aggregator=is_aggregator,
+            )
+            if not self.writes_arrays(is_aggregator):
+                model = self.without_arrays(model)
+            yield model
+
+    def group_encoded_domain_names(
+        self, domain_names: Iterable[DomainName]
+    ) -> EncodedNamesByDomain:
+        encoded_names_by_domains = EncodedNamesByDomain()
+        deduplicator = DomainNameDeduplicator(self.ordered_stream)
+
+        for domain, _, organization_name in deduplicator.iter_unique(domain_names):
+            encoded_names_by_domains.add(domain, organization_name)
+
+        return encoded_names_by_domains
+
+    def encode_name_words(
+        self,
+        names: StringTable,
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> EncodedNameWords:
+        """Filter and split every distinct name into word ids once"""
+        encoded_words = EncodedNameWords(
+            words=StringTable(),
+            excluded_name_ids=set(),
+            first_word_ids_by_name=[],
+            word_ids_by_name=[],
+        )
+        words = encoded_words.words
+
+        for name_id, variant_name in enumerate(names.strings):
+            if not self.clear_variant_names([variant_name], top_source_categories):
+                encoded_words.excluded_name_ids.add(name_id)
+
+        # Названия в таблице уникальны, поэтому кэш токенизатора не нужен
+        name_tokens = self.get_tokenizer(stop_words).tokenize_distinct_names(
+            "" if name_id in encoded_words.excluded_name_ids else variant_name
+            for name_id, variant_name in enumerate(names.strings)
+        )
+        for first_word, name_words in name_tokens:
+            encoded_words.first_word_ids_by_name.append(
+                words.encode(first_word) if first_word is not None else -1
+            )
+            encoded_words.word_ids_by_name.append(
+                tuple(words.encode(word) for word in name_words)
+            )
+        return encoded_words
+
+    def iter_encoded_models(
+        self,
+        encoded_names_by_domains: EncodedNamesByDomain,
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> Generator[OrganizationNamesByDomain, None, None]:
+        """
+        Same features as iter_models, computed on name and word ids.
+
+        Every distinct name is filtered and split into words once,
+        and strings are decoded only when the model is built.
+        """
+        names: StringTable = encoded_names_by_domains.names
+        encoded_words = self.encode_name_words(names, top_source_categories, stop_words)
+        words = encoded_words.words
+        excluded_name_ids = encoded_words.excluded_name_ids
+        first_word_ids_by_name = encoded_words.first_word_ids_by_name
+        word_ids_by_name = encoded_words.word_ids_by_name
+
+        for domain, name_ids in encoded_names_by_domains.name_ids_by_domains.items():
+            cleaned_name_ids = (
+                array("I", (i for i in name_ids if i not in excluded_name_ids))
+                if excluded_name_ids
+                else name_ids
+            )
+            if not cleaned_name_ids:
+                continue
+
+            name_id_counts = Counter(cleaned_name_ids)
+            if self.is_counted_only(len(cleaned_name_ids)):
+                yield self.get_counted_model(
+                    domain, len(cleaned_name_ids), len(name_id_counts)
+                )
+                continue
+
+            first_word_ids: list[int] = [
+                first_word_ids_by_name[name_id]
+                for name_id in cleaned_name_ids
+                if first_word_ids_by_name[name_id] >= 0
+            ]
+            word_id_counts: Counter = Counter()
+            for name_id, count in name_id_counts.items():
+                for word_id in word_ids_by_name[name_id]:
+                    word_id_counts[word_id] += count
+
+            cleaned_variant_names_count: int = len(cleaned_name_ids)
+            cleaned_variant_names_unique_count: int = len(name_id_counts)
+            first_word_of_names_count: int = len(first_word_ids)
+            unique_first_word_ids: set[int] = set(first_word_ids)
+            first_word_of_names_unique_count: int = len(unique_first_word_ids)
+
+            keywords: list[str] = words.decode_all(
+                self.get_keywords(word_id_counts, cleaned_variant_names_count)
+            )
+            keyword_score: float = self.get_keyword_score(
+                word_id_counts, cleaned_variant_names_count
+            )
+            unique_names_ratio: float = self.calculate_unique_ratio(
+                cleaned_variant_names_unique_count, cleaned_variant_names_count
+            )
+            unique_first_words_ratio: float = self.calculate_unique_ratio(
+                first_word_of_names_unique_count, first_word_of_names_count
+            )
+            is_aggregator = self.is_aggregator(
+                cleaned_variant_names_count,
+                unique_names_ratio,
+                unique_first_words_ratio,
+                keyword_score,
+            )
+
+            # Строки декодируются, только если массивы будут записаны
+            writes_arrays = self.writes_arrays(is_aggregator)
+            yield OrganizationNamesByDomain(
+                domain=domain,
+                organization_names=names.decode_all(cleaned_name_ids)
+                if writes_arrays
+                else None,
+                organization_names_count=cleaned_variant_names_count,
+                organization_names_unique=names.decode_all(name_id_counts)
+                if writes_arrays
+                else None,
+                organization_names_unique_count=cleaned_variant_names_unique_count,
+                first_word_of_names=words.decode_all(first_word_ids)
+                if writes_arrays
+                else None,
+                first_word_of_names_count=first_word_of_names_count,
+                first_word_of_names_unique=words.decode_all(unique_first_word_ids)
+                if writes_arrays
+                else None,
+                first_word_of_names_unique_count=first_word_of_names_unique_count,
+                unique_names_ratio=unique_names_ratio,
+                unique_first_words_ratio=unique_first_words_ratio,
+                keywords=keywords,
+                keyword_score=keyword_score,
+                is_aggregator=is_aggregator,
+            )
+
+    def get_domain(self, link: str, social_media_domains: set[str]) -> str | None:
+        return self.domain_extractor.get_domain(link, social_media_domains)
+
+    def clear_domain(self, domain: str) -> str | None:
+        return self.domain_extractor.clear_domain(domain)
+
+    def get_card_domain(self, link: str, social_media_domains: set[str]) -> str | None:
+        domain = self.get_domain(link, social_media_domains)
+        if not domain:
+            return None
+
+        domain_cleaned = self.clear_domain(domain)
+        if not domain_cleaned:
+            return None
+
+        return domain
+
+    def iter_domain_names(
+        self,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+    ) -> Generator[DomainName, None, None]:
+        # Поля распаковываются по позиции, так что подходят и модели, и кортежи из COPY
+        for organization_card_id, organization_name, link in organization_cards:
+            domain = self.get_card_domain(link, social_media_domains)
+            if domain:
+                yield domain, organization_card_id, organization_name.lower()
+
+    def iter_source_domain_names(
+        self,
+        source_organization_cards: Iterable[SourceOrganizationCard],
+        social_media_domains: set[str],
+    ) -> Generator[SourceDomainName, None, None]:
+        for (
+            source_id,
+            organization_card_id,
+            organization_name,
+            link,
+        ) in source_organization_cards:
+            domain = self.get_card_domain(link, social_media_domains)
+            if domain:
+                yield (
+                    (source_id, domain),
+                    organization_card_id,
+                    organization_name.lower(),
+                )
+
+    def group_domain_names(
+        self,
+        domain_names: Iterable[DomainName] | Iterable[SourceDomainName],
+        deduplicator: DomainNameDeduplicator | None = None,
+    ) -> VariantNamesByDomain:
+        """
+        Group names by domain, once per card. Pass the same deduplicator
+        to group a stream split into several calls.
+        """
+        organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        deduplicator = deduplicator or DomainNameDeduplicator(self.ordered_stream)
+
+        for domain, _, organization_name in deduplicator.iter_unique(domain_names):
+            organization_names_by_domains[domain].append(organization_name)
+
+        return organization_names_by_domains
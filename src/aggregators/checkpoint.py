@@ -0,0 +1,130 @@
+import json
+import pickle
+import re
+from pathlib import Path
+from typing import Generator, NamedTuple
+
+from src.aggregators.calculator import VariantNamesByDomain
+from src.aggregators.models import OrganizationNamesByDomain
+from src.config.logging import logging
+from src.config.metrics import write_atomic
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+STATE_FILE_NAME = "state.json"
+MODELS_FILE_NAME = "models.pickle"
+SEGMENT_NAME = re.compile(r"segment_\d+\.pickle")
+
+
+class CheckpointState(NamedTuple):
+    # Верхняя граница снимка карточек, общая для всех возобновлений
+    until_card_id: int
+    # Последняя карточка, названия которой уже сохранены в сегментах
+    last_card_id: int
+    segments: int
+    computed: bool
+
+
+class Checkpoint:
+    """
+    Checkpoint of a full run in a local directory.
+
+    Names grouped from each batch of cards are saved as a separate pickle segment,
+    and state.json records the last card id covered by the segments. Computed
+    models are saved before the insert, so a failed write is retried without
+    scanning again. Files are written through a temporary file and renamed,
+    so a crash at any moment leaves the previous checkpoint readable.
+    """
+
+    def __init__(self, directory: str | None = None) -> None:
+        directory = directory or settings.CHECKPOINT_DIR
+        if not directory:
+            raise ValueError("Checkpoint needs a directory: set CHECKPOINT_DIR")
+        self.directory = Path(directory)
+
+    @property
+    def state_path(self) -> Path:
+        return self.directory / STATE_FILE_NAME
+
+    @property
+    def models_path(self) -> Path:
+        return self.directory / MODELS_FILE_NAME
+
+    def get_segment_path(self, segment: int) -> Path:
+        return self.directory / f"segment_{segment}.pickle"
+
+    def load(self) -> CheckpointState | None:
+        if not self.state_path.exists():
+            return None
+        return CheckpointState(**json.loads(self.state_path.read_text()))
+
+    def start(self, until_card_id: int) -> CheckpointState:
+        self.clear()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        return self.save_state(
+            CheckpointState(
+                until_card_id=until_card_id, last_card_id=0, segments=0, computed=False
+            )
+        )
+
+    def save_state(self, state: CheckpointState) -> CheckpointState:
+        write_atomic(self.state_path, json.dumps(state._asdict()))
+        return state
+
+    def save_segment(
+        self,
+        state: CheckpointState,
+        organization_names_by_domains: VariantNamesByDomain,
+        last_card_id: int,
+    ) -> CheckpointState:
+        write_atomic(
+            self.get_segment_path(state.segments),
+            pickle.dumps(
+                dict(organization_names_by_domains), protocol=pickle.HIGHEST_PROTOCOL
+            ),
+        )
+        logger.info(f"Saved checkpoint at card id {last_card_id}")
+        return self.save_state(
+            state._replace(last_card_id=last_card_id, segments=state.segments + 1)
+        )
+
+    def iter_segments(
+        self, state: CheckpointState
+    ) -> Generator[dict[str, list[str]], None, None]:
+        for segment in range(state.segments):
+            with open(self.get_segment_path(segment), "rb") as segment_file:
+                yield pickle.load(segment_file)
+
+    def save_models(
+        self, state: CheckpointState, models: list[OrganizationNamesByDomain]
+    ) -> CheckpointState:
+        write_atomic(
+            self.models_path, pickle.dumps(models, protocol=pickle.HIGHEST_PROTOCOL)
+        )
+        computed_state = self.save_state(state._replace(segments=0, computed=True))
+        for segment in range(state.segments):
+            self.get_segment_path(segment).unlink(missing_ok=True)
+        logger.info(f"Saved checkpoint of {len(models)} computed models")
+        return computed_state
+
+    def load_models(self) -> list[OrganizationNamesByDomain]:
+        with open(self.models_path, "rb") as models_file:
+            return pickle.load(models_file)
+
+    def clear(self) -> None:
+        """
+        Delete the checkpoint files, with the temporary files of interrupted writes.
+        Other files in the directory are left alone.
+        """
+        if not self.directory.is_dir():
+            return
+        for path in self.directory.iterdir():
+            name = path.name
+            # Временный файл write_atomic: .<имя>.tmp
+            if name.startswith(".") and name.endswith(".tmp"):
+                name = name[1:-4]
+            if name in (STATE_FILE_NAME, MODELS_FILE_NAME) or SEGMENT_NAME.fullmatch(
+                name
+            ):
+                path.unlink(missing_ok=True)
@@ -0,0 +1,87 @@
+from collections import defaultdict
+from typing import Generator, Hashable, Iterable
+
+from src.config.logging import logging
+
+logger = logging.getLogger(__name__)
+
+# Домен (или ключ источник-домен), id карточки и название организации
+DomainNameRow = tuple[Hashable, int, str]
+
+
+class StreamOrderError(Exception):
+    """
+    The card stream assumed to be ordered by id went backwards. Raised while
+    grouping, before any result is published, so the caller can start over
+    with an unordered deduplicator.
+    """
+
+
+class DomainNameDeduplicator:
+    """
+    Keeps only the first row of every (card, domain) pair.
+
+    A card comes back once per url, and several urls of a card often share
+    a domain. In a stream ordered by card id all rows of a card are adjacent,
+    so only the domains of the current card are remembered. For an unordered
+    stream, e.g. parallel range readers, every card id is kept per domain.
+
+    The state lives across calls to iter_unique, so a stream split into
+    batches is de-duplicated as a whole.
+    """
+
+    def __init__(self, ordered: bool = True) -> None:
+        self.ordered = ordered
+        self.current_card_id: int | None = None
+        self.current_domains: set[Hashable] = set()
+        self.organization_ids_by_domains: defaultdict[Hashable, set[int]] = defaultdict(
+            set
+        )
+
+    def iter_unique(
+        self, domain_names: Iterable[DomainNameRow]
+    ) -> Generator[DomainNameRow, None, None]:
+        if self.ordered:
+            yield from self.iter_unique_ordered(domain_names)
+        else:
+            yield from self.iter_unique_unordered(domain_names)
+
+    def iter_unique_ordered(
+        self, domain_names: Iterable[DomainNameRow]
+    ) -> Generator[DomainNameRow, None, None]:
+        current_card_id = self.current_card_id
+        current_domains = self.current_domains
+        try:
+            for domain_name in domain_names:
+                domain, organization_id, _ = domain_name
+                if organization_id != current_card_id:
+                    if (
+                        current_card_id is not None
+                        and organization_id < current_card_id
+                    ):
+                        raise StreamOrderError(
+                            f"Card id {organization_id} after {current_card_id}: "
+                            "the card stream is not ordered by id"
+                        )
+                    current_card_id = organization_id
+                    current_domains = {domain}
+                elif domain in current_domains:
+                    continue
+                else:
+                    current_domains.add(domain)
+                yield domain_name
+        finally:
+            self.current_card_id = current_card_id
+            self.current_domains = current_domains
+
+    def iter_unique_unordered(
+        self, domain_names: Iterable[DomainNameRow]
+    ) -> Generator[DomainNameRow, None, None]:
+        organization_ids_by_domains = self.organization_ids_by_domains
+        for domain_name in domain_names:
+            domain, organization_id, _ = domain_name
+            organization_ids = organization_ids_by_domains[domain]
+            if organization_id in organization_ids:
+                continue
+            organization_ids.add(organization_id)
+            yield domain_name
@@ -0,0 +1,77 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+from typing import Callable
+
+from src.config.settings import settings
+
+WWW_PATTERN = re.compile(r"^www[1-9]?\.?", flags=re.IGNORECASE)
+
+
+class DomainExtractor:
+    """
+    Normalizes links to domains.
+
+    Hosts are resolved against a local Public Suffix List (the snapshot bundled
+    with tldextract or ``PUBLIC_SUFFIX_LIST_PATH``), so the network is never used.
+    tldextract is imported and the list is read on the first link, not on startup.
+    Results are memoized per host in a bounded LRU cache.
+    """
+
+    def __init__(
+        self,
+        cache_size: int | None = None,
+        suffix_list_path: str | None = None,
+    ) -> None:
+        self.suffix_list_path = suffix_list_path or settings.PUBLIC_SUFFIX_LIST_PATH
+        self.tld_extract = None
+        self.lenient_netloc: Callable[[str], str] | None = None
+        self.split_host = lru_cache(maxsize=cache_size or settings.DOMAIN_CACHE_SIZE)(
+            self._split_host
+        )
+
+    def load(self) -> None:
+        from tldextract import TLDExtract
+        from tldextract.remote import lenient_netloc
+
+        suffix_list_urls: tuple[str, ...] = (
+            (Path(self.suffix_list_path).resolve().as_uri(),)
+            if self.suffix_list_path
+            else ()
+        )
+        self.tld_extract = TLDExtract(
+            cache_dir=None,
+            suffix_list_urls=suffix_list_urls,
+            fallback_to_snapshot=True,
+        )
+        self.lenient_netloc = lenient_netloc
+
+    def _split_host(self, host: str) -> tuple[str, str]:
+        """Return the registered domain and the full domain of the host"""
+        if self.tld_extract is None:
+            self.load()
+        extract_host = self.tld_extract.extract_str(host)
+        domain = extract_host.registered_domain.lower()
+        subdomain = extract_host.subdomain.lower()
+        if domain and subdomain:
+            return domain, f"{subdomain}.{domain}"
+        return domain, domain
+
+    def get_domain(self, link: str, social_media_domains: set[str]) -> str | None:
+        if self.lenient_netloc is None:
+            self.load()
+        domain, full_domain = self.split_host(self.lenient_netloc(link))
+        if not domain:
+            return
+        if domain in social_media_domains:
+            return
+        return full_domain
+
+    def clear_domain(self, domain: str) -> str | None:
+        domain_cleaned = WWW_PATTERN.sub("", domain)
+        if not domain_cleaned:
+            return
+        return domain_cleaned
+
+    def cache_info(self):
+        return self.split_host.cache_info()
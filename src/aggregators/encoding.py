@@ -0,0 +1,52 @@
+from array import array
+from typing import Iterable
+
+
+class StringTable:
+    """
+    Interns strings as consecutive integer ids.
+    """
+
+    def __init__(self) -> None:
+        self.ids: dict[str, int] = {}
+        self.strings: list[str] = []
+
+    def __len__(self) -> int:
+        return len(self.strings)
+
+    def encode(self, string: str) -> int:
+        string_id = self.ids.get(string)
+        if string_id is None:
+            string_id = len(self.strings)
+            self.ids[string] = string_id
+            self.strings.append(string)
+        return string_id
+
+    def decode(self, string_id: int) -> str:
+        return self.strings[string_id]
+
+    def decode_all(self, string_ids: Iterable[int]) -> list[str]:
+        strings = self.strings
+        return [strings[string_id] for string_id in string_ids]
+
+
+class EncodedNamesByDomain:
+    """
+    Organization names by domain, stored as ids of a shared string table.
+
+    Each name is kept once in the table, and every domain holds a compact
+    array of unsigned ints instead of a list of strings.
+    """
+
+    def __init__(self) -> None:
+        self.names = StringTable()
+        self.name_ids_by_domains: dict[str, array] = {}
+
+    def __len__(self) -> int:
+        return len(self.name_ids_by_domains)
+
+    def add(self, domain: str, organization_name: str) -> None:
+        name_ids = self.name_ids_by_domains.get(domain)
+        if name_ids is None:
+            name_ids = self.name_ids_by_domains[domain] = array("I")
+        name_ids.append(self.names.encode(organization_name))
@@ -0,0 +1,142 @@
+import mmap
+import struct
+from array import array
+from pathlib import Path
+from typing import Container, Iterable
+
+from src.aggregators.calculator import AggregatorCalculator
+from src.aggregators.domains import DomainExtractor
+from src.config.logging import logging
+from src.config.metrics import write_atomic
+from src.config.repository import RepositoryProtocol
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_MAGIC = b"AGGRDOM1"
+# Метка формата и число доменов, дальше смещения (count + 1) и байты доменов подряд
+SNAPSHOT_HEADER = struct.Struct("<8sQ")
+
+
+def write_domain_snapshot(path: str, domains: Iterable[str]) -> int:
+    """
+    Write the domains as a sorted snapshot file, returns the number of domains.
+
+    Offsets are stored in the native byte order, so a snapshot is read
+    on machines of the same architecture.
+    """
+    encoded_domains: list[bytes] = sorted({domain.encode() for domain in domains})
+    offsets = array("Q", [0])
+    for encoded_domain in encoded_domains:
+        offsets.append(offsets[-1] + len(encoded_domain))
+    snapshot_path = Path(path)
+    snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+    write_atomic(
+        snapshot_path,
+        SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(encoded_domains))
+        + offsets.tobytes()
+        + b"".join(encoded_domains),
+    )
+    return len(encoded_domains)
+
+
+class DomainSnapshot:
+    """
+    Sorted domains memory-mapped from a snapshot file, looked up by binary search.
+
+    Pages of the file are shared through the page cache, so every worker
+    process that opens the same snapshot uses one copy of it.
+    """
+
+    def __init__(self, path: str) -> None:
+        with open(path, "rb") as snapshot_file:
+            self.mmap = mmap.mmap(snapshot_file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.count = SNAPSHOT_HEADER.unpack_from(self.mmap)
+        if magic != SNAPSHOT_MAGIC:
+            self.mmap.close()
+            raise ValueError(f"{path} is not an aggregator domains snapshot")
+        self.data_start = SNAPSHOT_HEADER.size + (self.count + 1) * 8
+        self.offsets = memoryview(self.mmap)[
+            SNAPSHOT_HEADER.size : self.data_start
+        ].cast("Q")
+
+    def __len__(self) -> int:
+        return self.count
+
+    def __contains__(self, domain: object) -> bool:
+        if not isinstance(domain, str):
+            return False
+        key = domain.encode()
+        snapshot = self.mmap
+        offsets = self.offsets
+        data_start = self.data_start
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            value = snapshot[
+                data_start + offsets[middle] : data_start + offsets[middle + 1]
+            ]
+            if value < key:
+                low = middle + 1
+            elif value > key:
+                high = middle
+            else:
+                return True
+        return False
+
+    def close(self) -> None:
+        self.offsets.release()
+        self.mmap.close()
+
+
+class AggregatorDomainIndex:
+    """
+    In-process answer to "is this URL's domain an aggregator?".
+
+    URLs are normalized exactly as cards are during aggregation, through
+    get_domain and clear_domain with their host cache. The aggregator
+    domains are a frozenset loaded once from the result table, or a
+    memory-mapped snapshot file shared by several processes.
+    """
+
+    def __init__(
+        self,
+        aggregator_domains: Container[str],
+        domain_extractor: DomainExtractor | None = None,
+    ) -> None:
+        self.aggregator_domains = aggregator_domains
+        self.calculator = AggregatorCalculator(domain_extractor=domain_extractor)
+        # Соцсети не попадают в таблицу результатов, поэтому не исключаются
+        self.social_media_domains: set[str] = set()
+
+    @classmethod
+    def from_repository(cls, repository: RepositoryProtocol) -> "AggregatorDomainIndex":
+        aggregator_domains = frozenset(repository.get_aggregator_domains())
+        logger.info(f"Loaded {len(aggregator_domains)} aggregator domains")
+        return cls(aggregator_domains)
+
+    @classmethod
+    def from_snapshot(cls, path: str) -> "AggregatorDomainIndex":
+        aggregator_domains = DomainSnapshot(path)
+        logger.info(f"Mapped {len(aggregator_domains)} aggregator domains from {path}")
+        return cls(aggregator_domains)
+
+    def get_url_domain(self, url: str) -> str | None:
+        return self.calculator.get_card_domain(url, self.social_media_domains)
+
+    def is_aggregator(self, url: str) -> bool:
+        domain = self.get_url_domain(url)
+        return domain is not None and domain in self.aggregator_domains
+
+    def lookup(self, urls: Iterable[str]) -> list[bool]:
+        """is_aggregator of every URL, in order"""
+        get_url_domain = self.get_url_domain
+        aggregator_domains = self.aggregator_domains
+        results: list[bool] = []
+        for url in urls:
+            domain = get_url_domain(url)
+            results.append(domain is not None and domain in aggregator_domains)
+        return results
+
+    def close(self) -> None:
+        if isinstance(self.aggregator_domains, DomainSnapshot):
+            self.aggregator_domains.close()
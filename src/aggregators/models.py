@@ -1,18 +1,20 @@
 from typing import NamedTuple
 
 
+# None в массивах — массивы не записываются (OUTPUT_ARRAYS), в признаках слов —
+# малый домен посчитан без разбора названий на слова
 class OrganizationNamesByDomain(NamedTuple):
     domain: str
-    organization_names: list[str]
+    organization_names: list[str] | None
     organization_names_count: int
-    organization_names_unique: list[str]
+    organization_names_unique: list[str] | None
     organization_names_unique_count: int
-    first_word_of_names: list[str]
-    first_word_of_names_count: int
-    first_word_of_names_unique: list[str]
-    first_word_of_names_unique_count: int
+    first_word_of_names: list[str] | None
+    first_word_of_names_count: int | None
+    first_word_of_names_unique: list[str] | None
+    first_word_of_names_unique_count: int | None
     unique_names_ratio: float
-    unique_first_words_ratio: float
-    keywords: list[str]
-    keyword_score: float
+    unique_first_words_ratio: float | None
+    keywords: list[str] | None
+    keyword_score: float | None
     is_aggregator: bool
@@ -0,0 +1,281 @@
+import multiprocessing
+import pickle
+import queue
+import zlib
+from collections import defaultdict, deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from functools import partial
+from itertools import batched
+from multiprocessing.process import BaseProcess
+from typing import Any, Callable, Generator, Iterable
+
+from src.aggregators.calculator import (
+    AggregatorCalculator,
+    AggregatorThresholds,
+    VariantNamesByDomain,
+)
+from src.aggregators.dedup import DomainNameDeduplicator
+from src.aggregators.models import OrganizationNamesByDomain
+from src.config.logging import logging
+from src.config.settings import settings
+from src.organization_cards.models import OrganizationCardRow
+
+logger = logging.getLogger(__name__)
+
+# Пачек названий в очереди одного шарда, пока процесс шарда их не разобрал
+SHARD_QUEUE_SIZE = 4
+# Моделей в одном сообщении процесса шарда
+SHARD_MODELS_BATCH_SIZE = 10000
+# Как часто проверять, живы ли процессы шардов, пока очередь полна или пуста
+SHARD_POLL_SECONDS = 1.0
+
+# Состояние процесса-воркера, задается в init_worker
+worker_calculator: AggregatorCalculator | None = None
+worker_social_media_domains: set[str] = set()
+
+
+def get_shard(domain: str, shards: int) -> int:
+    """Stable across processes, unlike the randomized built-in hash()"""
+    return zlib.crc32(domain.encode()) % shards
+
+
+def apply_settings(settings_values: dict[str, Any]) -> None:
+    """
+    Spawned processes read settings from the environment again, so the values
+    of the parent, including ones set in code, are copied over them.
+    """
+    vars(settings).update(settings_values)
+
+
+def init_worker(
+    settings_values: dict[str, Any], social_media_domains: set[str]
+) -> None:
+    global worker_calculator
+    global worker_social_media_domains
+
+    apply_settings(settings_values)
+    worker_calculator = AggregatorCalculator()
+    worker_social_media_domains = social_media_domains
+
+
+def partition_domain_names(
+    organization_cards: tuple[OrganizationCardRow, ...], shards: int
+) -> list[bytes | None]:
+    """
+    Domain names of the cards split by shard and pickled, so the parent
+    forwards them to the shard processes without unpickling.
+    """
+    partitioned_domain_names: list[list] = [[] for _ in range(shards)]
+    for domain_name in worker_calculator.iter_domain_names(
+        organization_cards, worker_social_media_domains
+    ):
+        partitioned_domain_names[get_shard(domain_name[0], shards)].append(domain_name)
+    return [
+        pickle.dumps(domain_names, protocol=pickle.HIGHEST_PROTOCOL)
+        if domain_names
+        else None
+        for domain_names in partitioned_domain_names
+    ]
+
+
+def run_shard(
+    shard_queue: multiprocessing.Queue,
+    result_queue: multiprocessing.Queue,
+    settings_values: dict[str, Any],
+    top_source_categories: set[str],
+    stop_words: set[str],
+    ordered: bool,
+    thresholds: AggregatorThresholds | None,
+) -> None:
+    """
+    Group the domain names of one shard as they arrive, then send back its models.
+
+    None in the shard queue ends the stream, None in the result queue
+    means the shard is done. An error is sent back instead of the models.
+    """
+    try:
+        apply_settings(settings_values)
+        calculator = AggregatorCalculator(thresholds=thresholds)
+        deduplicator = DomainNameDeduplicator(ordered)
+        organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        while (pickled_domain_names := shard_queue.get()) is not None:
+            for domain, _, organization_name in deduplicator.iter_unique(
+                pickle.loads(pickled_domain_names)
+            ):
+                organization_names_by_domains[domain].append(organization_name)
+
+        for models in batched(
+            calculator.iter_models(
+                organization_names_by_domains.items(),
+                top_source_categories,
+                stop_words,
+            ),
+            SHARD_MODELS_BATCH_SIZE,
+        ):
+            result_queue.put(list(models))
+        result_queue.put(None)
+    except Exception as error:
+        result_queue.put(error)
+
+
+def bounded_map(
+    executor: Executor,
+    fn: Callable[[Any], Any],
+    iterable: Iterable[Any],
+    max_pending: int,
+) -> Generator[Any, None, None]:
+    """
+    Like Executor.map, but keeps at most max_pending tasks in flight
+    instead of consuming the whole iterable up front.
+    """
+    pending: deque[Future] = deque()
+    for item in iterable:
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+class ShardedAggregation:
+    """
+    Aggregation spread over a process pool and one process per shard.
+
+    Cards are resolved to domains in batches by the pool workers and
+    hash-partitioned by domain, so every domain lands in exactly one shard.
+    Partitioned batches are forwarded in stream order to the shard processes
+    through bounded queues, so a shard keeps the card order of the stream and
+    groups its names while the cards are still being read. Neither the parent
+    nor the queues hold more than a few batches at a time. When the stream ends,
+    every shard turns its domains into models and sends them back in batches.
+    """
+
+    def __init__(
+        self,
+        workers: int | None = None,
+        batch_size: int | None = None,
+        ordered: bool = True,
+        thresholds: AggregatorThresholds | None = None,
+    ) -> None:
+        self.workers = workers or settings.AGGREGATION_WORKERS
+        self.batch_size = batch_size or settings.AGGREGATION_BATCH_SIZE
+        self.ordered = ordered
+        self.thresholds = thresholds
+
+    def run(
+        self,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> Generator[OrganizationNamesByDomain, None, None]:
+        logger.info(f"Aggregating with {self.workers} workers and shards")
+        # Процессы не наследуют потоки и соединения родителя через fork
+        context = multiprocessing.get_context("spawn")
+        settings_values = vars(settings).copy()
+        result_queue = context.Queue()
+        shard_queues = [
+            context.Queue(maxsize=SHARD_QUEUE_SIZE) for _ in range(self.workers)
+        ]
+        shard_processes = [
+            context.Process(
+                target=run_shard,
+                args=(
+                    shard_queue,
+                    result_queue,
+                    settings_values,
+                    top_source_categories,
+                    stop_words,
+                    self.ordered,
+                    self.thresholds,
+                ),
+                daemon=True,
+            )
+            for shard_queue in shard_queues
+        ]
+        for shard_process in shard_processes:
+            shard_process.start()
+
+        try:
+            with ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=context,
+                initializer=init_worker,
+                initargs=(settings_values, social_media_domains),
+            ) as executor:
+                for partitioned_domain_names in bounded_map(
+                    executor,
+                    partial(partition_domain_names, shards=self.workers),
+                    batched(organization_cards, self.batch_size),
+                    max_pending=self.workers * 2,
+                ):
+                    for shard_queue, pickled_domain_names in zip(
+                        shard_queues, partitioned_domain_names
+                    ):
+                        if pickled_domain_names is not None:
+                            self.put(
+                                shard_queue,
+                                pickled_domain_names,
+                                shard_processes,
+                                result_queue,
+                            )
+            for shard_queue in shard_queues:
+                self.put(shard_queue, None, shard_processes, result_queue)
+            yield from self.iter_results(shard_processes, result_queue)
+        finally:
+            for shard_process in shard_processes:
+                if shard_process.is_alive():
+                    shard_process.terminate()
+                shard_process.join()
+
+    def put(
+        self,
+        shard_queue: multiprocessing.Queue,
+        item: bytes | None,
+        shard_processes: list[BaseProcess],
+        result_queue: multiprocessing.Queue,
+    ) -> None:
+        while True:
+            try:
+                shard_queue.put(item, timeout=SHARD_POLL_SECONDS)
+                return
+            except queue.Full:
+                # Процесс шарда завершается до конца потока только с ошибкой
+                if not all(
+                    shard_process.is_alive() for shard_process in shard_processes
+                ):
+                    self.raise_shard_error(result_queue)
+
+    def iter_results(
+        self,
+        shard_processes: list[BaseProcess],
+        result_queue: multiprocessing.Queue,
+    ) -> Generator[OrganizationNamesByDomain, None, None]:
+        running_shards = len(shard_processes)
+        while running_shards:
+            try:
+                models = result_queue.get(timeout=SHARD_POLL_SECONDS)
+            except queue.Empty:
+                if any(
+                    shard_process.exitcode not in (None, 0)
+                    for shard_process in shard_processes
+                ):
+                    self.raise_shard_error(result_queue)
+                continue
+            if models is None:
+                running_shards -= 1
+            elif isinstance(models, BaseException):
+                raise models
+            else:
+                yield from models
+
+    def raise_shard_error(self, result_queue: multiprocessing.Queue) -> None:
+        while True:
+            try:
+                message = result_queue.get(timeout=SHARD_POLL_SECONDS)
+            except queue.Empty:
+                raise RuntimeError(
+                    "A shard process exited before the end of the stream"
+                )
+            if isinstance(message, BaseException):
+                raise message
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+from itertools import batched
+from typing import Any, AsyncGenerator, Generator
+
+from src.aggregators.calculator import AggregatorCalculator, VariantNamesByDomain
+from src.aggregators.models import OrganizationNamesByDomain
+from src.config.logging import logging
+from src.config.repository import RepositoryProtocol
+from src.config.settings import settings
+from src.organization_cards.models import OrganizationCardRow
+
+logger = logging.getLogger(__name__)
+
+# Маркер конца очереди между этапами
+STAGE_END = object()
+
+
+class AsyncAggregationPipeline:
+    """
+    Fetch, compute and write stages connected by bounded queues.
+
+    The fetch stage reads card batches from a server-side cursor on its own
+    async connection. The compute stage runs the aggregator logic in a worker
+    thread: it groups the batches while the next ones are fetched, then builds
+    models in batches while the write stage copies the previous batches into the
+    staging table on another async connection. An error in any stage aborts the
+    write transaction, so the result table is never half written.
+    """
+
+    def __init__(
+        self,
+        calculator: AggregatorCalculator,
+        repository: RepositoryProtocol,
+        queue_size: int | None = None,
+        batch_size: int | None = None,
+    ) -> None:
+        self.calculator = calculator
+        self.repository = repository
+        self.queue_size = queue_size or settings.PIPELINE_QUEUE_SIZE
+        self.batch_size = batch_size or settings.PIPELINE_BATCH_SIZE
+        self.stopped = threading.Event()
+
+    async def run(
+        self,
+        until_card_id: int,
+        social_media_domains: set[str],
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> None:
+        loop = asyncio.get_running_loop()
+        card_batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+        model_batches: asyncio.Queue = asyncio.Queue(maxsize=self.queue_size)
+
+        fetch_task = asyncio.create_task(self.fetch(card_batches, until_card_id))
+        compute_task = asyncio.create_task(
+            asyncio.to_thread(
+                self.compute,
+                loop,
+                card_batches,
+                model_batches,
+                social_media_domains,
+                top_source_categories,
+                stop_words,
+            )
+        )
+        try:
+            await self.repository.insert_aggregate_domain_batches(
+                self.iter_model_batches(model_batches),
+                self.calculator.get_watermark(until_card_id),
+            )
+        except BaseException:
+            await self.abort(fetch_task, compute_task, card_batches, model_batches)
+            raise
+        await asyncio.gather(fetch_task, compute_task)
+
+    async def fetch(self, card_batches: asyncio.Queue, until_card_id: int) -> None:
+        try:
+            async for (
+                organization_cards
+            ) in self.repository.stream_organization_card_batches(
+                until_card_id=until_card_id
+            ):
+                await card_batches.put(organization_cards)
+        except Exception as error:
+            await card_batches.put(error)
+            raise
+        await card_batches.put(STAGE_END)
+
+    def compute(
+        self,
+        loop: asyncio.AbstractEventLoop,
+        card_batches: asyncio.Queue,
+        model_batches: asyncio.Queue,
+        social_media_domains: set[str],
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> None:
+        try:
+            organization_names_by_domains: VariantNamesByDomain = (
+                self.calculator.group_domain_names(
+                    self.calculator.iter_domain_names(
+                        self.iter_organization_cards(loop, card_batches),
+                        social_media_domains,
+                    )
+                )
+            )
+            models = self.calculator.iter_models(
+                organization_names_by_domains.items(), top_source_categories, stop_words
+            )
+            for models_batch in batched(models, self.batch_size):
+                if self.stopped.is_set():
+                    return
+                self.put(loop, model_batches, list(models_batch))
+        except BaseException as error:
+            self.put(loop, model_batches, error)
+            raise
+        self.put(loop, model_batches, STAGE_END)
+
+    def iter_organization_cards(
+        self, loop: asyncio.AbstractEventLoop, card_batches: asyncio.Queue
+    ) -> Generator[OrganizationCardRow, None, None]:
+        while not self.stopped.is_set():
+            organization_cards = asyncio.run_coroutine_threadsafe(
+                card_batches.get(), loop
+            ).result()
+            if organization_cards is STAGE_END:
+                return
+            if isinstance(organization_cards, BaseException):
+                raise organization_cards
+            yield from organization_cards
+
+    async def iter_model_batches(
+        self, model_batches: asyncio.Queue
+    ) -> AsyncGenerator[list[OrganizationNamesByDomain], None]:
+        while True:
+            models = await model_batches.get()
+            if models is STAGE_END:
+                return
+            if isinstance(models, BaseException):
+                raise models
+            yield models
+
+    def put(
+        self, loop: asyncio.AbstractEventLoop, queue: asyncio.Queue, item: Any
+    ) -> None:
+        """Put into an asyncio queue from the compute thread, waiting while it is full"""
+        asyncio.run_coroutine_threadsafe(queue.put(item), loop).result()
+
+    async def abort(
+        self,
+        fetch_task: asyncio.Task,
+        compute_task: asyncio.Task,
+        card_batches: asyncio.Queue,
+        model_batches: asyncio.Queue,
+    ) -> None:
+        """Stop the other stages and unblock the compute thread"""
+        self.stopped.set()
+        fetch_task.cancel()
+        while not compute_task.done():
+            for queue in (card_batches, model_batches):
+                while not queue.empty():
+                    queue.get_nowait()
+            card_batches.put_nowait(STAGE_END)
+            await asyncio.sleep(0.01)
+        await asyncio.gather(fetch_task, compute_task, return_exceptions=True)
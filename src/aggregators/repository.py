@@ -1,11 +1,25 @@
-from typing import Generator, NamedTuple
+from contextlib import AbstractContextManager
+from typing import (
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Generator,
+    Iterable,
+    NamedTuple,
+)
 
-from src.config.database import DatabaseConnection, db
+from src.config.database import DatabaseConnection
 from src.config.repository import RepositoryProtocol
+from src.config.settings import settings
 from src.meta.models import SocialMedia
 from src.meta.repository import MetaRepository
-from src.organization_cards.models import OrganizationCard
+from src.organization_cards.models import (
+    OrganizationCard,
+    OrganizationCardRow,
+    SourceOrganizationCard,
+)
 from src.organization_cards.repository import OrganizationCardRepository
+from src.organization_cards.snapshots import TopSourceCategoriesCache
 
 
 class AggregatorRepository(RepositoryProtocol):
@@ -13,27 +27,107 @@ class AggregatorRepository(RepositoryProtocol):
     Repository for the aggregator service.
     """
 
-    def __init__(self, db: DatabaseConnection) -> None:
+    def __init__(self, db: DatabaseConnection, source_id: int | None = None) -> None:
+        if source_id is None:
+            source_id = settings.SOURCE_ID
         self.db = db
-        self.organization_card_repository = OrganizationCardRepository(db=self.db)
+        self.source_id = source_id
+        self.organization_card_repository = OrganizationCardRepository(
+            db=self.db, source_id=source_id
+        )
         self.meta_repository = MetaRepository(db=self.db)
 
-    def stream_organization_cards(self) -> Generator[OrganizationCard, None, None]:
-        return self.organization_card_repository.stream_organization_cards()
+    def for_source(self, source_id: int) -> "AggregatorRepository":
+        """Repository writing to the result table of another source"""
+        return AggregatorRepository(self.db, source_id=source_id)
+
+    def stream_source_organization_cards(
+        self,
+        source_ids: list[int],
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+    ) -> Generator[SourceOrganizationCard, None, None]:
+        return self.organization_card_repository.stream_source_organization_cards(
+            source_ids, after_card_id=after_card_id, until_card_id=until_card_id
+        )
+
+    def get_max_source_organization_card_id(self, source_ids: list[int]) -> int | None:
+        return self.organization_card_repository.get_max_source_organization_card_id(
+            source_ids
+        )
+
+    def stream_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        readers: int = 1,
+    ) -> Generator[OrganizationCardRow, None, None]:
+        return self.organization_card_repository.stream_organization_cards(
+            after_card_id=after_card_id, until_card_id=until_card_id, readers=readers
+        )
+
+    def stream_organization_card_batches(
+        self, after_card_id: int = 0, until_card_id: int | None = None
+    ) -> AsyncGenerator[list[OrganizationCard], None]:
+        return self.organization_card_repository.stream_organization_card_batches(
+            after_card_id=after_card_id, until_card_id=until_card_id
+        )
+
+    def get_max_organization_card_id(self) -> int | None:
+        return self.organization_card_repository.get_max_organization_card_id()
 
     def get_social_medias(self) -> list[SocialMedia]:
         return self.meta_repository.get_social_medias()
 
     def get_top_source_categories(self) -> list[str]:
-        return self.organization_card_repository.get_top_source_categories()
+        if not settings.TOP_CATEGORIES_CACHE_PATH:
+            return self.organization_card_repository.get_top_source_categories()
+        return TopSourceCategoriesCache().get(
+            self.organization_card_repository.get_top_source_categories,
+            refresh=settings.TOP_CATEGORIES_REFRESH,
+        )
 
     def get_stop_words(self) -> list[str]:
         return self.meta_repository.get_stop_words()
 
-    def insert_aggregate_domains(self, aggregate_domains: list[NamedTuple]):
+    def insert_aggregate_domains(self, aggregate_domains: Iterable[NamedTuple]):
         return self.organization_card_repository.insert_aggregate_domains(
             aggregate_domains
         )
 
+    def write_aggregate_domains(
+        self, last_card_id: int | None
+    ) -> AbstractContextManager[Callable[[Iterable[NamedTuple]], None]]:
+        return self.organization_card_repository.write_aggregate_domains(last_card_id)
+
+    def write_aggregate_domains_delta(
+        self, last_card_id: int | None
+    ) -> AbstractContextManager[Callable[[Iterable[NamedTuple]], None]]:
+        return self.organization_card_repository.write_aggregate_domains_delta(
+            last_card_id
+        )
+
+    async def insert_aggregate_domain_batches(
+        self,
+        aggregate_domain_batches: AsyncIterable[list[NamedTuple]],
+        last_card_id: int | None,
+    ) -> None:
+        return await self.organization_card_repository.insert_aggregate_domain_batches(
+            aggregate_domain_batches, last_card_id
+        )
+
+    def get_aggregator_domains(self) -> list[str]:
+        return self.organization_card_repository.get_aggregator_domains()
+
+    def get_aggregate_domain_names(self, domains: list[str]) -> dict[str, list[str]]:
+        return self.organization_card_repository.get_aggregate_domain_names(domains)
+
+    def upsert_aggregate_domains(
+        self, aggregate_domains: list[NamedTuple], last_card_id: int
+    ) -> None:
+        return self.organization_card_repository.upsert_aggregate_domains(
+            aggregate_domains, last_card_id
+        )
 
-aggregator_repository = AggregatorRepository(db=db)
+    def get_aggregate_domains_watermark(self) -> int | None:
+        return self.organization_card_repository.get_aggregate_domains_watermark()
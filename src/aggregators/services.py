@@ -1,243 +1,712 @@
-import re
-from collections import Counter, defaultdict
-from typing import DefaultDict
-
-from tldextract import extract
-
+from collections import defaultdict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor
+from typing import Generator, Iterable, TypeVar
+
+from src.aggregators.approximate import ApproximateGrouper
+from src.aggregators.calculator import (
+    AggregatorCalculator,
+    AggregatorThresholds,
+    VariantNamesByDomain,
+)
+from src.aggregators.checkpoint import Checkpoint, CheckpointState
+from src.aggregators.dedup import DomainNameDeduplicator, StreamOrderError
+from src.aggregators.domains import DomainExtractor
 from src.aggregators.models import OrganizationNamesByDomain
-from src.aggregators.repository import aggregator_repository
+from src.aggregators.parallel import ShardedAggregation
+from src.aggregators.sinks import get_sinks, write_to_sinks
+from src.aggregators.spill import SpillingGrouper
+from src.aggregators.vectorized import VectorizedFeatures
+from src.config.database import DatabaseConnection
 from src.config.logging import logging
+from src.config.metrics import metrics
 from src.config.repository import RepositoryProtocol
+from src.config.settings import settings
 from src.meta.models import SocialMedia
+from src.organization_cards.models import OrganizationCardRow, SourceOrganizationCard
 
 logger = logging.getLogger(__name__)
 
-VariantNamesByDomain = DefaultDict[str, list[str]]
-OrganizationIdsByDomains = DefaultDict[str, set[int]]
+T = TypeVar("T")
 
+STREAM_END = object()
 
-class CalculateRatio:
-    def get_keywords(self, word_counts: Counter, names_count: int) -> list[str]:
-        keywords: list[str] = [
-            word for word, count in word_counts.items() if count / names_count >= 0.3
-        ]
-        return keywords
 
-    def get_keyword_score(self, word_counts: Counter, names_count: int) -> float:
-        keyword_score: float = (
-            max(word_counts.values()) / names_count if word_counts else 0.0
-        )
-        return keyword_score
+def start_streaming(
+    executor: Executor, iterable: Iterable[T]
+) -> Generator[T, None, None]:
+    """
+    Start iterating in the background, so the first query already runs
+    while the caller is busy with something else.
+    """
+    iterator = iter(iterable)
+    first_item = executor.submit(next, iterator, STREAM_END)
 
-    def calculate_unique_ratio(
-        self, unique_names_count: int, names_count: int
-    ) -> float:
-        unique_names_ratio: float = (
-            unique_names_count / names_count if names_count > 0 else 0.0
-        )
-        return unique_names_ratio
+    def resume() -> Generator[T, None, None]:
+        item = first_item.result()
+        if item is STREAM_END:
+            return
+        yield item
+        yield from iterator
+
+    return resume()
+
+
+def batched_by_card(
+    organization_cards: Iterable[OrganizationCardRow], size: int
+) -> Generator[list[OrganizationCardRow], None, None]:
+    """
+    Like itertools.batched, but a batch of at least size rows ends only
+    where the card id changes, so the rows of a card are never split.
+    """
+    organization_cards_batch: list[OrganizationCardRow] = []
+    for organization_card in organization_cards:
+        if (
+            len(organization_cards_batch) >= size
+            and organization_card[0] != organization_cards_batch[-1][0]
+        ):
+            yield organization_cards_batch
+            organization_cards_batch = []
+        organization_cards_batch.append(organization_card)
+    if organization_cards_batch:
+        yield organization_cards_batch
+
+
+class AggregatorService(AggregatorCalculator):
+    def __init__(
+        self,
+        repository: RepositoryProtocol,
+        domain_extractor: DomainExtractor | None = None,
+        thresholds: AggregatorThresholds | None = None,
+    ):
+        super().__init__(domain_extractor=domain_extractor, thresholds=thresholds)
+        self.repository = repository
 
+    def grouping_organization_names_by_domain(
+        self,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+    ) -> VariantNamesByDomain:
+        with metrics.stage("grouping_organization_names_by_domain") as stage:
+            organization_names_by_domains: VariantNamesByDomain = (
+                self.group_domain_names(
+                    self.iter_domain_names(organization_cards, social_media_domains)
+                )
+            )
+            stage.rows_out = len(organization_names_by_domains)
+        self.log_domain_cache()
+        return organization_names_by_domains
 
-class AggregatorService(CalculateRatio):
-    def __init__(self, repository: RepositoryProtocol):
-        self.repository = repository
+    def log_domain_cache(self) -> None:
+        cache_info = self.domain_extractor.cache_info()
+        lookups = cache_info.hits + cache_info.misses
+        metrics.set("domain_cache_hits", cache_info.hits)
+        metrics.set("domain_cache_misses", cache_info.misses)
+        metrics.set(
+            "domain_cache_hit_rate", cache_info.hits / lookups if lookups else 0.0
+        )
+        logger.info(
+            f"Domain cache: {cache_info.hits} hits, {cache_info.misses} misses, "
+            f"{cache_info.currsize} hosts"
+        )
 
-    def clear_variant_names(
-        self, variant_names: list[str], top_source_categories: set[str]
-    ) -> list[str]:
-        cleaned_variant_names: list[str] = []
-        for variant_name in variant_names:
-            if not variant_name:
-                continue
-            if variant_name in top_source_categories:
-                continue
-            cleaned_variant_names.append(variant_name)
-        return cleaned_variant_names
-
-    def get_words_out_names(
+    def compute_aggregate_domains(
         self,
-        cleaned_variant_names: list[str],
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
         top_source_categories: set[str],
         stop_words: set[str],
-    ):
-        pattern = re.compile(r"[^\w']+")
-        first_word_of_names: list[str] = []
-        words: list[str] = []
+    ) -> Iterable[OrganizationNamesByDomain]:
+        if settings.AGGREGATION_WORKERS > 1:
+            if (
+                settings.SPILL_MEMORY_BUDGET_MB > 0
+                or settings.APPROXIMATE_MIN_NAMES > 0
+                or settings.AGGREGATION_ENGINE != "python"
+            ):
+                # Процессы шардов группируют названия списками и считают их движком python
+                raise ValueError(
+                    "AGGREGATION_WORKERS > 1 works only with AGGREGATION_ENGINE=python, "
+                    "SPILL_MEMORY_BUDGET_MB=0 and APPROXIMATE_MIN_NAMES=0"
+                )
+            sharded_aggregation = ShardedAggregation(
+                ordered=self.ordered_stream, thresholds=self.thresholds
+            )
+            return sharded_aggregation.run(
+                organization_cards,
+                social_media_domains,
+                top_source_categories,
+                stop_words,
+            )
 
-        for variant_name in cleaned_variant_names:
-            if not variant_name:
-                continue
+        if settings.SPILL_MEMORY_BUDGET_MB > 0 and (
+            settings.APPROXIMATE_MIN_NAMES > 0
+            or settings.AGGREGATION_ENGINE != "python"
+        ):
+            # Партиции на диске хранят списки названий для движка python
+            raise ValueError(
+                "SPILL_MEMORY_BUDGET_MB > 0 works only with AGGREGATION_ENGINE=python "
+                "and APPROXIMATE_MIN_NAMES=0"
+            )
+        if (
+            settings.APPROXIMATE_MIN_NAMES > 0
+            and settings.AGGREGATION_ENGINE != "python"
+        ):
+            raise ValueError(
+                "APPROXIMATE_MIN_NAMES > 0 works only with AGGREGATION_ENGINE=python"
+            )
 
-            if variant_name in top_source_categories:
-                continue
+        if settings.SPILL_MEMORY_BUDGET_MB > 0:
+            spilling_grouper = SpillingGrouper(ordered=self.ordered_stream)
+            with metrics.stage("grouping_organization_names_by_domain"):
+                spilling_grouper.group(
+                    self.iter_domain_names(organization_cards, social_media_domains)
+                )
+            metrics.set("spills", spilling_grouper.spills)
+            self.log_domain_cache()
+            return self.iter_models(
+                spilling_grouper.iter_groups(),
+                top_source_categories,
+                stop_words,
+            )
 
-            variant_words: list[str] = variant_name.split()
-            for index, variant_word in enumerate(variant_words):
-                if not variant_word:
-                    continue
+        if settings.APPROXIMATE_MIN_NAMES > 0:
+            approximate_grouper = ApproximateGrouper(
+                self, top_source_categories, stop_words
+            )
+            with metrics.stage("grouping_organization_names_by_domain") as stage:
+                approximate_grouper.group(
+                    self.iter_domain_names(organization_cards, social_media_domains)
+                )
+                stage.rows_out = len(approximate_grouper)
+            self.log_domain_cache()
+            return approximate_grouper.iter_models()
+
+        if settings.AGGREGATION_ENGINE in ("encoded", "numpy"):
+            with metrics.stage("grouping_organization_names_by_domain") as stage:
+                encoded_names_by_domains = self.group_encoded_domain_names(
+                    self.iter_domain_names(organization_cards, social_media_domains)
+                )
+                stage.rows_out = len(encoded_names_by_domains)
+            self.log_domain_cache()
+            logger.info(
+                f"Encoded {len(encoded_names_by_domains)} domains with "
+                f"{len(encoded_names_by_domains.names)} distinct organization names"
+            )
+            if settings.AGGREGATION_ENGINE == "numpy":
+                return VectorizedFeatures(self).iter_models(
+                    encoded_names_by_domains, top_source_categories, stop_words
+                )
+            return self.iter_encoded_models(
+                encoded_names_by_domains, top_source_categories, stop_words
+            )
 
-                cleaned_word = pattern.sub("", variant_word)
-                if not cleaned_word:
-                    continue
+        organization_names_by_domains: VariantNamesByDomain = (
+            self.grouping_organization_names_by_domain(
+                organization_cards, social_media_domains
+            )
+        )
+        # Модели пишутся в приемники пакетами по мере расчета
+        return self.iter_models(
+            organization_names_by_domains.items(), top_source_categories, stop_words
+        )
 
-                if cleaned_word in stop_words:
-                    continue
+    def update_aggregate_domains(
+        self,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+        top_source_categories: set[str],
+        stop_words: set[str],
+        until_card_id: int,
+    ) -> None:
+        """
+        Recompute only the domains touched by cards added after the watermark.
+
+        Stored organization names of a domain come from cards below the watermark,
+        so they are merged with the new names without further de-duplication.
+        """
+        organization_names_by_domains: VariantNamesByDomain = (
+            self.grouping_organization_names_by_domain(
+                organization_cards, social_media_domains
+            )
+        )
+        if organization_names_by_domains:
+            stored_names_by_domains: dict[str, list[str]] = (
+                self.repository.get_aggregate_domain_names(
+                    list(organization_names_by_domains)
+                )
+            )
+            for domain, variant_names in organization_names_by_domains.items():
+                variant_names[:0] = stored_names_by_domains.get(domain) or []
 
-                words.append(cleaned_word)
+        models: list[OrganizationNamesByDomain] = self.adding_in_models(
+            organization_names_by_domains, top_source_categories, stop_words
+        )
+        self.repository.upsert_aggregate_domains(models, until_card_id)
 
-                if index == 0:
-                    first_word_of_names.append(cleaned_word)
+    def grouping_with_checkpoint(
+        self,
+        checkpoint: Checkpoint,
+        checkpoint_state: CheckpointState,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+    ) -> tuple[VariantNamesByDomain, CheckpointState]:
+        """
+        Group names restored from the checkpoint segments, then the remaining cards,
+        saving a segment after every CHECKPOINT_INTERVAL cards.
+
+        Cards come ordered by id and start after the checkpoint, and a segment ends
+        only between two cards, so every card is entirely in one segment and resuming
+        after the last saved card id loses no rows. One deduplicator covers all
+        batches of this run.
+        """
+        with metrics.stage("grouping_organization_names_by_domain") as stage:
+            organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+            for segment in checkpoint.iter_segments(checkpoint_state):
+                for domain, variant_names in segment.items():
+                    organization_names_by_domains[domain].extend(variant_names)
+
+            deduplicator = DomainNameDeduplicator()
+            for organization_cards_batch in batched_by_card(
+                organization_cards, settings.CHECKPOINT_INTERVAL
+            ):
+                batch_names_by_domains: VariantNamesByDomain = self.group_domain_names(
+                    self.iter_domain_names(
+                        organization_cards_batch, social_media_domains
+                    ),
+                    deduplicator,
+                )
+                for domain, variant_names in batch_names_by_domains.items():
+                    organization_names_by_domains[domain].extend(variant_names)
+                checkpoint_state = checkpoint.save_segment(
+                    checkpoint_state,
+                    batch_names_by_domains,
+                    organization_cards_batch[-1][0],
+                )
+            stage.rows_out = len(organization_names_by_domains)
+        self.log_domain_cache()
+        return organization_names_by_domains, checkpoint_state
+
+    def run_with_checkpoint(
+        self,
+        checkpoint: Checkpoint,
+        checkpoint_state: CheckpointState,
+        organization_cards: Iterable[OrganizationCardRow],
+        social_media_domains: set[str],
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> None:
+        if checkpoint_state.computed:
+            models: list[OrganizationNamesByDomain] = checkpoint.load_models()
+        else:
+            organization_names_by_domains, checkpoint_state = (
+                self.grouping_with_checkpoint(
+                    checkpoint,
+                    checkpoint_state,
+                    organization_cards,
+                    social_media_domains,
+                )
+            )
+            models = self.adding_in_models(
+                organization_names_by_domains, top_source_categories, stop_words
+            )
+            del organization_names_by_domains
+            checkpoint_state = checkpoint.save_models(checkpoint_state, models)
 
-        return first_word_of_names, words
+        self.write_aggregate_domains(models, checkpoint_state.until_card_id)
+        checkpoint.clear()
 
-    def is_aggregator(
+    def write_aggregate_domains(
         self,
-        cleaned_variant_names_count: int,
-        unique_names_ratio: float,
-        unique_first_words_ratio: float,
-        keyword_score: float,
-    ) -> bool:
+        models: Iterable[OrganizationNamesByDomain],
+        until_card_id: int,
+        repository: RepositoryProtocol | None = None,
+    ) -> None:
+        write_to_sinks(
+            get_sinks(repository or self.repository, self.get_watermark(until_card_id)),
+            models,
+        )
+
+    def get_aggregate_domains(self, resume: bool = False):
+        with metrics.stage("get_aggregate_domains"):
+            if len(settings.SOURCE_IDS) > 1:
+                self.check_multi_source_settings(resume)
+                try:
+                    self.run_multi_source_aggregate_domains(settings.SOURCE_IDS)
+                except StreamOrderError as error:
+                    self.log_stream_order_error(error)
+                    self.run_multi_source_aggregate_domains(
+                        settings.SOURCE_IDS, ordered=False
+                    )
+            else:
+                try:
+                    self.run_aggregate_domains(resume=resume)
+                except StreamOrderError as error:
+                    self.log_stream_order_error(error)
+                    if settings.CHECKPOINT_DIR:
+                        # Сегменты собраны в предположении порядка по id
+                        Checkpoint().clear()
+                    self.run_aggregate_domains(ordered=False)
+        self.report_tokenizer()
+
+    def log_stream_order_error(self, error: StreamOrderError) -> None:
+        """
+        The ordered stream went backwards. Names are grouped before any sink
+        is published, so the run is repeated from the start without a checkpoint
+        and de-duplicated by card id sets, which does not depend on the order.
+        """
+        metrics.set("stream_order_fallbacks", 1)
+        logger.warning(
+            f"{error}, aggregating again with de-duplication by card id sets"
+        )
+
+    def submit_reference_data(self, executor: Executor) -> list[Future]:
+        # Справочники загружаются параллельно на разных соединениях из пула
+        return [
+            executor.submit(self.repository.get_social_medias),
+            executor.submit(self.repository.get_top_source_categories),
+            executor.submit(self.repository.get_stop_words),
+        ]
+
+    def get_reference_data(
+        self, reference_data_futures: list[Future]
+    ) -> tuple[set[str], set[str], set[str]]:
+        """Social media domains, top source categories and stop words"""
+        social_medias_future, top_source_categories_future, stop_words_future = (
+            reference_data_futures
+        )
+        social_medias: list[SocialMedia] = social_medias_future.result()
+        social_media_domains: set[str] = {
+            social_media.primary_domain
+            for social_media in social_medias
+            if social_media.primary_domain
+        }
         return (
-            (cleaned_variant_names_count > 10)
-            and (unique_names_ratio > 0.7)
-            and ((unique_first_words_ratio > 0.4) or (keyword_score < 0.3))
+            social_media_domains,
+            set(top_source_categories_future.result()),
+            set(stop_words_future.result()),
         )
 
-    def adding_in_models(
+    def grouping_organization_names_by_source_domain(
         self,
-        organization_names_by_domains: VariantNamesByDomain,
-        top_source_categories: set[str],
-        stop_words: set[str],
-    ) -> list[OrganizationNamesByDomain]:
-        models: list[OrganizationNamesByDomain] = []
-
-        for domain, variant_names in organization_names_by_domains.items():
-            cleaned_variant_names: list[str] = self.clear_variant_names(
-                variant_names, top_source_categories
+        source_organization_cards: Iterable[SourceOrganizationCard],
+        social_media_domains: set[str],
+    ) -> dict[int, VariantNamesByDomain]:
+        with metrics.stage("grouping_organization_names_by_domain") as stage:
+            organization_names_by_source_domains = self.group_domain_names(
+                self.iter_source_domain_names(
+                    source_organization_cards, social_media_domains
+                )
             )
-            if not cleaned_variant_names:
-                continue
-
-            first_word_of_names, words = self.get_words_out_names(
-                cleaned_variant_names, top_source_categories, stop_words
+            organization_names_by_sources: dict[int, VariantNamesByDomain] = (
+                defaultdict(lambda: defaultdict(list))
+            )
+            for (
+                source_id,
+                domain,
+            ), variant_names in organization_names_by_source_domains.items():
+                organization_names_by_sources[source_id][domain] = variant_names
+            stage.rows_out = len(organization_names_by_source_domains)
+        self.log_domain_cache()
+        return organization_names_by_sources
+
+    def check_multi_source_settings(self, resume: bool = False) -> None:
+        """
+        The single scan of several sources is a serial full rebuild,
+        so settings of the other modes are rejected instead of being ignored.
+        """
+        unsupported_settings: list[str] = [
+            name
+            for name, is_set in (
+                ("--resume", resume),
+                ("CHECKPOINT_DIR", bool(settings.CHECKPOINT_DIR)),
+                ("INCREMENTAL", settings.INCREMENTAL),
+                ("ASYNC_PIPELINE", settings.ASYNC_PIPELINE),
+                ("AGGREGATION_ENGINE", settings.AGGREGATION_ENGINE != "python"),
+                ("AGGREGATION_WORKERS", settings.AGGREGATION_WORKERS > 1),
+                ("CARD_READERS", settings.CARD_READERS > 1),
+                ("SPILL_MEMORY_BUDGET_MB", settings.SPILL_MEMORY_BUDGET_MB > 0),
+                ("APPROXIMATE_MIN_NAMES", settings.APPROXIMATE_MIN_NAMES > 0),
+            )
+            if is_set
+        ]
+        if unsupported_settings:
+            raise ValueError(
+                f"Several SOURCE_IDS are aggregated by a serial full rebuild, "
+                f"unset {', '.join(unsupported_settings)}"
             )
 
-            # 1. Количество названий организаций после фильтрации по топ-категориям
-            cleaned_variant_names_count: int = len(cleaned_variant_names)
-            # 2. Количество уникальных названий организаций после фильтрации по топ-категориям
-            cleaned_variant_names_unique_count: int = len(
-                list(set(cleaned_variant_names))
+    def run_multi_source_aggregate_domains(
+        self, source_ids: list[int], ordered: bool = True
+    ) -> None:
+        """
+        Aggregate several sources in a single scan of the cards.
+
+        Names are grouped by (source, domain), and every source
+        is written to its own result table.
+        """
+        self.ordered_stream = ordered
+        logger.info(f"Aggregating sources {source_ids} in a single scan")
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            reference_data_futures = self.submit_reference_data(executor)
+
+            until_card_id: int | None = (
+                self.repository.get_max_source_organization_card_id(source_ids)
+            )
+            if until_card_id is None:
+                logger.info("No organization cards found")
+                return
+
+            source_organization_cards = start_streaming(
+                executor,
+                self.repository.stream_source_organization_cards(
+                    source_ids, until_card_id=until_card_id
+                ),
+            )
+            social_media_domains, top_source_categories, stop_words = (
+                self.get_reference_data(reference_data_futures)
             )
 
-            # 3. Количество первых слов в названиях организаций
-            first_word_of_names_count: int = len(first_word_of_names)
-            # 4. Количество уникальных первых слов в названиях организаций
-            first_word_of_names_unique_count: int = len(list(set(first_word_of_names)))
+        organization_names_by_sources = (
+            self.grouping_organization_names_by_source_domain(
+                source_organization_cards, social_media_domains
+            )
+        )
+        for source_id in source_ids:
+            organization_names_by_domains: VariantNamesByDomain = (
+                organization_names_by_sources.pop(source_id, defaultdict(list))
+            )
+            logger.info(
+                f"Source {source_id}: {len(organization_names_by_domains)} domains"
+            )
+            models: list[OrganizationNamesByDomain] = self.adding_in_models(
+                organization_names_by_domains, top_source_categories, stop_words
+            )
+            self.write_aggregate_domains(
+                models,
+                until_card_id,
+                self.repository.for_source(source_id),
+            )
 
-            # 5. Подсчет слов, которые встречаются в ≥30% названий
-            word_counts = Counter(words)
-            keywords: list[str] = self.get_keywords(
-                word_counts, cleaned_variant_names_count
+    def check_incremental_settings(self) -> None:
+        """
+        The incremental update upserts the changed domains into the Postgres
+        table only, so other sinks and write modes are rejected instead of being
+        ignored, on the rebuild as well as on the updates after it.
+        """
+        unsupported_settings: list[str] = [
+            name
+            for name, is_set in (
+                ("RESULT_SINKS", settings.RESULT_SINKS != ["postgres"]),
+                ("WRITE_MODE", settings.WRITE_MODE != "replace"),
             )
-            keyword_score: float = self.get_keyword_score(
-                word_counts, cleaned_variant_names_count
+            if is_set
+        ]
+        if unsupported_settings:
+            raise ValueError(
+                f"INCREMENTAL writes only the Postgres table with WRITE_MODE=replace, "
+                f"unset {', '.join(unsupported_settings)}"
             )
 
-            # 6. Подсчет уникальных названий организаций
-            unique_names_ratio: float = self.calculate_unique_ratio(
-                cleaned_variant_names_unique_count, cleaned_variant_names_count
+    def check_checkpoint_settings(self) -> None:
+        """
+        Checkpoint segments hold the names grouped in lists and the models are
+        computed by the python engine in this process, so other modes are rejected.
+        """
+        unsupported_settings: list[str] = [
+            name
+            for name, is_set in (
+                ("AGGREGATION_ENGINE", settings.AGGREGATION_ENGINE != "python"),
+                ("AGGREGATION_WORKERS", settings.AGGREGATION_WORKERS > 1),
+                ("SPILL_MEMORY_BUDGET_MB", settings.SPILL_MEMORY_BUDGET_MB > 0),
+                ("APPROXIMATE_MIN_NAMES", settings.APPROXIMATE_MIN_NAMES > 0),
             )
-            # 7. Подсчет уникальных первых слов в названиях организаций
-            unique_first_words_ratio: float = self.calculate_unique_ratio(
-                first_word_of_names_unique_count, first_word_of_names_count
+            if is_set
+        ]
+        if unsupported_settings:
+            raise ValueError(
+                f"CHECKPOINT_DIR works only with the python engine in one process, "
+                f"unset {', '.join(unsupported_settings)}"
             )
 
-            is_aggregator = self.is_aggregator(
-                cleaned_variant_names_count,
-                unique_names_ratio,
-                unique_first_words_ratio,
-                keyword_score,
+    def get_async_pipeline_conflicts(
+        self,
+        ordered: bool,
+        watermark: int | None,
+        checkpoint: Checkpoint | None,
+    ) -> list[str]:
+        """
+        The async pipeline is a full rebuild into Postgres that reads one ordered
+        stream and computes the models with the python engine, so with other
+        modes the run falls back to the serial path.
+        """
+        return [
+            name
+            for name, is_set in (
+                ("an unordered card stream", not ordered),
+                ("INCREMENTAL", watermark is not None),
+                ("CHECKPOINT_DIR", checkpoint is not None),
+                ("RESULT_SINKS", settings.RESULT_SINKS != ["postgres"]),
+                ("WRITE_MODE", settings.WRITE_MODE != "replace"),
+                ("AGGREGATION_ENGINE", settings.AGGREGATION_ENGINE != "python"),
+                ("AGGREGATION_WORKERS", settings.AGGREGATION_WORKERS > 1),
+                ("CARD_READERS", settings.CARD_READERS > 1),
+                ("SPILL_MEMORY_BUDGET_MB", settings.SPILL_MEMORY_BUDGET_MB > 0),
+                ("APPROXIMATE_MIN_NAMES", settings.APPROXIMATE_MIN_NAMES > 0),
             )
+            if is_set
+        ]
 
-            model = OrganizationNamesByDomain(
-                domain=domain,
-                organization_names=cleaned_variant_names,
-                organization_names_count=len(cleaned_variant_names),
-                organization_names_unique=list(set(cleaned_variant_names)),
-                organization_names_unique_count=len(list(set(cleaned_variant_names))),
-                first_word_of_names=first_word_of_names,
-                first_word_of_names_count=len(first_word_of_names),
-                first_word_of_names_unique=list(set(first_word_of_names)),
-                first_word_of_names_unique_count=len(list(set(first_word_of_names))),
-                unique_names_ratio=unique_names_ratio,
-                unique_first_words_ratio=unique_first_words_ratio,
-                keywords=keywords,
-                keyword_score=keyword_score,
-                is_aggregator=is_aggregator,
+    def run_aggregate_domains(self, resume: bool = False, ordered: bool = True):
+        """
+        Full rebuild, incremental update or checkpointed run of one source.
+        With ordered=False the cards are de-duplicated without relying on
+        their order, and neither checkpoints nor the async pipeline are used.
+        """
+        with ThreadPoolExecutor(max_workers=4) as executor:
+            reference_data_futures = self.submit_reference_data(executor)
+
+            until_card_id: int | None = self.repository.get_max_organization_card_id()
+            if until_card_id is None:
+                logger.info("No organization cards found")
+                return
+
+            watermark: int | None = None
+            if settings.INCREMENTAL:
+                self.check_incremental_settings()
+                watermark = self.repository.get_aggregate_domains_watermark()
+                if watermark is None:
+                    logger.info("Watermark not found, rebuilding aggregate domains")
+                elif not self.writes_all_names():
+                    # Обновление дописывает новые названия к сохраненным массивам
+                    raise ValueError(
+                        "INCREMENTAL needs the full organization_names of every domain: "
+                        "set OUTPUT_ARRAYS=all and APPROXIMATE_MIN_NAMES=0"
+                    )
+
+            checkpoint: Checkpoint | None = None
+            checkpoint_state: CheckpointState | None = None
+            if settings.CHECKPOINT_DIR and watermark is None and ordered:
+                self.check_checkpoint_settings()
+                checkpoint = Checkpoint()
+                checkpoint_state = checkpoint.load() if resume else None
+                if checkpoint_state is None:
+                    if resume:
+                        logger.info("Checkpoint not found, starting from the beginning")
+                    checkpoint_state = checkpoint.start(until_card_id)
+                else:
+                    until_card_id = checkpoint_state.until_card_id
+                    logger.info(
+                        f"Resuming from card id {checkpoint_state.last_card_id} "
+                        f"until card id {until_card_id}"
+                    )
+            elif resume:
+                if not settings.CHECKPOINT_DIR:
+                    reason = "CHECKPOINT_DIR is not set"
+                elif watermark is not None:
+                    reason = f"INCREMENTAL updates after card id {watermark}"
+                else:
+                    reason = "the card stream is not ordered by id"
+                logger.warning(f"Nothing to resume: {reason}")
+
+            use_async_pipeline = False
+            if settings.ASYNC_PIPELINE:
+                unsupported_settings = self.get_async_pipeline_conflicts(
+                    ordered, watermark, checkpoint
+                )
+                if unsupported_settings:
+                    logger.warning(
+                        f"ASYNC_PIPELINE is not used with "
+                        f"{', '.join(unsupported_settings)}, aggregating serially"
+                    )
+                else:
+                    logger.info("Aggregating with the async pipeline")
+                    use_async_pipeline = True
+            organization_cards: Iterable[OrganizationCardRow] = []
+            if checkpoint_state is not None and checkpoint_state.computed:
+                logger.info("Aggregate domains already computed, writing them")
+            elif not use_async_pipeline:
+                after_card_id = watermark or 0
+                # Контрольным точкам нужен поток, упорядоченный по id
+                readers = settings.CARD_READERS
+                if checkpoint_state is not None:
+                    after_card_id = checkpoint_state.last_card_id
+                    readers = 1
+                # Параллельные диапазоны перемешивают карточки
+                self.ordered_stream = ordered and readers <= 1
+                if not self.ordered_stream:
+                    logger.info(
+                        f"Reading cards with {readers} readers, "
+                        "de-duplicating by card id sets"
+                    )
+                organization_cards = start_streaming(
+                    executor,
+                    self.repository.stream_organization_cards(
+                        after_card_id=after_card_id,
+                        until_card_id=until_card_id,
+                        readers=readers,
+                    ),
+                )
+
+            social_media_domains, top_source_categories, stop_words = (
+                self.get_reference_data(reference_data_futures)
             )
-            models.append(model)
 
-        return models
+        if use_async_pipeline:
+            import asyncio
 
-    def get_domain(self, link: str, social_media_domains: set[str]) -> str | None:
-        extract_link = extract(link)
-        domain = extract_link.registered_domain.lower()
-        subdomain = extract_link.subdomain.lower()
-        if not domain:
-            return
-        if domain in social_media_domains:
-            return
-        if subdomain:
-            domain = f"{subdomain}.{domain}"
-        return domain
+            from src.aggregators.pipeline import AsyncAggregationPipeline
 
-    def clear_domain(self, domain: str) -> str | None:
-        domain_cleaned = re.sub(r"^www[1-9]?\.?", "", domain, flags=re.IGNORECASE)
-        if not domain_cleaned:
+            pipeline = AsyncAggregationPipeline(self, self.repository)
+            asyncio.run(
+                pipeline.run(
+                    until_card_id,
+                    social_media_domains,
+                    top_source_categories,
+                    stop_words,
+                )
+            )
             return
-        return domain_cleaned
-
-    def grouping_organization_names_by_domain(
-        self, social_media_domains: set[str]
-    ) -> VariantNamesByDomain:
-        organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
-        organization_ids_by_domains: OrganizationIdsByDomains = defaultdict(set)
-
-        for organization_card in self.repository.stream_organization_cards():
-            domain = self.get_domain(organization_card.link, social_media_domains)
-            if not domain:
-                continue
 
-            domain_cleaned = self.clear_domain(domain)
-            if not domain_cleaned:
-                continue
-
-            if organization_card.id in organization_ids_by_domains[domain]:
-                continue
-
-            organization_names_by_domains[domain].append(
-                organization_card.organization_name.lower()
+        if checkpoint is not None and checkpoint_state is not None:
+            self.run_with_checkpoint(
+                checkpoint,
+                checkpoint_state,
+                organization_cards,
+                social_media_domains,
+                top_source_categories,
+                stop_words,
             )
-            organization_ids_by_domains[domain].add(organization_card.id)
+            return
 
-        return organization_names_by_domains
+        if watermark is not None:
+            logger.info(f"Updating aggregate domains after card id {watermark}")
+            self.update_aggregate_domains(
+                organization_cards,
+                social_media_domains,
+                top_source_categories,
+                stop_words,
+                until_card_id=until_card_id,
+            )
+            return
 
-    def get_aggregate_domains(self):
-        social_medias: list[SocialMedia] = self.repository.get_social_medias()
-        social_media_domains: set[str] = set(
-            social_media.primary_domain
-            for social_media in social_medias
-            if social_media.primary_domain
+        models: Iterable[OrganizationNamesByDomain] = self.compute_aggregate_domains(
+            organization_cards,
+            social_media_domains,
+            top_source_categories,
+            stop_words,
         )
-        top_source_categories: list[str] = self.repository.get_top_source_categories()
-        stop_words: list[str] = self.repository.get_stop_words()
-        organization_names_by_domains: VariantNamesByDomain = (
-            self.grouping_organization_names_by_domain(social_media_domains)
-        )
-        models: list[OrganizationNamesByDomain] = self.adding_in_models(
-            organization_names_by_domains, set(top_source_categories), set(stop_words)
-        )
-        self.repository.insert_aggregate_domains(models)
-
-
-aggregator_service = AggregatorService(repository=aggregator_repository)
+        self.write_aggregate_domains(models, until_card_id)
+
+
+def create_aggregator_service(
+    source_id: int | None = None,
+    thresholds: AggregatorThresholds | None = None,
+    db: DatabaseConnection | None = None,
+) -> AggregatorService:
+    """Service over the database, connected only when it is first queried"""
+    from src.aggregators.repository import AggregatorRepository
+
+    repository = AggregatorRepository(
+        db=db or DatabaseConnection(),
+        source_id=settings.SOURCE_ID if source_id is None else source_id,
+    )
+    return AggregatorService(repository=repository, thresholds=thresholds)
@@ -0,0 +1,238 @@
+import json
+from contextlib import AbstractContextManager, ExitStack, contextmanager
+from itertools import batched
+from pathlib import Path
+from typing import Callable, Generator, Iterable, Protocol
+
+from src.aggregators.models import OrganizationNamesByDomain
+from src.config.logging import logging
+from src.config.metrics import metrics
+from src.config.repository import RepositoryProtocol
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Запись одного пакета моделей в приемник
+BatchWriter = Callable[[list[OrganizationNamesByDomain]], None]
+
+
+class ResultSink(Protocol):
+    """Destination of the computed aggregate domains."""
+
+    def open(self) -> AbstractContextManager[BatchWriter]:
+        """
+        Writer of model batches. The result is published when the block exits
+        and discarded if it exits with an error.
+        """
+        raise NotImplementedError
+
+
+class PostgresSink(ResultSink):
+    """
+    Result table of the source with its watermark. The table is swapped in
+    whole, or with WRITE_MODE=delta only the changed domains are written.
+    The watermark is moved in the same transaction, and without a watermark
+    the stored one is removed.
+    """
+
+    def __init__(self, repository: RepositoryProtocol, watermark: int | None) -> None:
+        self.repository = repository
+        self.watermark = watermark
+
+    @contextmanager
+    def open(self) -> Generator[BatchWriter, None, None]:
+        if settings.WRITE_MODE == "delta":
+            writer = self.repository.write_aggregate_domains_delta(self.watermark)
+        else:
+            writer = self.repository.write_aggregate_domains(self.watermark)
+        with writer as write:
+            yield write
+        logger.info(f"Set aggregate domains watermark to card id {self.watermark}")
+
+
+class SummarySink(ResultSink):
+    """Only counts and logs the domains and aggregators, for dry runs."""
+
+    def __init__(self, source_id: int) -> None:
+        self.source_id = source_id
+
+    @contextmanager
+    def open(self) -> Generator[BatchWriter, None, None]:
+        domains_count = 0
+        aggregators_count = 0
+
+        def write(models: list[OrganizationNamesByDomain]) -> None:
+            nonlocal domains_count, aggregators_count
+            domains_count += len(models)
+            aggregators_count += sum(model.is_aggregator for model in models)
+
+        yield write
+        logger.info(
+            f"Source {self.source_id}: {domains_count} aggregate domains, "
+            f"{aggregators_count} aggregators"
+        )
+
+
+class FileSink(ResultSink):
+    """
+    Result file written next to its final path and renamed when complete,
+    so readers never see a partial file.
+    """
+
+    stage_name = ""
+
+    def __init__(self, path: str) -> None:
+        self.path = Path(path)
+
+    @contextmanager
+    def open(self) -> Generator[BatchWriter, None, None]:
+        """
+        The stage counts opening, every batch write and closing of the file,
+        not the aggregation running between the batches.
+        """
+        temporary_path = self.path.with_name(f"{self.path.name}.tmp")
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        stage = metrics.get_stage(self.stage_name)
+        try:
+            with ExitStack() as writer:
+                with metrics.stage(self.stage_name):
+                    write = writer.enter_context(self.open_writer(temporary_path))
+
+                def write_batch(models: list[OrganizationNamesByDomain]) -> None:
+                    with metrics.stage(self.stage_name):
+                        write(models)
+                    stage.rows_in += len(models)
+
+                yield write_batch
+                with metrics.stage(self.stage_name):
+                    writer.close()
+                    temporary_path.replace(self.path)
+        finally:
+            temporary_path.unlink(missing_ok=True)
+        logger.info(
+            f"Wrote {stage.rows_in} aggregate domains to {self.path} in {stage.duration}"
+        )
+
+    def open_writer(self, path: Path) -> AbstractContextManager[BatchWriter]:
+        raise NotImplementedError
+
+
+class JsonLinesSink(FileSink):
+    """One JSON object per line with the model fields."""
+
+    stage_name = "write_jsonl"
+
+    @contextmanager
+    def open_writer(self, path: Path) -> Generator[BatchWriter, None, None]:
+        with open(path, "w", encoding="utf-8") as jsonl_file:
+
+            def write(models: list[OrganizationNamesByDomain]) -> None:
+                jsonl_file.writelines(
+                    json.dumps(model._asdict(), ensure_ascii=False) + "\n"
+                    for model in models
+                )
+
+            yield write
+
+
+class ParquetSink(FileSink):
+    """Columnar file with one row group per batch."""
+
+    stage_name = "write_parquet"
+
+    def __init__(self, path: str) -> None:
+        # pyarrow — необязательная зависимость, импортируется только этим приемником
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "RESULT_SINKS=parquet requires pyarrow, "
+                "install it with: uv sync --extra parquet"
+            ) from None
+        super().__init__(path)
+
+    def get_schema(self):
+        import pyarrow as pa
+
+        strings = pa.list_(pa.string())
+        return pa.schema(
+            [
+                ("domain", pa.string()),
+                ("organization_names", strings),
+                ("organization_names_count", pa.int32()),
+                ("organization_names_unique", strings),
+                ("organization_names_unique_count", pa.int32()),
+                ("first_word_of_names", strings),
+                ("first_word_of_names_count", pa.int32()),
+                ("first_word_of_names_unique", strings),
+                ("first_word_of_names_unique_count", pa.int32()),
+                ("unique_names_ratio", pa.float64()),
+                ("unique_first_words_ratio", pa.float64()),
+                ("keywords", strings),
+                ("keyword_score", pa.float64()),
+                ("is_aggregator", pa.bool_()),
+            ]
+        )
+
+    @contextmanager
+    def open_writer(self, path: Path) -> Generator[BatchWriter, None, None]:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        schema = self.get_schema()
+        with pq.ParquetWriter(path, schema) as parquet_writer:
+
+            def write(models: list[OrganizationNamesByDomain]) -> None:
+                parquet_writer.write_table(
+                    pa.Table.from_pylist(
+                        [model._asdict() for model in models], schema=schema
+                    )
+                )
+
+            yield write
+
+
+def get_sinks(
+    repository: RepositoryProtocol, watermark: int | None
+) -> list[ResultSink]:
+    """Sinks of RESULT_SINKS, file paths may contain {source_id} of the repository"""
+    source_id = repository.source_id
+    sinks: list[ResultSink] = []
+    for sink_name in settings.RESULT_SINKS:
+        if sink_name == "postgres":
+            sinks.append(PostgresSink(repository, watermark))
+        elif sink_name == "summary":
+            sinks.append(SummarySink(source_id))
+        elif sink_name == "jsonl":
+            sinks.append(JsonLinesSink(get_sink_path("RESULT_JSONL_PATH", source_id)))
+        elif sink_name == "parquet":
+            sinks.append(ParquetSink(get_sink_path("RESULT_PARQUET_PATH", source_id)))
+        else:
+            raise ValueError(f"Unknown result sink: {sink_name}")
+    return sinks
+
+
+def get_sink_path(setting_name: str, source_id: int) -> str:
+    path: str = getattr(settings, setting_name)
+    if not path:
+        raise ValueError(f"{setting_name} is required for the file result sink")
+    return path.format(source_id=source_id)
+
+
+def write_to_sinks(
+    sinks: list[ResultSink],
+    models: Iterable[OrganizationNamesByDomain],
+    batch_size: int | None = None,
+) -> None:
+    """
+    Stream the models into every sink in batches. Sinks are published only
+    after all models are written, and an error while writing discards them all.
+    """
+    with ExitStack() as stack:
+        writers: list[BatchWriter] = [
+            stack.enter_context(sink.open()) for sink in sinks
+        ]
+        for models_batch in batched(models, batch_size or settings.RESULT_BATCH_SIZE):
+            models_batch = list(models_batch)
+            for write in writers:
+                write(models_batch)
@@ -0,0 +1,110 @@
+import math
+import random
+from collections import Counter
+from hashlib import blake2b
+from typing import Iterable
+
+
+def hash64(value: str) -> int:
+    """Stable across processes and runs, unlike the randomized built-in hash()"""
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "little")
+
+
+class HyperLogLog:
+    """
+    Distinct count estimate in 2 ** precision one-byte registers.
+
+    The relative standard error is 1.04 / sqrt(2 ** precision),
+    about 0.8% for the default precision of 14 with 16 KB of registers.
+    """
+
+    def __init__(self, precision: int) -> None:
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+        self.rank_bits = 64 - precision
+        self.rank_mask = (1 << self.rank_bits) - 1
+
+    def update(self, values: Iterable[str]) -> None:
+        registers = self.registers
+        rank_bits = self.rank_bits
+        rank_mask = self.rank_mask
+        for value in values:
+            value_hash = hash64(value)
+            index = value_hash >> rank_bits
+            # Позиция первой единицы в оставшихся битах хэша
+            rank = rank_bits - (value_hash & rank_mask).bit_length() + 1
+            if rank > registers[index]:
+                registers[index] = rank
+
+    def count(self) -> int:
+        registers_count = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / registers_count)
+        estimate = (
+            alpha
+            * registers_count**2
+            / sum(2.0**-register for register in self.registers)
+        )
+        zero_registers = self.registers.count(0)
+        # Для малых множеств точнее линейный подсчет по пустым регистрам
+        if estimate <= 2.5 * registers_count and zero_registers:
+            estimate = registers_count * math.log(registers_count / zero_registers)
+        return round(estimate)
+
+
+class HeavyHitters:
+    """
+    Misra-Gries summary of the most frequent words in at most capacity counters.
+
+    Counts are lower bounds: each one is below the true count
+    by at most total / (capacity + 1), and every word seen more often
+    than that is kept.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = capacity
+        self.counters: Counter = Counter()
+        self.total = 0
+
+    def update(self, words: Iterable[str]) -> None:
+        counters = self.counters
+        for word in words:
+            self.total += 1
+            if word in counters:
+                counters[word] += 1
+            elif len(counters) < self.capacity:
+                counters[word] = 1
+            else:
+                for counted_word in list(counters):
+                    if counters[counted_word] == 1:
+                        del counters[counted_word]
+                    else:
+                        counters[counted_word] -= 1
+
+    @property
+    def max_error(self) -> float:
+        return self.total / (self.capacity + 1)
+
+
+class ReservoirSample:
+    """
+    Uniform sample of at most size values from a stream of unknown length.
+
+    The random generator is seeded with the key, so the same stream
+    gives the same sample in every run.
+    """
+
+    def __init__(self, size: int, key: str) -> None:
+        self.size = size
+        self.values: list[str] = []
+        self.seen = 0
+        self.random = random.Random(hash64(key))
+
+    def update(self, values: Iterable[str]) -> None:
+        for value in values:
+            self.seen += 1
+            if len(self.values) < self.size:
+                self.values.append(value)
+                continue
+            index = self.random.randrange(self.seen)
+            if index < self.size:
+                self.values[index] = value
@@ -0,0 +1,145 @@
+import pickle
+import tempfile
+from collections import defaultdict
+from pathlib import Path
+from typing import BinaryIO, Generator, Iterable
+
+from src.aggregators.calculator import (
+    DomainName,
+    VariantNamesByDomain,
+)
+from src.aggregators.dedup import DomainNameDeduplicator
+from src.aggregators.parallel import get_shard
+from src.config.logging import logging
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+# Приблизительные накладные расходы CPython на строку в списке и на домен в словарях
+NAME_OVERHEAD_BYTES = 60
+DOMAIN_OVERHEAD_BYTES = 400
+
+
+class SpillingGrouper:
+    """
+    Groups organization names by domain within a memory budget.
+
+    When the estimated size of the in-memory groups exceeds the budget, they are
+    spilled to temporary files partitioned by domain hash. Each partition is then
+    merged and yielded one at a time by iter_groups, so only one partition is held
+    in memory while models are computed and written.
+
+    Spills happen only between cards, so all rows of a card stay in one run.
+    The deduplicator lives across spills, so a card is counted once per domain.
+    A partition file is created by the first spill that has domains for it.
+    """
+
+    def __init__(
+        self,
+        memory_budget_mb: int | None = None,
+        partitions: int | None = None,
+        spill_dir: str | None = None,
+        ordered: bool = True,
+    ) -> None:
+        self.memory_budget = (
+            (memory_budget_mb or settings.SPILL_MEMORY_BUDGET_MB) * 1024 * 1024
+        )
+        self.partitions = partitions or settings.SPILL_PARTITIONS
+        self.spill_dir = spill_dir or settings.SPILL_DIR or None
+        self.directory: tempfile.TemporaryDirectory | None = None
+        self.partition_files: dict[int, BinaryIO] = {}
+        self.organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        self.spills = 0
+        self.deduplicator = DomainNameDeduplicator(ordered)
+
+    def group(self, domain_names: Iterable[DomainName]) -> None:
+        """
+        Consume the domain names, spilling to disk whenever the budget is exceeded
+        """
+        self.directory = tempfile.TemporaryDirectory(
+            prefix="aggregate_domains_", dir=self.spill_dir
+        )
+        try:
+            self.group_with_spills(domain_names)
+        finally:
+            for partition_file in self.partition_files.values():
+                partition_file.close()
+
+    def get_partition_path(self, partition: int) -> Path:
+        return Path(self.directory.name) / f"partition_{partition}.pickle"
+
+    def group_with_spills(self, domain_names: Iterable[DomainName]) -> None:
+        organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        estimated_size = 0
+        current_card_id: int | None = None
+
+        for domain, organization_id, organization_name in self.deduplicator.iter_unique(
+            domain_names
+        ):
+            if organization_id != current_card_id:
+                if estimated_size >= self.memory_budget:
+                    self.spill(organization_names_by_domains)
+                    organization_names_by_domains.clear()
+                    estimated_size = 0
+                current_card_id = organization_id
+
+            if domain not in organization_names_by_domains:
+                estimated_size += len(domain) + DOMAIN_OVERHEAD_BYTES
+            organization_names_by_domains[domain].append(organization_name)
+            estimated_size += len(organization_name) + NAME_OVERHEAD_BYTES
+
+        if self.spills:
+            self.spill(organization_names_by_domains)
+        else:
+            self.organization_names_by_domains = organization_names_by_domains
+
+    def iter_groups(self) -> Generator[tuple[str, list[str]], None, None]:
+        """Yield the grouped names one partition at a time and remove the spill files"""
+        try:
+            if not self.spills:
+                yield from self.organization_names_by_domains.items()
+                return
+
+            logger.info(
+                f"Merging {self.spills} spills from "
+                f"{len(self.partition_files)} partitions"
+            )
+            for partition in sorted(self.partition_files):
+                path = self.get_partition_path(partition)
+                yield from self.merge_partition(path).items()
+                path.unlink()
+        finally:
+            self.organization_names_by_domains = defaultdict(list)
+            self.partition_files = {}
+            if self.directory is not None:
+                self.directory.cleanup()
+                self.directory = None
+
+    def spill(self, organization_names_by_domains: VariantNamesByDomain) -> None:
+        partitioned: defaultdict[int, dict[str, list[str]]] = defaultdict(dict)
+        for domain, variant_names in organization_names_by_domains.items():
+            partitioned[get_shard(domain, self.partitions)][domain] = variant_names
+
+        for partition, names_by_domains in partitioned.items():
+            partition_file = self.partition_files.get(partition)
+            if partition_file is None:
+                partition_file = self.partition_files[partition] = open(
+                    self.get_partition_path(partition), "wb"
+                )
+            pickle.dump(
+                names_by_domains, partition_file, protocol=pickle.HIGHEST_PROTOCOL
+            )
+        self.spills += 1
+        logger.debug(f"Spilled {len(organization_names_by_domains)} domains")
+
+    def merge_partition(self, path: Path) -> VariantNamesByDomain:
+        organization_names_by_domains: VariantNamesByDomain = defaultdict(list)
+        with open(path, "rb") as partition_file:
+            while True:
+                try:
+                    names_by_domains: dict[str, list[str]] = pickle.load(partition_file)
+                except EOFError:
+                    break
+                for domain, variant_names in names_by_domains.items():
+                    organization_names_by_domains[domain].extend(variant_names)
+        return organization_names_by_domains
@@ -0,0 +1,79 @@
+import re
+import time
+from functools import lru_cache
+from typing import Iterable
+
+from src.config.settings import settings
+
+# Все, кроме букв, цифр, апострофа и пробелов, удаляется из названия за один проход
+TOKEN_PATTERN = re.compile(r"[^\w'\s]+")
+
+# Первое слово названия или None и все слова без стоп-слов
+NameTokens = tuple[str | None, tuple[str, ...]]
+
+
+class Tokenizer:
+    """
+    Splits organization names into cleaned words, skipping stop words.
+
+    Each name is cleaned with one regex pass over the whole name instead of
+    one per word. Whitespace is normalized to single spaces first, so splitting
+    by a space keeps the word positions, and a word that becomes empty still
+    counts as the first word. Results are memoized per name in a bounded LRU
+    cache, which belongs to one set of stop words.
+    """
+
+    def __init__(
+        self,
+        stop_words: set[str],
+        cache_size: int | None = None,
+    ) -> None:
+        self.stop_words_source = stop_words
+        self.stop_words = frozenset(stop_words)
+        self.tokenize = lru_cache(maxsize=cache_size or settings.TOKENIZER_CACHE_SIZE)(
+            self.tokenize_name
+        )
+        self.calls = 0
+        self.seconds = 0.0
+
+    def matches(self, stop_words: set[str]) -> bool:
+        return stop_words is self.stop_words_source or stop_words == self.stop_words
+
+    def tokenize_name(self, name: str) -> NameTokens:
+        stop_words = self.stop_words
+        first_word: str | None = None
+        words: list[str] = []
+        for index, word in enumerate(
+            TOKEN_PATTERN.sub("", " ".join(name.split())).split(" ")
+        ):
+            if not word or word in stop_words:
+                continue
+            words.append(word)
+            if index == 0:
+                first_word = word
+        return first_word, tuple(words)
+
+    def tokenize_distinct_names(self, names: Iterable[str]) -> list[NameTokens]:
+        """Tokenize names known to be distinct, bypassing the cache"""
+        start_time = time.perf_counter()
+        name_tokens: list[NameTokens] = [self.tokenize_name(name) for name in names]
+        self.calls += len(name_tokens)
+        self.seconds += time.perf_counter() - start_time
+        return name_tokens
+
+    def tokenize_names(self, names: Iterable[str]) -> tuple[list[str], list[str]]:
+        """First words of the names and all their words"""
+        start_time = time.perf_counter()
+        tokenize = self.tokenize
+        first_word_of_names: list[str] = []
+        words: list[str] = []
+        calls = 0
+        for name in names:
+            first_word, name_words = tokenize(name)
+            if first_word is not None:
+                first_word_of_names.append(first_word)
+            words.extend(name_words)
+            calls += 1
+        self.calls += calls
+        self.seconds += time.perf_counter() - start_time
+        return first_word_of_names, words
@@ -0,0 +1,298 @@
+from typing import Generator
+
+from src.aggregators.calculator import AggregatorCalculator
+from src.aggregators.encoding import EncodedNamesByDomain
+from src.aggregators.models import OrganizationNamesByDomain
+from src.config.metrics import metrics
+
+
+def get_offsets(sorted_keys, size: int):
+    """Start offsets of every key in a sorted array, size + 1 items"""
+    import numpy as np
+
+    return np.searchsorted(sorted_keys, np.arange(size + 1))
+
+
+def get_unique_pairs(keys, values, values_count: int):
+    """Sorted unique (key, value) pairs of two int64 arrays"""
+    import numpy as np
+
+    pairs = np.unique(keys * values_count + values)
+    return pairs // values_count, pairs % values_count
+
+
+def get_slice(
+    values_with_offsets: tuple[list[str], list[int]],
+    index: int,
+    writes_arrays: list[bool] | None = None,
+) -> list[str] | None:
+    """Values of the domain at index, None if its arrays are not written"""
+    if writes_arrays is not None and not writes_arrays[index]:
+        return None
+    values, offsets = values_with_offsets
+    return values[offsets[index] : offsets[index + 1]]
+
+
+class VectorizedFeatures:
+    """
+    Features of all domains computed at once with NumPy.
+
+    Names and words are taken as ids from the encoded engine and flattened
+    into arrays sorted by domain, so counts, unique counts, ratios, keywords
+    and the aggregator mask are array operations over every domain together.
+    Python code per domain only slices the results into the model.
+    """
+
+    def __init__(self, calculator: AggregatorCalculator) -> None:
+        # numpy — необязательная зависимость, импортируется только этим движком
+        try:
+            import numpy  # noqa: F401
+        except ImportError:
+            raise ImportError(
+                "AGGREGATION_ENGINE=numpy requires numpy, "
+                "install it with: uv sync --extra numpy"
+            ) from None
+        self.calculator = calculator
+
+    def iter_models(
+        self,
+        encoded_names_by_domains: EncodedNamesByDomain,
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> Generator[OrganizationNamesByDomain, None, None]:
+        with metrics.stage("vectorized_features") as stage:
+            features = self.compute(
+                encoded_names_by_domains, top_source_categories, stop_words
+            )
+            stage.rows_in = len(encoded_names_by_domains)
+            stage.rows_out = len(features)
+        yield from features
+
+    def compute(
+        self,
+        encoded_names_by_domains: EncodedNamesByDomain,
+        top_source_categories: set[str],
+        stop_words: set[str],
+    ) -> list[OrganizationNamesByDomain]:
+        import numpy as np
+
+        thresholds = self.calculator.thresholds
+        names = encoded_names_by_domains.names
+        encoded_words = self.calculator.encode_name_words(
+            names, top_source_categories, stop_words
+        )
+        words = encoded_words.words
+        names_total = max(len(names), 1)
+        words_total = max(len(words), 1)
+
+        # Слова всех названий подряд и смещения слов каждого названия
+        words_per_name = np.fromiter(
+            (len(word_ids) for word_ids in encoded_words.word_ids_by_name),
+            dtype=np.int64,
+            count=len(names),
+        )
+        word_offsets_by_name = np.zeros(len(names) + 1, dtype=np.int64)
+        np.cumsum(words_per_name, out=word_offsets_by_name[1:])
+        word_ids_of_names = np.fromiter(
+            (
+                word_id
+                for word_ids in encoded_words.word_ids_by_name
+                for word_id in word_ids
+            ),
+            dtype=np.int64,
+            count=int(word_offsets_by_name[-1]),
+        )
+        first_word_id_by_name = np.array(
+            encoded_words.first_word_ids_by_name, dtype=np.int64
+        )
+        excluded_by_name = np.zeros(len(names), dtype=bool)
+        excluded_by_name[list(encoded_words.excluded_name_ids)] = True
+
+        # Названия всех доменов подряд, domain_index отсортирован по возрастанию
+        domains: list[str] = list(encoded_names_by_domains.name_ids_by_domains)
+        name_ids_by_domains = encoded_names_by_domains.name_ids_by_domains.values()
+        domains_count = len(domains)
+        names_per_domain = np.fromiter(
+            (len(name_ids) for name_ids in name_ids_by_domains),
+            dtype=np.int64,
+            count=domains_count,
+        )
+        name_ids = np.frombuffer(
+            b"".join(name_ids.tobytes() for name_ids in name_ids_by_domains),
+            dtype=np.uint32,
+        ).astype(np.int64)
+        domain_index = np.repeat(np.arange(domains_count), names_per_domain)
+
+        kept = ~excluded_by_name[name_ids]
+        name_ids = name_ids[kept]
+        domain_index = domain_index[kept]
+
+        # 1–2. Количество названий и уникальных названий
+        names_count = np.bincount(domain_index, minlength=domains_count)
+        unique_name_domains, unique_name_ids = get_unique_pairs(
+            domain_index, name_ids, names_total
+        )
+        unique_names_count = np.bincount(unique_name_domains, minlength=domains_count)
+
+        # В облегченном выводе маленьким доменам хватает этих двух чисел:
+        # слова считаются только по названиям остальных доменов
+        if self.calculator.output_arrays == "all":
+            counted_only = np.zeros(domains_count, dtype=bool)
+        else:
+            counted_only = names_count <= thresholds.min_names_count
+        featured = ~counted_only[domain_index]
+        featured_name_ids = name_ids[featured]
+        featured_domain_index = domain_index[featured]
+
+        # 3–4. Количество первых слов и уникальных первых слов
+        first_word_ids = first_word_id_by_name[featured_name_ids]
+        has_first_word = first_word_ids >= 0
+        first_word_domains = featured_domain_index[has_first_word]
+        first_word_ids = first_word_ids[has_first_word]
+        first_words_count = np.bincount(first_word_domains, minlength=domains_count)
+        unique_first_word_domains, unique_first_word_ids = get_unique_pairs(
+            first_word_domains, first_word_ids, words_total
+        )
+        unique_first_words_count = np.bincount(
+            unique_first_word_domains, minlength=domains_count
+        )
+
+        # 5. Частоты слов: все слова всех названий каждого домена
+        words_per_occurrence = words_per_name[featured_name_ids]
+        occurrence_word_starts = np.repeat(
+            word_offsets_by_name[featured_name_ids], words_per_occurrence
+        )
+        occurrence_starts = np.cumsum(words_per_occurrence) - words_per_occurrence
+        position_in_name = np.arange(int(words_per_occurrence.sum()))
+        position_in_name -= np.repeat(occurrence_starts, words_per_occurrence)
+        word_domains = np.repeat(featured_domain_index, words_per_occurrence)
+        word_ids = word_ids_of_names[occurrence_word_starts + position_in_name]
+        word_keys, word_counts = np.unique(
+            word_domains * words_total + word_ids, return_counts=True
+        )
+        word_count_domains = word_keys // words_total
+
+        max_word_count = np.zeros(domains_count, dtype=np.int64)
+        np.maximum.at(max_word_count, word_count_domains, word_counts)
+        divisor = np.maximum(names_count, 1)
+        keyword_score = max_word_count / divisor
+        is_keyword = (
+            word_counts / divisor[word_count_domains] >= thresholds.keyword_min_ratio
+        )
+        keyword_domains = word_count_domains[is_keyword]
+        keyword_ids = word_keys[is_keyword] % words_total
+
+        # 6–7. Доли уникальных названий и первых слов
+        unique_names_ratio = unique_names_count / divisor
+        unique_first_words_ratio = np.where(
+            first_words_count > 0,
+            unique_first_words_count / np.maximum(first_words_count, 1),
+            0.0,
+        )
+        is_aggregator = (
+            (names_count > thresholds.min_names_count)
+            & (unique_names_ratio > thresholds.min_unique_names_ratio)
+            & (
+                (unique_first_words_ratio > thresholds.min_unique_first_words_ratio)
+                | (keyword_score < thresholds.max_keyword_score)
+            )
+        )
+
+        # Строки декодируются только для доменов, чьи массивы попадут в вывод
+        if self.calculator.output_arrays == "all":
+            writes_arrays = np.ones(domains_count, dtype=bool)
+        elif self.calculator.output_arrays == "candidates":
+            writes_arrays = is_aggregator & ~counted_only
+        else:
+            writes_arrays = np.zeros(domains_count, dtype=bool)
+
+        def decode_arrays(table, value_domains, value_ids):
+            written = writes_arrays[value_domains]
+            return (
+                table.decode_all(value_ids[written].tolist()),
+                get_offsets(value_domains[written], domains_count).tolist(),
+            )
+
+        return self.build_models(
+            domains,
+            names_count.tolist(),
+            unique_names_count.tolist(),
+            first_words_count.tolist(),
+            unique_first_words_count.tolist(),
+            writes_arrays.tolist(),
+            decode_arrays(names, domain_index, name_ids),
+            decode_arrays(names, unique_name_domains, unique_name_ids),
+            decode_arrays(words, first_word_domains, first_word_ids),
+            decode_arrays(words, unique_first_word_domains, unique_first_word_ids),
+            (
+                words.decode_all(keyword_ids.tolist()),
+                get_offsets(keyword_domains, domains_count).tolist(),
+            ),
+            unique_names_ratio.tolist(),
+            unique_first_words_ratio.tolist(),
+            keyword_score.tolist(),
+            is_aggregator.tolist(),
+        )
+
+    def build_models(
+        self,
+        domains: list[str],
+        names_count: list[int],
+        unique_names_count: list[int],
+        first_words_count: list[int],
+        unique_first_words_count: list[int],
+        writes_arrays: list[bool],
+        organization_names: tuple[list[str], list[int]],
+        organization_names_unique: tuple[list[str], list[int]],
+        first_word_of_names: tuple[list[str], list[int]],
+        first_word_of_names_unique: tuple[list[str], list[int]],
+        keywords: tuple[list[str], list[int]],
+        unique_names_ratio: list[float],
+        unique_first_words_ratio: list[float],
+        keyword_score: list[float],
+        is_aggregator: list[bool],
+    ) -> list[OrganizationNamesByDomain]:
+        """
+        Models sliced from the feature arrays. Every list of strings comes with
+        offsets by domain and holds only the domains with writes_arrays.
+        """
+        calculator = self.calculator
+        models: list[OrganizationNamesByDomain] = []
+        for index, domain in enumerate(domains):
+            organization_names_count = names_count[index]
+            if not organization_names_count:
+                continue
+            if calculator.is_counted_only(organization_names_count):
+                models.append(
+                    calculator.get_counted_model(
+                        domain, organization_names_count, unique_names_count[index]
+                    )
+                )
+                continue
+            models.append(
+                OrganizationNamesByDomain(
+                    domain=domain,
+                    organization_names=get_slice(
+                        organization_names, index, writes_arrays
+                    ),
+                    organization_names_count=organization_names_count,
+                    organization_names_unique=get_slice(
+                        organization_names_unique, index, writes_arrays
+                    ),
+                    organization_names_unique_count=unique_names_count[index],
+                    first_word_of_names=get_slice(
+                        first_word_of_names, index, writes_arrays
+                    ),
+                    first_word_of_names_count=first_words_count[index],
+                    first_word_of_names_unique=get_slice(
+                        first_word_of_names_unique, index, writes_arrays
+                    ),
+                    first_word_of_names_unique_count=unique_first_words_count[index],
+                    unique_names_ratio=unique_names_ratio[index],
+                    unique_first_words_ratio=unique_first_words_ratio[index],
+                    keywords=get_slice(keywords, index),
+                    keyword_score=keyword_score[index],
+                    is_aggregator=is_aggregator[index],
+                )
+            )
+        return models
@@ -0,0 +1,174 @@
+"""
+Command line entry point.
+
+    python -m src.cli run --resume
+    python -m src.cli dry-run --source 20 --min-names-count 20
+    python -m src.cli benchmark --cards 1000000 --engine encoded
+    python -m src.cli snapshot --source 20 --output data/aggregators_20.bin
+
+Without a command the arguments are passed to run, as in ``python main.py --resume``.
+Nothing connects to the database until a command needs it.
+"""
+
+import argparse
+import sys
+from datetime import datetime
+
+from src.config.logging import configure_logging, logging
+from src.config.metrics import metrics
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+COMMANDS = ("run", "dry-run", "benchmark", "snapshot")
+
+# Порог признака агрегатора и его поле в AggregatorThresholds
+THRESHOLD_OPTIONS = {
+    "--min-names-count": ("min_names_count", int),
+    "--min-unique-names-ratio": ("min_unique_names_ratio", float),
+    "--min-unique-first-words-ratio": ("min_unique_first_words_ratio", float),
+    "--max-keyword-score": ("max_keyword_score", float),
+    "--keyword-min-ratio": ("keyword_min_ratio", float),
+}
+
+
+def get_parser() -> argparse.ArgumentParser:
+    aggregation_parser = argparse.ArgumentParser(add_help=False)
+    aggregation_parser.add_argument(
+        "--source",
+        type=int,
+        action="append",
+        help="source id, repeat to aggregate several sources in one scan "
+        "(default: SOURCE_IDS)",
+    )
+    aggregation_parser.add_argument(
+        "--refresh-categories",
+        action="store_true",
+        help="recompute the top source categories snapshot",
+    )
+    for option, (field, option_type) in THRESHOLD_OPTIONS.items():
+        aggregation_parser.add_argument(
+            option, dest=field, type=option_type, help="aggregator threshold"
+        )
+
+    parser = argparse.ArgumentParser(
+        description="Aggregate organization names by domain"
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    run_parser = subparsers.add_parser(
+        "run", parents=[aggregation_parser], help="aggregate and write the results"
+    )
+    run_parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue from the checkpoint in CHECKPOINT_DIR",
+    )
+    subparsers.add_parser(
+        "dry-run",
+        parents=[aggregation_parser],
+        help="aggregate and log the counts without writing anything",
+    )
+    snapshot_parser = subparsers.add_parser(
+        "snapshot",
+        help="write the aggregator domains of a source to a lookup snapshot file",
+    )
+    snapshot_parser.add_argument(
+        "--source", type=int, help="source id (default: SOURCE_ID)"
+    )
+    snapshot_parser.add_argument(
+        "--output", required=True, help="snapshot file for AggregatorDomainIndex"
+    )
+    subparsers.add_parser(
+        "benchmark",
+        add_help=False,
+        help="benchmark the stages on synthetic cards, see benchmark --help",
+    )
+    return parser
+
+
+def get_thresholds(args: argparse.Namespace):
+    from src.aggregators.calculator import AggregatorThresholds
+
+    return AggregatorThresholds()._replace(
+        **{
+            field: getattr(args, field)
+            for field, _ in THRESHOLD_OPTIONS.values()
+            if getattr(args, field) is not None
+        }
+    )
+
+
+def aggregate(args: argparse.Namespace, resume: bool = False) -> None:
+    from src.aggregators.services import create_aggregator_service
+
+    if args.source:
+        settings.SOURCE_IDS = args.source
+        settings.SOURCE_ID = args.source[0]
+    if args.refresh_categories:
+        settings.TOP_CATEGORIES_REFRESH = True
+    aggregator_service = create_aggregator_service(
+        source_id=settings.SOURCE_ID, thresholds=get_thresholds(args)
+    )
+    aggregator_service.get_aggregate_domains(resume=resume)
+
+
+def run(args: argparse.Namespace) -> None:
+    aggregate(args, resume=args.resume)
+
+
+def dry_run(args: argparse.Namespace) -> None:
+    # Полный расчет без записи: ни таблиц, ни файлов, ни контрольных точек
+    settings.RESULT_SINKS = ["summary"]
+    settings.INCREMENTAL = False
+    settings.CHECKPOINT_DIR = ""
+    aggregate(args)
+
+
+def snapshot(args: argparse.Namespace) -> None:
+    from src.aggregators.lookup import write_domain_snapshot
+    from src.aggregators.services import create_aggregator_service
+
+    source_id = args.source or settings.SOURCE_ID
+    aggregator_service = create_aggregator_service(source_id=source_id)
+    domains_count = write_domain_snapshot(
+        args.output, aggregator_service.repository.get_aggregator_domains()
+    )
+    logger.info(f"Wrote {domains_count} aggregator domains to {args.output}")
+
+
+def main(argv: list[str] | None = None) -> None:
+    settings.load_env_file()
+    configure_logging()
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv or argv[0] not in (*COMMANDS, "-h", "--help"):
+        argv = ["run", *argv]
+    # Аргументы бенчмарка разбирает benchmarks.run
+    args, benchmark_argv = get_parser().parse_known_args(argv)
+    if args.command == "benchmark":
+        from benchmarks.run import main as run_benchmark
+
+        run_benchmark(benchmark_argv)
+        return
+    if benchmark_argv:
+        get_parser().error(f"unrecognized arguments: {' '.join(benchmark_argv)}")
+
+    start_time = datetime.now()
+    try:
+        if args.command == "run":
+            run(args)
+        elif args.command == "snapshot":
+            snapshot(args)
+        else:
+            dry_run(args)
+        metrics.set("run_success", 1)
+        logger.info("Finished in %s", datetime.now() - start_time)
+    except Exception as e:
+        metrics.set("run_success", 0)
+        logger.error(f"Error: {e}")
+        raise e
+    finally:
+        metrics.write_reports()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,48 +1,75 @@
-from typing import Any, Type
-
-from psycopg import Connection, connect
+from contextlib import AbstractContextManager
+from typing import TYPE_CHECKING, Any, Type
 
 from src.config.settings import settings
 
+if TYPE_CHECKING:
+    from psycopg import AsyncConnection, Connection
+    from psycopg_pool import ConnectionPool
+
 
 class DatabaseConnection:
-    def __init__(self):
-        self.connection: Connection | None = None
-        self.database_url: str = settings.DATABASE_URL
+    """
+    Connection pool created on first use, so building the connection
+    neither requires DATABASE_URL nor touches the database.
+    psycopg itself is imported only when the pool is opened.
+    """
+
+    def __init__(self, database_url: str | None = None):
+        self.database_url: str = database_url or settings.DATABASE_URL
+        self.pool: "ConnectionPool | None" = None
+
+    def get_database_url(self) -> str:
         if not self.database_url:
             raise ValueError("DATABASE_URL not found in environment variables")
+        return self.database_url
 
-    def connect(self) -> Connection:
-        """Connect to the database with reconnect support"""
-        if self.connection is None or self.connection.closed:
-            self.connection = connect(self.database_url)
-        return self.connection
+    def open(self) -> None:
+        """Open the pool, safe to call on an already open pool"""
+        if self.pool is None:
+            from psycopg_pool import ConnectionPool
 
-    def connect_with_transaction(self) -> Connection:
-        """Connect to the database with reconnect support and start a transaction"""
-        conn = self.connect()
-        conn.autocommit = False
-        return conn
+            self.pool = ConnectionPool(
+                self.get_database_url(),
+                min_size=settings.DATABASE_POOL_MIN_SIZE,
+                max_size=settings.DATABASE_POOL_MAX_SIZE,
+                open=False,
+            )
+        self.pool.open()
 
-    def close(self) -> None:
-        """Close the database connection"""
-        if self.connection is not None and not self.connection.closed:
-            self.connection.close()
-        self.connection = None
+    def connect(self) -> AbstractContextManager["Connection"]:
+        """
+        Borrow a connection from the pool.
+
+        The connection is returned to the pool on exit,
+        committing the transaction or rolling it back on error.
+        """
+        self.open()
+        return self.pool.connection()
 
-    def __enter__(self) -> Connection:
+    def connect_with_transaction(self) -> AbstractContextManager["Connection"]:
+        """Borrow a connection from the pool inside a transaction"""
         return self.connect()
 
+    async def connect_async(self) -> "AsyncConnection":
+        """Open a dedicated async connection, closed by the caller's async with"""
+        from psycopg import AsyncConnection
+
+        return await AsyncConnection.connect(self.get_database_url())
+
+    def close(self) -> None:
+        """Close the pool and all its connections"""
+        if self.pool is not None:
+            self.pool.close()
+
+    def __enter__(self) -> "DatabaseConnection":
+        self.open()
+        return self
+
     def __exit__(
         self,
         exc_type: Type[BaseException] | None,
         exc_val: BaseException | None,
         exc_tb: Any | None,
     ) -> None:
-        if self.connection is not None and not self.connection.closed:
-            if exc_type is not None and not self.connection.autocommit:
-                self.connection.rollback()
-            self.close()
-
-
-db = DatabaseConnection()
+        self.close()
@@ -8,3 +8,8 @@ logging.basicConfig(
     level=log_level,
     format="%(asctime)s - [%(name)s] - %(levelname)s - %(message)s",
 )
+
+
+def configure_logging() -> None:
+    """Apply DEBUG again, after an entry point has loaded .env"""
+    logging.getLogger().setLevel(logging.DEBUG if settings.DEBUG else logging.INFO)
@@ -0,0 +1,231 @@
+import cProfile
+import json
+import os
+import resource
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Generator, Iterable, TypeVar
+
+from src.config.logging import logging
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+PROMETHEUS_PREFIX = "aggregator_domain"
+
+T = TypeVar("T")
+
+# Маркер конца итератора в iter_stage
+STAGE_END = object()
+
+
+class StageMetrics:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.duration_seconds: float = 0.0
+        self.rows_in: int = 0
+        self.rows_out: int = 0
+        self.peak_rss_mb: float = 0.0
+        self.tracemalloc_peak_mb: float | None = None
+        self.top_allocations: list[str] = []
+
+    @property
+    def duration(self) -> timedelta:
+        return timedelta(seconds=self.duration_seconds)
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "duration_seconds": round(self.duration_seconds, 3),
+            "rows_in": self.rows_in,
+            "rows_out": self.rows_out,
+            "peak_rss_mb": self.peak_rss_mb,
+            "tracemalloc_peak_mb": self.tracemalloc_peak_mb,
+            "top_allocations": self.top_allocations,
+        }
+
+
+class Metrics:
+    """
+    Run metrics reported by the service and the repositories.
+
+    Stages record their duration, rows in and out and the process peak RSS.
+    A stage entered several times adds up, so work interleaved with other
+    stages, like a lazy stream read between batches of grouping, is timed
+    by entering its stage around each batch. The stage named in PROFILE_STAGE
+    is additionally profiled with cProfile or tracemalloc, depending on
+    PROFILER, in the main thread only.
+    """
+
+    def __init__(self) -> None:
+        self.stages: dict[str, StageMetrics] = {}
+        self.values: dict[str, float] = {}
+        self.profiles: dict[str, cProfile.Profile] = {}
+        self.started_at = time.time()
+
+    def get_stage(self, name: str) -> StageMetrics:
+        return self.stages.setdefault(name, StageMetrics(name))
+
+    @contextmanager
+    def stage(self, name: str) -> Generator[StageMetrics, None, None]:
+        stage_metrics = self.get_stage(name)
+        profiling = self.start_profile(name)
+        start_time = time.perf_counter()
+        try:
+            yield stage_metrics
+        finally:
+            stage_metrics.duration_seconds += time.perf_counter() - start_time
+            stage_metrics.peak_rss_mb = get_peak_rss_mb()
+            if profiling:
+                self.stop_profile(stage_metrics)
+
+    def iter_stage(self, name: str, iterable: Iterable[T]) -> Generator[T, None, None]:
+        """
+        Items of the iterable, with only the time spent producing them counted
+        into the stage. The consumer's work between items is left to its own stages.
+        """
+        iterator = iter(iterable)
+        try:
+            while True:
+                with self.stage(name):
+                    item = next(iterator, STAGE_END)
+                if item is STAGE_END:
+                    return
+                yield item
+        finally:
+            # Закрываем генератор сразу, если потребитель остановился раньше
+            close = getattr(iterator, "close", None)
+            if close is not None:
+                close()
+
+    def set(self, name: str, value: float) -> None:
+        self.values[name] = value
+
+    def add(self, name: str, value: float) -> None:
+        self.values[name] = self.values.get(name, 0) + value
+
+    def start_profile(self, name: str) -> bool:
+        if (
+            name != settings.PROFILE_STAGE
+            or threading.current_thread() is not threading.main_thread()
+        ):
+            return False
+        if settings.PROFILER == "tracemalloc":
+            tracemalloc.start()
+        else:
+            # Один профиль на этап: входы в этап накапливаются в нем
+            self.profiles.setdefault(name, cProfile.Profile()).enable()
+        return True
+
+    def stop_profile(self, stage_metrics: StageMetrics) -> None:
+        profile = self.profiles.get(stage_metrics.name)
+        if profile is not None:
+            profile.disable()
+        elif tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot()
+            peak_mb = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+            tracemalloc.stop()
+            if peak_mb >= (stage_metrics.tracemalloc_peak_mb or 0):
+                stage_metrics.tracemalloc_peak_mb = peak_mb
+                stage_metrics.top_allocations = [
+                    str(statistic) for statistic in snapshot.statistics("lineno")[:10]
+                ]
+
+    def write_profiles(self, directory: Path) -> None:
+        for name, profile in self.profiles.items():
+            profile_path = directory / f"{name}.prof"
+            profile.dump_stats(profile_path)
+            logger.info(f"Saved profile of {name} to {profile_path}")
+
+    def as_dict(self) -> dict[str, Any]:
+        return {
+            "started_at": self.started_at,
+            "duration_seconds": round(time.time() - self.started_at, 3),
+            "peak_rss_mb": get_peak_rss_mb(),
+            "stages": {
+                name: stage_metrics.as_dict()
+                for name, stage_metrics in self.stages.items()
+            },
+            "values": self.values,
+        }
+
+    def to_prometheus(self) -> str:
+        report = self.as_dict()
+        lines: list[str] = []
+
+        def add_metric(name: str, help_text: str, samples: list[tuple[str, float]]):
+            metric_name = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric_name} {help_text}")
+            lines.append(f"# TYPE {metric_name} gauge")
+            for labels, value in samples:
+                lines.append(f"{metric_name}{labels} {value}")
+
+        add_metric(
+            "run_started_timestamp_seconds",
+            "Start time of the run",
+            [("", report["started_at"])],
+        )
+        add_metric(
+            "run_duration_seconds",
+            "Duration of the run",
+            [("", report["duration_seconds"])],
+        )
+        add_metric(
+            "peak_rss_megabytes", "Peak RSS of the run", [("", report["peak_rss_mb"])]
+        )
+        for field, help_text in (
+            ("duration_seconds", "Duration of the stage"),
+            ("rows_in", "Rows read by the stage"),
+            ("rows_out", "Rows produced by the stage"),
+            ("peak_rss_mb", "Peak RSS at the end of the stage"),
+        ):
+            add_metric(
+                f"stage_{field}",
+                help_text,
+                [
+                    (f'{{stage="{name}"}}', stage[field])
+                    for name, stage in report["stages"].items()
+                ],
+            )
+        for name, value in self.values.items():
+            add_metric(name, name.replace("_", " ").capitalize(), [("", value)])
+        return "\n".join(lines) + "\n"
+
+    def write_reports(self, metrics_dir: str | None = None) -> None:
+        """
+        Write metrics.json, a Prometheus textfile aggregator_domain.prom
+        and the cProfile profile of PROFILE_STAGE
+        """
+        metrics_dir = metrics_dir or settings.METRICS_DIR
+        if not metrics_dir:
+            return
+        directory = Path(metrics_dir)
+        directory.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            directory / "metrics.json",
+            json.dumps(self.as_dict(), ensure_ascii=False, indent=2),
+        )
+        write_atomic(directory / f"{PROMETHEUS_PREFIX}.prom", self.to_prometheus())
+        self.write_profiles(directory)
+        logger.info(f"Wrote metrics to {directory}")
+
+
+def get_peak_rss_mb() -> float:
+    # ru_maxrss в килобайтах на Linux
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def write_atomic(path: Path, content: str | bytes) -> None:
+    """Write through a temporary file, so readers never see a partial file"""
+    temporary_path = path.with_name(f".{path.name}.tmp")
+    if isinstance(content, bytes):
+        temporary_path.write_bytes(content)
+    else:
+        temporary_path.write_text(content)
+    os.replace(temporary_path, path)
+
+
+metrics = Metrics()
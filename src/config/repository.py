@@ -1,7 +1,23 @@
-from typing import Any, Generator, NamedTuple, Protocol, Type, TypeVar
+from contextlib import AbstractContextManager
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Generator,
+    Iterable,
+    NamedTuple,
+    Protocol,
+    Type,
+    TypeVar,
+)
 
 from src.meta.models import SocialMedia
-from src.organization_cards.models import OrganizationCard
+from src.organization_cards.models import (
+    OrganizationCard,
+    OrganizationCardRow,
+    SourceOrganizationCard,
+)
 
 from .database import DatabaseConnection
 
@@ -28,7 +44,36 @@ class RepositoryBase:
 class RepositoryProtocol(Protocol):
     """Base class for all repositories."""
 
-    def stream_organization_cards(self) -> Generator[OrganizationCard, None, None]:
+    source_id: int
+
+    def stream_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        readers: int = 1,
+    ) -> Generator[OrganizationCardRow, None, None]:
+        raise NotImplementedError
+
+    def stream_organization_card_batches(
+        self, after_card_id: int = 0, until_card_id: int | None = None
+    ) -> AsyncGenerator[list[OrganizationCard], None]:
+        raise NotImplementedError
+
+    def get_max_organization_card_id(self) -> int | None:
+        raise NotImplementedError
+
+    def for_source(self, source_id: int) -> "RepositoryProtocol":
+        raise NotImplementedError
+
+    def stream_source_organization_cards(
+        self,
+        source_ids: list[int],
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+    ) -> Generator[SourceOrganizationCard, None, None]:
+        raise NotImplementedError
+
+    def get_max_source_organization_card_id(self, source_ids: list[int]) -> int | None:
         raise NotImplementedError
 
     def get_social_medias(self) -> list[SocialMedia]:
@@ -40,5 +85,36 @@ class RepositoryProtocol(Protocol):
     def get_stop_words(self) -> list[str]:
         raise NotImplementedError
 
-    def insert_aggregate_domains(self, aggregate_domains: list[NamedTuple]) -> None:
+    def insert_aggregate_domains(self, aggregate_domains: Iterable[NamedTuple]) -> None:
+        raise NotImplementedError
+
+    def write_aggregate_domains(
+        self, last_card_id: int | None
+    ) -> AbstractContextManager[Callable[[Iterable[NamedTuple]], None]]:
+        raise NotImplementedError
+
+    def write_aggregate_domains_delta(
+        self, last_card_id: int | None
+    ) -> AbstractContextManager[Callable[[Iterable[NamedTuple]], None]]:
+        raise NotImplementedError
+
+    async def insert_aggregate_domain_batches(
+        self,
+        aggregate_domain_batches: AsyncIterable[list[NamedTuple]],
+        last_card_id: int | None,
+    ) -> None:
+        raise NotImplementedError
+
+    def get_aggregator_domains(self) -> list[str]:
+        raise NotImplementedError
+
+    def get_aggregate_domain_names(self, domains: list[str]) -> dict[str, list[str]]:
+        raise NotImplementedError
+
+    def upsert_aggregate_domains(
+        self, aggregate_domains: list[NamedTuple], last_card_id: int
+    ) -> None:
+        raise NotImplementedError
+
+    def get_aggregate_domains_watermark(self) -> int | None:
         raise NotImplementedError
@@ -1,13 +1,106 @@
 import os
 
-from dotenv import load_dotenv
 
-load_dotenv()
+class Settings:
+    """
+    Settings read from the environment. Entry points call load_env_file
+    to add the variables of .env, importing the module does not read it.
+    """
 
+    def __init__(self) -> None:
+        self.read()
 
-class Settings:
-    DEBUG: bool = os.getenv("DEBUG", "False") == "True"
-    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    def read(self) -> None:
+        self.DEBUG: bool = os.getenv("DEBUG", "False") == "True"
+        self.DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+        self.DATABASE_POOL_MIN_SIZE: int = int(os.getenv("DATABASE_POOL_MIN_SIZE", "1"))
+        self.DATABASE_POOL_MAX_SIZE: int = int(os.getenv("DATABASE_POOL_MAX_SIZE", "8"))
+        self.SOURCE_ID: int = int(os.getenv("SOURCE_ID", "20"))
+        # Id источников через запятую: несколько источников считаются за одно чтение карточек,
+        # каждый в свою таблицу результатов
+        self.SOURCE_IDS: list[int] = [
+            int(source_id)
+            for source_id in os.getenv("SOURCE_IDS", "").split(",")
+            if source_id.strip()
+        ] or [self.SOURCE_ID]
+        # Id стран через запятую, пусто — карточки всех стран
+        self.COUNTRY_CODE_IDS: list[int] = [
+            int(country_code_id)
+            for country_code_id in os.getenv("COUNTRY_CODE_IDS", "").split(",")
+            if country_code_id.strip()
+        ]
+        self.METRICS_DIR: str = os.getenv("METRICS_DIR", "")
+        # Этап, для которого снимается профиль, и профилировщик: cprofile или tracemalloc
+        self.PROFILE_STAGE: str = os.getenv("PROFILE_STAGE", "")
+        self.PROFILER: str = os.getenv("PROFILER", "cprofile")
+        # cursor — серверный курсор и модели OrganizationCard, copy — COPY TO STDOUT (FORMAT BINARY)
+        self.CARD_READER: str = os.getenv("CARD_READER", "cursor")
+        # Число параллельных читателей диапазонов oc.id
+        self.CARD_READERS: int = int(os.getenv("CARD_READERS", "1"))
+        # Снимок топ-категорий: путь к JSON-файлу (пусто — без кэша),
+        # срок жизни в часах и принудительное обновление
+        self.TOP_CATEGORIES_CACHE_PATH: str = os.getenv("TOP_CATEGORIES_CACHE_PATH", "")
+        self.TOP_CATEGORIES_CACHE_TTL_HOURS: float = float(
+            os.getenv("TOP_CATEGORIES_CACHE_TTL_HOURS", "168")
+        )
+        self.TOP_CATEGORIES_REFRESH: bool = (
+            os.getenv("TOP_CATEGORIES_REFRESH", "False") == "True"
+        )
+        self.TOKENIZER_CACHE_SIZE: int = int(
+            os.getenv("TOKENIZER_CACHE_SIZE", "100000")
+        )
+        self.DOMAIN_CACHE_SIZE: int = int(os.getenv("DOMAIN_CACHE_SIZE", "1000000"))
+        self.PUBLIC_SUFFIX_LIST_PATH: str = os.getenv("PUBLIC_SUFFIX_LIST_PATH", "")
+        # python — списки строк по доменам, encoded — словарное кодирование названий и слов,
+        # numpy — признаки всех доменов сразу на массивах numpy
+        self.AGGREGATION_ENGINE: str = os.getenv("AGGREGATION_ENGINE", "python")
+        self.AGGREGATION_WORKERS: int = int(os.getenv("AGGREGATION_WORKERS", "1"))
+        self.AGGREGATION_BATCH_SIZE: int = int(
+            os.getenv("AGGREGATION_BATCH_SIZE", "100000")
+        )
+        # Массивы названий и первых слов в результатах: all — для всех доменов,
+        # candidates — только для агрегаторов, none — не записываются
+        self.OUTPUT_ARRAYS: str = os.getenv("OUTPUT_ARRAYS", "all")
+        self.SPILL_MEMORY_BUDGET_MB: int = int(os.getenv("SPILL_MEMORY_BUDGET_MB", "0"))
+        self.SPILL_PARTITIONS: int = int(os.getenv("SPILL_PARTITIONS", "64"))
+        self.SPILL_DIR: str = os.getenv("SPILL_DIR", "")
+        # Приближенный режим для доменов с числом названий от APPROXIMATE_MIN_NAMES, 0 — выключен
+        self.APPROXIMATE_MIN_NAMES: int = int(os.getenv("APPROXIMATE_MIN_NAMES", "0"))
+        self.APPROXIMATE_SAMPLE_SIZE: int = int(
+            os.getenv("APPROXIMATE_SAMPLE_SIZE", "1000")
+        )
+        self.APPROXIMATE_HLL_PRECISION: int = int(
+            os.getenv("APPROXIMATE_HLL_PRECISION", "14")
+        )
+        self.APPROXIMATE_KEYWORD_COUNTERS: int = int(
+            os.getenv("APPROXIMATE_KEYWORD_COUNTERS", "1000")
+        )
+        self.ASYNC_PIPELINE: bool = os.getenv("ASYNC_PIPELINE", "False") == "True"
+        self.PIPELINE_QUEUE_SIZE: int = int(os.getenv("PIPELINE_QUEUE_SIZE", "4"))
+        self.PIPELINE_BATCH_SIZE: int = int(os.getenv("PIPELINE_BATCH_SIZE", "50000"))
+        # Каталог контрольных точек полного пересчета, пусто — без контрольных точек
+        self.CHECKPOINT_DIR: str = os.getenv("CHECKPOINT_DIR", "")
+        self.CHECKPOINT_INTERVAL: int = int(os.getenv("CHECKPOINT_INTERVAL", "1000000"))
+        # Приемники результатов через запятую: postgres, parquet, jsonl. Пути файлов
+        # могут содержать {source_id}
+        self.RESULT_SINKS: list[str] = [
+            sink_name.strip()
+            for sink_name in os.getenv("RESULT_SINKS", "postgres").split(",")
+            if sink_name.strip()
+        ]
+        # replace — таблица пересобирается целиком, delta — пишутся только изменившиеся домены
+        self.WRITE_MODE: str = os.getenv("WRITE_MODE", "replace")
+        self.RESULT_PARQUET_PATH: str = os.getenv("RESULT_PARQUET_PATH", "")
+        self.RESULT_JSONL_PATH: str = os.getenv("RESULT_JSONL_PATH", "")
+        self.RESULT_BATCH_SIZE: int = int(os.getenv("RESULT_BATCH_SIZE", "50000"))
+        self.INCREMENTAL: bool = os.getenv("INCREMENTAL", "False") == "True"
+
+    def load_env_file(self) -> None:
+        """Load .env into the environment, without overriding it, and read again"""
+        from dotenv import load_dotenv
+
+        load_dotenv()
+        self.read()
 
 
 settings = Settings()
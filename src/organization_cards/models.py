@@ -5,3 +5,20 @@ class OrganizationCard(NamedTuple):
     id: int
     organization_name: str
     link: str
+
+
+class SourceOrganizationCard(NamedTuple):
+    source_id: int
+    id: int
+    organization_name: str
+    link: str
+
+
+# Строка карточки без NamedTuple: id, название организации, ссылка
+OrganizationCardRow = tuple[int, str, str]
+
+
+class OrganizationCardColumns(NamedTuple):
+    ids: list[int]
+    organization_names: list[str]
+    links: list[str]
@@ -1,66 +1,702 @@
-from datetime import datetime
-from typing import Generator, NamedTuple
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from hashlib import blake2b
+from itertools import batched
+from typing import (
+    Any,
+    AsyncGenerator,
+    AsyncIterable,
+    Callable,
+    Generator,
+    Iterable,
+    NamedTuple,
+)
 
 from psycopg.rows import scalar_row
 
 import src.organization_cards.sql as sql
+from src.config.database import DatabaseConnection
 from src.config.logging import logging
+from src.config.metrics import metrics
 from src.config.repository import RepositoryBase
+from src.config.settings import settings
 
-from .models import OrganizationCard
+from .models import (
+    OrganizationCard,
+    OrganizationCardColumns,
+    OrganizationCardRow,
+    SourceOrganizationCard,
+)
 
 logger = logging.getLogger(__name__)
 
+# Маркер завершения читателя диапазона
+READER_END = object()
+# Соединения пула, занятые справочниками, пока читатели диапазонов читают карточки
+RESERVED_CONNECTIONS = 3
+# Строк COPY, читаемых за один вход в этап потока карточек
+COPY_BATCH_SIZE = 10000
+
+
+def split_card_id_range(
+    after_card_id: int, until_card_id: int, parts: int
+) -> list[tuple[int, int]]:
+    """Split (after_card_id, until_card_id] into up to parts ranges of equal width"""
+    width = max((until_card_id - after_card_id + parts - 1) // parts, 1)
+    return [
+        (lower, min(lower + width, until_card_id))
+        for lower in range(after_card_id, until_card_id, width)
+    ]
+
+
+def get_content_hash(row: NamedTuple) -> int:
+    """
+    Signed 64-bit hash of the row for a BIGINT column. Lists are sorted first,
+    so the order of names, which depends on the card stream, does not matter.
+    """
+    content = repr(
+        tuple(sorted(value) if isinstance(value, list) else value for value in row)
+    )
+    return int.from_bytes(
+        blake2b(content.encode(), digest_size=8).digest(), "little", signed=True
+    )
+
 
 class OrganizationCardRepository(RepositoryBase):
+    def __init__(
+        self,
+        db: DatabaseConnection,
+        source_id: int | None = None,
+        country_code_ids: list[int] | None = None,
+    ) -> None:
+        super().__init__(db)
+        if source_id is None:
+            source_id = settings.SOURCE_ID
+        self.source_id = source_id
+        # Пустой список — карточки всех стран
+        self.country_code_ids = country_code_ids or settings.COUNTRY_CODE_IDS or None
+        self.table_name = sql.TABLE_NAME.format(source_id=source_id)
+        self.staging_table_name = sql.STAGING_TABLE_NAME.format(source_id=source_id)
+
+    def format_table_names(self, query: str) -> str:
+        return query.format(
+            table_name=self.table_name, staging_table_name=self.staging_table_name
+        )
+
+    def get_stream_params(
+        self, after_card_id: int, until_card_id: int | None
+    ) -> dict[str, Any]:
+        return {
+            "source_id": self.source_id,
+            "country_code_ids": self.country_code_ids,
+            "after_card_id": after_card_id,
+            "until_card_id": until_card_id,
+        }
+
     def stream_organization_cards(
-        self, fetch_size: int = 1000000
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        fetch_size: int = 1000000,
+        readers: int = 1,
+    ) -> Generator[OrganizationCardRow, None, None]:
+        """
+        Stream cards ordered by id with the reader chosen in CARD_READER:
+        OrganizationCard models from a server-side cursor, or plain
+        (id, organization_name, link) tuples from a binary COPY.
+
+        With more than one reader the id range is read in parallel
+        and the cards are no longer ordered by id.
+        """
+        if readers > 1 and until_card_id is not None:
+            return self.stream_organization_card_ranges(
+                after_card_id, until_card_id, readers
+            )
+        return self.read_organization_cards(after_card_id, until_card_id, fetch_size)
+
+    def read_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        fetch_size: int = 1000000,
+        stage_name: str = "stream_organization_cards",
+    ) -> Generator[OrganizationCardRow, None, None]:
+        if settings.CARD_READER == "copy":
+            return self.copy_organization_cards(
+                after_card_id, until_card_id, stage_name=stage_name
+            )
+        return self.fetch_organization_cards(
+            after_card_id, until_card_id, fetch_size, stage_name=stage_name
+        )
+
+    def fetch_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        fetch_size: int = 1000000,
+        stage_name: str = "stream_organization_cards",
     ) -> Generator[OrganizationCard, None, None]:
-        logger.info("Streaming organization cards")
-        start_time = datetime.now()
+        """
+        Stream cards from a server-side cursor. The stage counts only the time
+        spent in the database and fetching, not the consumer's work between batches.
+        """
+        logger.info(
+            f"Streaming organization cards with id in ({after_card_id}, {until_card_id}]"
+        )
+
+        stage = metrics.get_stage(stage_name)
+        for organization_cards in metrics.iter_stage(
+            stage_name,
+            self.fetch_organization_card_batches(
+                after_card_id, until_card_id, fetch_size
+            ),
+        ):
+            stage.rows_out += len(organization_cards)
+            yield from organization_cards
 
+        logger.info(f"Streamed {stage.rows_out} organization cards in {stage.duration}")
+
+    def fetch_organization_card_batches(
+        self, after_card_id: int, until_card_id: int | None, fetch_size: int
+    ) -> Generator[list[OrganizationCard], None, None]:
         with self.db.connect() as conn:
             with conn.cursor(
                 name="org_stream", row_factory=self.row_factory(OrganizationCard)
             ) as cursor:
-                cursor.execute(sql.GET_ORGANIZATION_CARDS_STREAM)
+                cursor.execute(
+                    sql.GET_ORGANIZATION_CARDS_STREAM,
+                    self.get_stream_params(after_card_id, until_card_id),
+                )
+                while organization_cards := cursor.fetchmany(fetch_size):
+                    yield organization_cards
+
+    def copy_organization_cards(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        stage_name: str = "stream_organization_cards",
+    ) -> Generator[OrganizationCardRow, None, None]:
+        """
+        Stream cards through COPY TO STDOUT in binary format.
+
+        Rows are decoded by the typed binary loaders straight into tuples,
+        without a row factory call per row. The stage counts only the time
+        spent reading and decoding COPY_BATCH_SIZE rows at a time.
+        """
+        logger.info(
+            f"Copying organization cards with id in ({after_card_id}, {until_card_id}]"
+        )
+
+        stage = metrics.get_stage(stage_name)
+        for organization_cards in metrics.iter_stage(
+            stage_name,
+            self.copy_organization_card_batches(after_card_id, until_card_id),
+        ):
+            stage.rows_out += len(organization_cards)
+            yield from organization_cards
+
+        logger.info(f"Copied {stage.rows_out} organization cards in {stage.duration}")
+
+    def copy_organization_card_batches(
+        self, after_card_id: int, until_card_id: int | None
+    ) -> Generator[tuple[OrganizationCardRow, ...], None, None]:
+        with self.db.connect() as conn:
+            with conn.cursor() as cursor:
+                with cursor.copy(
+                    sql.COPY_ORGANIZATION_CARDS_STREAM,
+                    self.get_stream_params(after_card_id, until_card_id),
+                ) as copy:
+                    copy.set_types(sql.ORGANIZATION_CARDS_COPY_TYPES)
+                    yield from batched(copy.rows(), COPY_BATCH_SIZE)
+
+    def copy_organization_card_columns(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        chunk_size: int = 100000,
+    ) -> Generator[OrganizationCardColumns, None, None]:
+        """Same as copy_organization_cards, in column chunks of up to chunk_size cards"""
+        columns = OrganizationCardColumns([], [], [])
+        for (
+            organization_card_id,
+            organization_name,
+            link,
+        ) in self.copy_organization_cards(after_card_id, until_card_id):
+            columns.ids.append(organization_card_id)
+            columns.organization_names.append(organization_name)
+            columns.links.append(link)
+            if len(columns.ids) >= chunk_size:
+                yield columns
+                columns = OrganizationCardColumns([], [], [])
+        if columns.ids:
+            yield columns
+
+    def stream_organization_card_ranges(
+        self,
+        after_card_id: int,
+        until_card_id: int,
+        readers: int,
+        batch_size: int = 10000,
+    ) -> Generator[OrganizationCardRow, None, None]:
+        """
+        Read the id range as keyset ranges in parallel, one pooled connection per range.
+        Readers are capped so that they fit the pool next to RESERVED_CONNECTIONS.
+
+        Readers put batches of whole cards into a shared bounded queue, so all rows
+        of a card stay together, but cards of different ranges are interleaved.
+        The readers' fetch time adds up in read_organization_card_ranges, while
+        stream_organization_card_ranges is the wall-clock time the consumer
+        waited for the next batch.
+        """
+        max_readers = max(settings.DATABASE_POOL_MAX_SIZE - RESERVED_CONNECTIONS, 1)
+        if readers > max_readers:
+            # Лишние читатели ждали бы свободного соединения и упирались в таймаут пула
+            logger.warning(
+                f"CARD_READERS={readers} does not fit DATABASE_POOL_MAX_SIZE="
+                f"{settings.DATABASE_POOL_MAX_SIZE}, using {max_readers} readers"
+            )
+            readers = max_readers
+        min_card_id: int | None = self.get_min_organization_card_id(after_card_id)
+        if min_card_id is None or min_card_id > until_card_id:
+            return
+        card_id_ranges = split_card_id_range(min_card_id - 1, until_card_id, readers)
+        logger.info(
+            f"Reading organization cards with {len(card_id_ranges)} readers: {card_id_ranges}"
+        )
+
+        card_batches: queue.Queue = queue.Queue(maxsize=len(card_id_ranges) * 4)
+        stopped = threading.Event()
+
+        def read_range(card_id_range: tuple[int, int]) -> None:
+            try:
+                organization_cards: list[OrganizationCardRow] = []
+                for organization_card in self.read_organization_cards(
+                    *card_id_range, stage_name="read_organization_card_ranges"
+                ):
+                    if stopped.is_set():
+                        return
+                    if (
+                        len(organization_cards) >= batch_size
+                        and organization_card[0] != organization_cards[-1][0]
+                    ):
+                        card_batches.put(organization_cards)
+                        organization_cards = []
+                    organization_cards.append(organization_card)
+                card_batches.put(organization_cards)
+                card_batches.put(READER_END)
+            except BaseException as error:
+                card_batches.put(error)
+
+        def iter_card_batches() -> Generator[list[OrganizationCardRow], None, None]:
+            running_readers = len(card_id_ranges)
+            while running_readers:
+                organization_cards = card_batches.get()
+                if organization_cards is READER_END:
+                    running_readers -= 1
+                    continue
+                if isinstance(organization_cards, BaseException):
+                    raise organization_cards
+                yield organization_cards
+
+        stage = metrics.get_stage("stream_organization_card_ranges")
+        with ThreadPoolExecutor(max_workers=len(card_id_ranges)) as executor:
+            futures = [
+                executor.submit(read_range, card_id_range)
+                for card_id_range in card_id_ranges
+            ]
+            try:
+                for organization_cards in metrics.iter_stage(
+                    "stream_organization_card_ranges", iter_card_batches()
+                ):
+                    stage.rows_out += len(organization_cards)
+                    yield from organization_cards
+            finally:
+                stopped.set()
+                # Освобождаем читателей, ждущих места в очереди
+                while not all(future.done() for future in futures):
+                    try:
+                        card_batches.get(timeout=0.1)
+                    except queue.Empty:
+                        pass
+        logger.info(f"Read {stage.rows_out} organization cards in {stage.duration}")
+
+    def stream_source_organization_cards(
+        self,
+        source_ids: list[int],
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        fetch_size: int = 1000000,
+    ) -> Generator[SourceOrganizationCard, None, None]:
+        """Stream cards of several sources in one scan, ordered by id"""
+        logger.info(
+            f"Streaming organization cards of sources {source_ids} "
+            f"with id in ({after_card_id}, {until_card_id}]"
+        )
+
+        stage = metrics.get_stage("stream_organization_cards")
+        for source_organization_cards in metrics.iter_stage(
+            "stream_organization_cards",
+            self.fetch_source_organization_card_batches(
+                source_ids, after_card_id, until_card_id, fetch_size
+            ),
+        ):
+            stage.rows_out += len(source_organization_cards)
+            yield from source_organization_cards
+
+        logger.info(f"Streamed {stage.rows_out} organization cards in {stage.duration}")
+
+    def fetch_source_organization_card_batches(
+        self,
+        source_ids: list[int],
+        after_card_id: int,
+        until_card_id: int | None,
+        fetch_size: int,
+    ) -> Generator[list[SourceOrganizationCard], None, None]:
+        with self.db.connect() as conn:
+            with conn.cursor(
+                name="org_stream_sources",
+                row_factory=self.row_factory(SourceOrganizationCard),
+            ) as cursor:
+                cursor.execute(
+                    sql.GET_SOURCE_ORGANIZATION_CARDS_STREAM,
+                    {
+                        **self.get_stream_params(after_card_id, until_card_id),
+                        "source_ids": source_ids,
+                    },
+                )
+                while source_organization_cards := cursor.fetchmany(fetch_size):
+                    yield source_organization_cards
+
+    async def stream_organization_card_batches(
+        self,
+        after_card_id: int = 0,
+        until_card_id: int | None = None,
+        fetch_size: int = 100000,
+    ) -> AsyncGenerator[list[OrganizationCard], None]:
+        """
+        Async variant of stream_organization_cards, yielding whole fetched batches.
+        The stage counts only the awaited fetches.
+        """
+        logger.info(
+            f"Streaming organization card batches with id in ({after_card_id}, {until_card_id}]"
+        )
+
+        stage = metrics.get_stage("stream_organization_cards")
+        async with await self.db.connect_async() as conn:
+            async with conn.cursor(
+                name="org_stream_async",
+                row_factory=self.row_factory(OrganizationCard),
+            ) as cursor:
+                with metrics.stage("stream_organization_cards"):
+                    await cursor.execute(
+                        sql.GET_ORGANIZATION_CARDS_STREAM,
+                        self.get_stream_params(after_card_id, until_card_id),
+                    )
                 while True:
-                    stream_organization_cards = cursor.fetchmany(fetch_size)
-                    if not stream_organization_cards:
+                    with metrics.stage("stream_organization_cards"):
+                        organization_cards = await cursor.fetchmany(fetch_size)
+                    if not organization_cards:
                         break
-                    for organization_cards in stream_organization_cards:
-                        yield organization_cards
+                    stage.rows_out += len(organization_cards)
+                    yield organization_cards
 
-        logger.info(f"Streamed organization cards in {datetime.now() - start_time}")
+        logger.info(f"Streamed {stage.rows_out} organization cards in {stage.duration}")
 
-    def get_top_source_categories(self) -> list[str]:
-        logger.info("Getting top source categories")
-        start_time = datetime.now()
+    def get_min_organization_card_id(self, after_card_id: int = 0) -> int | None:
+        with self.db.connect() as conn:
+            with conn.cursor(row_factory=scalar_row) as cursor:
+                cursor.execute(
+                    sql.GET_MIN_ORGANIZATION_CARD_ID,
+                    {"source_id": self.source_id, "after_card_id": after_card_id},
+                )
+                return cursor.fetchone()
+
+    def get_max_organization_card_id(self) -> int | None:
+        with self.db.connect() as conn:
+            with conn.cursor(row_factory=scalar_row) as cursor:
+                cursor.execute(
+                    sql.GET_MAX_ORGANIZATION_CARD_ID, {"source_id": self.source_id}
+                )
+                return cursor.fetchone()
 
+    def get_max_source_organization_card_id(self, source_ids: list[int]) -> int | None:
         with self.db.connect() as conn:
             with conn.cursor(row_factory=scalar_row) as cursor:
-                cursor.execute(sql.GET_TOP_SOURCE_CATEGORIES)
-                top_source_categories = cursor.fetchall()
+                cursor.execute(
+                    sql.GET_MAX_SOURCE_ORGANIZATION_CARD_ID, {"source_ids": source_ids}
+                )
+                return cursor.fetchone()
+
+    def get_top_source_categories(self) -> list[str]:
+        logger.info("Getting top source categories")
+
+        with metrics.stage("get_top_source_categories") as stage:
+            with self.db.connect() as conn:
+                with conn.cursor(row_factory=scalar_row) as cursor:
+                    cursor.execute(sql.GET_TOP_SOURCE_CATEGORIES)
+                    top_source_categories = cursor.fetchall()
+            stage.rows_out = len(top_source_categories)
 
         logger.info(
-            f"Got {len(top_source_categories)} top source categories in {datetime.now() - start_time}"
+            f"Got {len(top_source_categories)} top source categories in {stage.duration}"
         )
         return top_source_categories
 
     def create_table_aggregate_domains(self) -> None:
         with self.db.connect() as conn:
             with conn.cursor() as cursor:
-                cursor.execute(sql.CREATE_TABLE_AGGREGATE_DOMAINS)
+                cursor.execute(
+                    self.format_table_names(sql.CREATE_TABLE_AGGREGATE_DOMAINS)
+                )
+
+    def insert_aggregate_domains(self, aggregate_domains: Iterable[NamedTuple]) -> None:
+        """
+        Load the aggregate domains through a staging table and swap it in.
 
-    def insert_aggregate_domains(self, aggregate_domains: list[NamedTuple]) -> None:
+        The domains are consumed lazily, so a generator is written without
+        materializing all rows in memory.
+        """
+        with self.write_aggregate_domains(None) as write:
+            write(aggregate_domains)
+
+    @contextmanager
+    def write_aggregate_domains(
+        self, last_card_id: int | None
+    ) -> Generator[Callable[[Iterable[NamedTuple]], None], None, None]:
+        """
+        Writer of aggregate domain batches into the staging table.
+
+        The table is swapped in and the watermark is moved when the block exits,
+        in one transaction, and an error inside the block rolls the whole write back.
+        """
         self.create_table_aggregate_domains()
-        logger.info(f"Inserting {len(aggregate_domains)} aggregate domains")
-        start_time = datetime.now()
+        self.create_table_aggregate_domains_watermarks()
+        logger.info("Inserting aggregate domains")
 
-        with self.db.connect_with_transaction() as conn:
-            with conn.cursor() as cursor:
-                cursor.executemany(sql.INSERT_AGGREGATE_DOMAINS, aggregate_domains)
+        # Этап считает подготовку, запись каждого пакета и замену таблицы,
+        # но не вычисление доменов между пакетами
+        stage = metrics.get_stage("insert_aggregate_domains")
+        with ExitStack() as transaction, ExitStack() as copying:
+            with metrics.stage("insert_aggregate_domains"):
+                conn = transaction.enter_context(self.db.connect_with_transaction())
+                cursor = transaction.enter_context(conn.cursor())
+                cursor.execute(
+                    self.format_table_names(sql.CREATE_TABLE_AGGREGATE_DOMAINS_STAGING)
+                )
+                copy = copying.enter_context(
+                    cursor.copy(
+                        self.format_table_names(sql.COPY_AGGREGATE_DOMAINS_STAGING)
+                    )
+                )
+                copy.set_types(sql.AGGREGATE_DOMAINS_COPY_TYPES)
+
+            def write(aggregate_domains: Iterable[NamedTuple]) -> None:
+                with metrics.stage("insert_aggregate_domains"):
+                    for aggregate_domain in aggregate_domains:
+                        copy.write_row(aggregate_domain)
+                        stage.rows_in += 1
+
+            yield write
+            with metrics.stage("insert_aggregate_domains"):
+                copying.close()
+                cursor.execute(
+                    self.format_table_names(
+                        sql.ADD_PRIMARY_KEY_AGGREGATE_DOMAINS_STAGING
+                    )
+                )
+                cursor.execute(
+                    self.format_table_names(sql.SWAP_AGGREGATE_DOMAINS_STAGING)
+                )
+                cursor.execute(*self.get_watermark_query(last_card_id))
+                transaction.close()
+
+        logger.info(f"Inserted {stage.rows_in} aggregate domains in {stage.duration}")
+
+    async def insert_aggregate_domain_batches(
+        self,
+        aggregate_domain_batches: AsyncIterable[list[NamedTuple]],
+        last_card_id: int | None,
+    ) -> None:
+        """
+        Async variant of insert_aggregate_domains.
+
+        Batches are copied as they arrive, and the watermark is moved
+        in the same transaction as the table swap.
+        """
+        logger.info("Inserting aggregate domain batches")
+
+        # Ожидание пакетов от конвейера не входит в этап
+        stage = metrics.get_stage("insert_aggregate_domains")
+        async with await self.db.connect_async() as conn:
+            async with conn.cursor() as cursor:
+                with metrics.stage("insert_aggregate_domains"):
+                    await cursor.execute(
+                        self.format_table_names(sql.CREATE_TABLE_AGGREGATE_DOMAINS)
+                    )
+                    await cursor.execute(sql.CREATE_TABLE_AGGREGATE_DOMAINS_WATERMARKS)
+                    await cursor.execute(
+                        self.format_table_names(
+                            sql.CREATE_TABLE_AGGREGATE_DOMAINS_STAGING
+                        )
+                    )
+                async with cursor.copy(
+                    self.format_table_names(sql.COPY_AGGREGATE_DOMAINS_STAGING)
+                ) as copy:
+                    copy.set_types(sql.AGGREGATE_DOMAINS_COPY_TYPES)
+                    async for aggregate_domains in aggregate_domain_batches:
+                        with metrics.stage("insert_aggregate_domains"):
+                            for aggregate_domain in aggregate_domains:
+                                await copy.write_row(aggregate_domain)
+                        stage.rows_in += len(aggregate_domains)
+                with metrics.stage("insert_aggregate_domains"):
+                    await cursor.execute(
+                        self.format_table_names(
+                            sql.ADD_PRIMARY_KEY_AGGREGATE_DOMAINS_STAGING
+                        )
+                    )
+                    await cursor.execute(
+                        self.format_table_names(sql.SWAP_AGGREGATE_DOMAINS_STAGING)
+                    )
+                    await cursor.execute(*self.get_watermark_query(last_card_id))
+
+        logger.info(f"Inserted {stage.rows_in} aggregate domains in {stage.duration}")
+
+    def get_aggregate_domain_names(self, domains: list[str]) -> dict[str, list[str]]:
+        logger.info(f"Getting stored organization names for {len(domains)} domains")
+
+        with metrics.stage("get_aggregate_domain_names") as stage:
+            with self.db.connect() as conn:
+                with conn.cursor() as cursor:
+                    cursor.execute(
+                        self.format_table_names(sql.GET_AGGREGATE_DOMAIN_NAMES),
+                        {"domains": domains},
+                    )
+                    aggregate_domain_names = dict(cursor.fetchall())
+            stage.rows_in = len(domains)
+            stage.rows_out = len(aggregate_domain_names)
 
         logger.info(
-            f"Inserted {len(aggregate_domains)} aggregate domains in {datetime.now() - start_time}"
+            f"Got stored organization names for {len(aggregate_domain_names)} domains in {stage.duration}"
         )
+        return aggregate_domain_names
+
+    def get_aggregator_domains(self) -> list[str]:
+        with metrics.stage("get_aggregator_domains") as stage:
+            with self.db.connect() as conn:
+                with conn.cursor(row_factory=scalar_row) as cursor:
+                    cursor.execute(self.format_table_names(sql.GET_AGGREGATOR_DOMAINS))
+                    aggregator_domains: list[str] = cursor.fetchall()
+            stage.rows_out = len(aggregator_domains)
+
+        logger.info(f"Got {stage.rows_out} aggregator domains in {stage.duration}")
+        return aggregator_domains
+
+    @contextmanager
+    def write_aggregate_domains_delta(
+        self, last_card_id: int | None
+    ) -> Generator[Callable[[Iterable[NamedTuple]], None], None, None]:
+        """
+        Writer that applies only the difference with the stored table.
+
+        Rows with their content hash are copied into a temporary table, and when
+        the block exits the database upserts the domains whose stored hash differs
+        and deletes the domains that were not written, in one transaction
+        with the watermark.
+        """
+        self.create_table_aggregate_domains()
+        self.create_table_aggregate_domains_watermarks()
+        logger.info("Writing aggregate domains delta")
+
+        stage = metrics.get_stage("write_aggregate_domains_delta")
+        with ExitStack() as transaction, ExitStack() as copying:
+            with metrics.stage("write_aggregate_domains_delta"):
+                conn = transaction.enter_context(self.db.connect_with_transaction())
+                cursor = transaction.enter_context(conn.cursor())
+                cursor.execute(
+                    self.format_table_names(sql.CREATE_TABLE_AGGREGATE_DOMAINS_DELTA)
+                )
+                copy = copying.enter_context(
+                    cursor.copy(sql.COPY_AGGREGATE_DOMAINS_DELTA)
+                )
+                copy.set_types(sql.AGGREGATE_DOMAINS_DELTA_COPY_TYPES)
+
+            def write(aggregate_domains: Iterable[NamedTuple]) -> None:
+                with metrics.stage("write_aggregate_domains_delta"):
+                    for aggregate_domain in aggregate_domains:
+                        copy.write_row(
+                            (*aggregate_domain, get_content_hash(aggregate_domain))
+                        )
+                        stage.rows_in += 1
+
+            yield write
+            with metrics.stage("write_aggregate_domains_delta"):
+                copying.close()
+                cursor.execute(sql.ANALYZE_AGGREGATE_DOMAINS_DELTA)
+                cursor.execute(
+                    self.format_table_names(sql.UPSERT_AGGREGATE_DOMAINS_DELTA)
+                )
+                upserted_count = cursor.rowcount
+                cursor.execute(
+                    self.format_table_names(sql.DELETE_AGGREGATE_DOMAINS_DELTA)
+                )
+                deleted_count = cursor.rowcount
+                cursor.execute(*self.get_watermark_query(last_card_id))
+                transaction.close()
+            stage.rows_out += upserted_count
+
+        metrics.set("aggregate_domains_upserted", upserted_count)
+        metrics.set("aggregate_domains_deleted", deleted_count)
+        logger.info(
+            f"Wrote aggregate domains delta in {stage.duration}: "
+            f"{upserted_count} upserted, {deleted_count} deleted, "
+            f"{stage.rows_in - upserted_count} unchanged"
+        )
+
+    def upsert_aggregate_domains(
+        self, aggregate_domains: list[NamedTuple], last_card_id: int
+    ) -> None:
+        """Upsert the recomputed domains and move the watermark in one transaction"""
+        self.create_table_aggregate_domains()
+        self.create_table_aggregate_domains_watermarks()
+        logger.info(f"Upserting {len(aggregate_domains)} aggregate domains")
+
+        with metrics.stage("upsert_aggregate_domains") as stage:
+            with self.db.connect_with_transaction() as conn:
+                with conn.cursor() as cursor:
+                    cursor.executemany(
+                        self.format_table_names(sql.UPSERT_AGGREGATE_DOMAINS),
+                        aggregate_domains,
+                    )
+                    cursor.execute(*self.get_watermark_query(last_card_id))
+            stage.rows_in = len(aggregate_domains)
+
+        logger.info(
+            f"Upserted {len(aggregate_domains)} aggregate domains in {stage.duration}"
+        )
+
+    def create_table_aggregate_domains_watermarks(self) -> None:
+        with self.db.connect() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute(sql.CREATE_TABLE_AGGREGATE_DOMAINS_WATERMARKS)
+
+    def get_aggregate_domains_watermark(self) -> int | None:
+        self.create_table_aggregate_domains_watermarks()
+        with self.db.connect() as conn:
+            with conn.cursor(row_factory=scalar_row) as cursor:
+                cursor.execute(
+                    sql.GET_AGGREGATE_DOMAINS_WATERMARK, {"table_name": self.table_name}
+                )
+                return cursor.fetchone()
+
+    def get_watermark_query(self, last_card_id: int | None) -> tuple[str, dict]:
+        """Query that moves the watermark, or removes it when last_card_id is None"""
+        if last_card_id is None:
+            return sql.DELETE_AGGREGATE_DOMAINS_WATERMARK, {
+                "table_name": self.table_name
+            }
+        return sql.SET_AGGREGATE_DOMAINS_WATERMARK, {
+            "table_name": self.table_name,
+            "last_card_id": last_card_id,
+        }
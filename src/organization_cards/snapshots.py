@@ -0,0 +1,75 @@
+import json
+import time
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+from src.config.logging import logging
+from src.config.metrics import metrics, write_atomic
+from src.config.settings import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TopSourceCategoriesSnapshot(NamedTuple):
+    version: int
+    created_at: float
+    top_source_categories: list[str]
+
+
+class TopSourceCategoriesCache:
+    """
+    Versioned snapshot of the top source categories in a local JSON file.
+
+    The categories query samples the table randomly, so reusing one snapshot
+    until it expires keeps the category filter the same across runs. Every
+    refresh increments the version, which is reported in the run metrics.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        ttl_hours: float | None = None,
+    ) -> None:
+        self.path = Path(path or settings.TOP_CATEGORIES_CACHE_PATH)
+        if ttl_hours is None:
+            ttl_hours = settings.TOP_CATEGORIES_CACHE_TTL_HOURS
+        self.ttl_seconds = ttl_hours * 3600
+
+    def load(self) -> TopSourceCategoriesSnapshot | None:
+        if not self.path.exists():
+            return None
+        return TopSourceCategoriesSnapshot(**json.loads(self.path.read_text()))
+
+    def is_fresh(self, snapshot: TopSourceCategoriesSnapshot) -> bool:
+        return time.time() - snapshot.created_at < self.ttl_seconds
+
+    def save(
+        self, top_source_categories: list[str], previous_version: int = 0
+    ) -> TopSourceCategoriesSnapshot:
+        snapshot = TopSourceCategoriesSnapshot(
+            version=previous_version + 1,
+            created_at=time.time(),
+            top_source_categories=top_source_categories,
+        )
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        write_atomic(
+            self.path, json.dumps(snapshot._asdict(), ensure_ascii=False, indent=2)
+        )
+        return snapshot
+
+    def get(self, compute: Callable[[], list[str]], refresh: bool = False) -> list[str]:
+        """Cached categories, computed again if missing, expired or refreshed"""
+        snapshot = self.load()
+        if snapshot is not None and not refresh and self.is_fresh(snapshot):
+            logger.info(
+                f"Using top source categories snapshot version {snapshot.version}"
+            )
+        else:
+            snapshot = self.save(
+                compute(), previous_version=snapshot.version if snapshot else 0
+            )
+            logger.info(
+                f"Saved top source categories snapshot version {snapshot.version}"
+            )
+        metrics.set("top_source_categories_version", snapshot.version)
+        return snapshot.top_source_categories
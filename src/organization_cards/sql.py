@@ -1,28 +1,102 @@
-GET_ORGANIZATION_CARDS_STREAM = """
-SELECT
-    oc.id,
-    oc.organization_name,
-    ou.link
-FROM
+# Общая часть потоков карточек. Страны проверяются через EXISTS, поэтому каждая пара
+# (карточка, ссылка) возвращается один раз; без фильтра по странам остаются, как и раньше,
+# только карточки хотя бы с одной страной
+ORGANIZATION_CARDS_STREAM_FROM = """FROM
     cards.organization_cards oc
 JOIN
     cards.organization_cards_original_urls ocou
     ON ocou.organization_card_id = oc.id
-JOIN
-    cards.organization_cards_country_code occc
-    ON occc.organization_card_id = oc.id
 JOIN
     meta.original_urls ou
-    ON ou.id = ocou.original_url_id
-WHERE 
-    oc.source_id = 20
-    -- Если нужно разметить только по странам
-    -- AND
-    -- occc.country_code_id = 140
+    ON ou.id = ocou.original_url_id"""
+
+ORGANIZATION_CARDS_STREAM_FILTERS = """    AND oc.id > %(after_card_id)s
+    AND (%(until_card_id)s::bigint IS NULL OR oc.id <= %(until_card_id)s)
+    AND EXISTS (
+        SELECT 1
+        FROM cards.organization_cards_country_code occc
+        WHERE
+            occc.organization_card_id = oc.id
+            AND (
+                %(country_code_ids)s::int[] IS NULL
+                OR occc.country_code_id = ANY(%(country_code_ids)s::int[])
+            )
+    )"""
+
+GET_ORGANIZATION_CARDS_STREAM = f"""
+SELECT
+    oc.id,
+    oc.organization_name,
+    ou.link
+{ORGANIZATION_CARDS_STREAM_FROM}
+WHERE
+    oc.source_id = %(source_id)s
+{ORGANIZATION_CARDS_STREAM_FILTERS}
 ORDER BY
     oc.id
 """
 
+# Карточки нескольких источников за один проход
+GET_SOURCE_ORGANIZATION_CARDS_STREAM = f"""
+SELECT
+    oc.source_id,
+    oc.id,
+    oc.organization_name,
+    ou.link
+{ORGANIZATION_CARDS_STREAM_FROM}
+WHERE
+    oc.source_id = ANY(%(source_ids)s::int[])
+{ORGANIZATION_CARDS_STREAM_FILTERS}
+ORDER BY
+    oc.id
+"""
+
+# Тот же запрос без подзапроса, ORDER BY относится к самому выводу COPY
+COPY_ORGANIZATION_CARDS_STREAM = f"""
+COPY (
+SELECT
+    oc.id::int8,
+    oc.organization_name::text,
+    ou.link::text
+{ORGANIZATION_CARDS_STREAM_FROM}
+WHERE
+    oc.source_id = %(source_id)s
+{ORGANIZATION_CARDS_STREAM_FILTERS}
+ORDER BY
+    oc.id
+) TO STDOUT (FORMAT BINARY)
+"""
+
+ORGANIZATION_CARDS_COPY_TYPES = ["int8", "text", "text"]
+
+GET_MIN_ORGANIZATION_CARD_ID = """
+SELECT
+    MIN(oc.id)
+FROM
+    cards.organization_cards oc
+WHERE
+    oc.source_id = %(source_id)s
+    AND oc.id > %(after_card_id)s
+"""
+
+GET_MAX_ORGANIZATION_CARD_ID = """
+SELECT
+    MAX(oc.id)
+FROM
+    cards.organization_cards oc
+WHERE
+    oc.source_id = %(source_id)s
+"""
+
+GET_MAX_SOURCE_ORGANIZATION_CARD_ID = """
+SELECT
+    MAX(oc.id)
+FROM
+    cards.organization_cards oc
+WHERE
+    oc.source_id = ANY(%(source_ids)s::int[])
+"""
+
 GET_TOP_SOURCE_CATEGORIES = """
 WITH CategoryFrequency AS (
     SELECT
@@ -57,10 +131,29 @@ JOIN meta.source_categories ON category = meta.source_categories.id
 ORDER BY category;
 """
 
-TABLE_NAME = "aggregate_domains_by_source_20"
+# Имена таблиц результатов зависят от источника, запросы ниже подставляют их через format
+TABLE_NAME = "aggregate_domains_by_source_{source_id}"
+STAGING_TABLE_NAME = "aggregate_domains_by_source_{source_id}_staging"
+
+AGGREGATE_DOMAINS_COLUMNS = """
+    domain,
+    organization_names,
+    organization_names_count,
+    organization_names_unique,
+    organization_names_unique_count,
+    first_word_of_names,
+    first_word_of_names_count,
+    first_word_of_names_unique,
+    first_word_of_names_unique_count,
+    unique_names_ratio,
+    unique_first_words_ratio,
+    keywords,
+    keyword_score,
+    is_aggregator
+"""
 
-CREATE_TABLE_AGGREGATE_DOMAINS = f"""
-CREATE TABLE IF NOT EXISTS brandmatch.{TABLE_NAME} (
+CREATE_TABLE_AGGREGATE_DOMAINS = """
+CREATE TABLE IF NOT EXISTS brandmatch.{table_name} (
     domain VARCHAR(255) PRIMARY KEY,
     organization_names TEXT[],
     organization_names_count INTEGER,
@@ -76,26 +169,185 @@ CREATE TABLE IF NOT EXISTS brandmatch.{TABLE_NAME} (
                                      -- Близко к 1 → первые слова часто повторяются (агрегатор), близко к 0 → разнообразие (бренд).
     keywords TEXT[],
     keyword_score FLOAT,
-    is_aggregator BOOLEAN DEFAULT FALSE  -- True, если домен является агрегатором (близость к 1 в unique_names_ratio и unique_first_words_ratio).
+    is_aggregator BOOLEAN DEFAULT FALSE,  -- True, если домен является агрегатором (близость к 1 в unique_names_ratio и unique_first_words_ratio).
+    content_hash BIGINT  -- Хэш содержимого строки для записи только изменений (WRITE_MODE=delta), NULL — неизвестен.
 );
+ALTER TABLE brandmatch.{table_name} ADD COLUMN IF NOT EXISTS content_hash BIGINT;
 """
 
-INSERT_AGGREGATE_DOMAINS = f"""
-INSERT INTO brandmatch.{TABLE_NAME} (
-    domain,
-    organization_names,
-    organization_names_count,
-    organization_names_unique,
-    organization_names_unique_count,
-    first_word_of_names,
-    first_word_of_names_count,
-    first_word_of_names_unique,
-    first_word_of_names_unique_count,
-    unique_names_ratio,
-    unique_first_words_ratio,
-    keywords,
-    keyword_score,
-    is_aggregator
-)
+# Staging-таблица создается без первичного ключа: индекс строится один раз после COPY
+CREATE_TABLE_AGGREGATE_DOMAINS_STAGING = """
+DROP TABLE IF EXISTS brandmatch.{staging_table_name};
+CREATE TABLE brandmatch.{staging_table_name} (
+    LIKE brandmatch.{table_name} INCLUDING DEFAULTS
+);
+"""
+
+COPY_AGGREGATE_DOMAINS_STAGING = f"""
+COPY brandmatch.{{staging_table_name}} ({AGGREGATE_DOMAINS_COLUMNS})
+FROM STDIN (FORMAT BINARY)
+"""
+
+# Типы колонок для бинарного COPY, в порядке COPY_AGGREGATE_DOMAINS_STAGING
+AGGREGATE_DOMAINS_COPY_TYPES = [
+    "varchar",
+    "text[]",
+    "int4",
+    "text[]",
+    "int4",
+    "text[]",
+    "int4",
+    "text[]",
+    "int4",
+    "float8",
+    "float8",
+    "text[]",
+    "float8",
+    "bool",
+]
+
+ADD_PRIMARY_KEY_AGGREGATE_DOMAINS_STAGING = """
+ALTER TABLE brandmatch.{staging_table_name} ADD PRIMARY KEY (domain);
+"""
+
+# Подмена таблицы в одной транзакции: читатели видят либо старую, либо новую таблицу целиком
+SWAP_AGGREGATE_DOMAINS_STAGING = """
+DROP TABLE IF EXISTS brandmatch.{table_name};
+ALTER TABLE brandmatch.{staging_table_name} RENAME TO {table_name};
+ALTER INDEX brandmatch.{staging_table_name}_pkey RENAME TO {table_name}_pkey;
+"""
+
+UPSERT_AGGREGATE_DOMAINS = f"""
+INSERT INTO brandmatch.{{table_name}} ({AGGREGATE_DOMAINS_COLUMNS})
 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+ON CONFLICT (domain) DO UPDATE SET
+    organization_names = EXCLUDED.organization_names,
+    organization_names_count = EXCLUDED.organization_names_count,
+    organization_names_unique = EXCLUDED.organization_names_unique,
+    organization_names_unique_count = EXCLUDED.organization_names_unique_count,
+    first_word_of_names = EXCLUDED.first_word_of_names,
+    first_word_of_names_count = EXCLUDED.first_word_of_names_count,
+    first_word_of_names_unique = EXCLUDED.first_word_of_names_unique,
+    first_word_of_names_unique_count = EXCLUDED.first_word_of_names_unique_count,
+    unique_names_ratio = EXCLUDED.unique_names_ratio,
+    unique_first_words_ratio = EXCLUDED.unique_first_words_ratio,
+    keywords = EXCLUDED.keywords,
+    keyword_score = EXCLUDED.keyword_score,
+    is_aggregator = EXCLUDED.is_aggregator,
+    content_hash = NULL
+"""
+
+GET_AGGREGATOR_DOMAINS = """
+SELECT
+    ad.domain
+FROM
+    brandmatch.{table_name} ad
+WHERE
+    ad.is_aggregator
+"""
+
+# Запись изменений: все строки с хэшем содержимого копируются во временную таблицу,
+# а сравнение с сохраненными хэшами и удаление исчезнувших доменов делает сама база
+AGGREGATE_DOMAINS_DELTA_TABLE_NAME = "aggregate_domains_delta"
+
+CREATE_TABLE_AGGREGATE_DOMAINS_DELTA = f"""
+CREATE TEMP TABLE {AGGREGATE_DOMAINS_DELTA_TABLE_NAME} (
+    LIKE brandmatch.{{table_name}} INCLUDING DEFAULTS
+) ON COMMIT DROP;
+"""
+
+COPY_AGGREGATE_DOMAINS_DELTA = f"""
+COPY {AGGREGATE_DOMAINS_DELTA_TABLE_NAME} ({AGGREGATE_DOMAINS_COLUMNS}, content_hash)
+FROM STDIN (FORMAT BINARY)
+"""
+
+AGGREGATE_DOMAINS_DELTA_COPY_TYPES = [*AGGREGATE_DOMAINS_COPY_TYPES, "int8"]
+
+ANALYZE_AGGREGATE_DOMAINS_DELTA = f"""
+ALTER TABLE {AGGREGATE_DOMAINS_DELTA_TABLE_NAME} ADD PRIMARY KEY (domain);
+ANALYZE {AGGREGATE_DOMAINS_DELTA_TABLE_NAME};
+"""
+
+# Только новые и изменившиеся домены: NULL в сохраненном хэше тоже считается изменением
+UPSERT_AGGREGATE_DOMAINS_DELTA = f"""
+INSERT INTO brandmatch.{{table_name}} ({AGGREGATE_DOMAINS_COLUMNS}, content_hash)
+SELECT{AGGREGATE_DOMAINS_COLUMNS}, content_hash
+FROM
+    {AGGREGATE_DOMAINS_DELTA_TABLE_NAME} delta
+WHERE
+    NOT EXISTS (
+        SELECT 1
+        FROM brandmatch.{{table_name}} ad
+        WHERE
+            ad.domain = delta.domain
+            AND ad.content_hash = delta.content_hash
+    )
+ON CONFLICT (domain) DO UPDATE SET
+    organization_names = EXCLUDED.organization_names,
+    organization_names_count = EXCLUDED.organization_names_count,
+    organization_names_unique = EXCLUDED.organization_names_unique,
+    organization_names_unique_count = EXCLUDED.organization_names_unique_count,
+    first_word_of_names = EXCLUDED.first_word_of_names,
+    first_word_of_names_count = EXCLUDED.first_word_of_names_count,
+    first_word_of_names_unique = EXCLUDED.first_word_of_names_unique,
+    first_word_of_names_unique_count = EXCLUDED.first_word_of_names_unique_count,
+    unique_names_ratio = EXCLUDED.unique_names_ratio,
+    unique_first_words_ratio = EXCLUDED.unique_first_words_ratio,
+    keywords = EXCLUDED.keywords,
+    keyword_score = EXCLUDED.keyword_score,
+    is_aggregator = EXCLUDED.is_aggregator,
+    content_hash = EXCLUDED.content_hash
+"""
+
+DELETE_AGGREGATE_DOMAINS_DELTA = f"""
+DELETE FROM brandmatch.{{table_name}} ad
+WHERE
+    NOT EXISTS (
+        SELECT 1
+        FROM {AGGREGATE_DOMAINS_DELTA_TABLE_NAME} delta
+        WHERE delta.domain = ad.domain
+    )
+"""
+
+GET_AGGREGATE_DOMAIN_NAMES = """
+SELECT
+    ad.domain,
+    ad.organization_names
+FROM
+    brandmatch.{table_name} ad
+WHERE
+    ad.domain = ANY(%(domains)s)
+"""
+
+# Последний обработанный id карточки для каждой таблицы результатов
+CREATE_TABLE_AGGREGATE_DOMAINS_WATERMARKS = """
+CREATE TABLE IF NOT EXISTS brandmatch.aggregate_domains_watermarks (
+    table_name VARCHAR(255) PRIMARY KEY,
+    last_card_id BIGINT NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
+"""
+
+GET_AGGREGATE_DOMAINS_WATERMARK = """
+SELECT
+    adw.last_card_id
+FROM
+    brandmatch.aggregate_domains_watermarks adw
+WHERE
+    adw.table_name = %(table_name)s
+"""
+
+SET_AGGREGATE_DOMAINS_WATERMARK = """
+INSERT INTO brandmatch.aggregate_domains_watermarks (table_name, last_card_id)
+VALUES (%(table_name)s, %(last_card_id)s)
+ON CONFLICT (table_name) DO UPDATE SET
+    last_card_id = EXCLUDED.last_card_id,
+    updated_at = now()
+"""
+
+# Таблица без всех названий доменов не может обновляться инкрементально
+DELETE_AGGREGATE_DOMAINS_WATERMARK = """
+DELETE FROM brandmatch.aggregate_domains_watermarks
+WHERE
+    table_name = %(table_name)s
 """
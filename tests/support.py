@@ -0,0 +1,79 @@
+from contextlib import contextmanager
+from typing import Any, Generator, Iterable, NamedTuple
+
+from benchmarks.generator import generate_organization_cards
+from benchmarks.repository import InMemoryRepository
+from src.aggregators.services import AggregatorService
+from src.config.settings import settings
+from src.meta.models import SocialMedia
+from src.organization_cards.models import OrganizationCard
+
+# Настройки одного последовательного запуска в памяти, независимо от окружения
+BASELINE_SETTINGS: dict[str, Any] = {
+    "SOURCE_IDS": [settings.SOURCE_ID],
+    "AGGREGATION_ENGINE": "python",
+    "AGGREGATION_WORKERS": 1,
+    "CARD_READERS": 1,
+    "OUTPUT_ARRAYS": "all",
+    "SPILL_MEMORY_BUDGET_MB": 0,
+    "APPROXIMATE_MIN_NAMES": 0,
+    "ASYNC_PIPELINE": False,
+    "CHECKPOINT_DIR": "",
+    "INCREMENTAL": False,
+    "RESULT_SINKS": ["postgres"],
+    "WRITE_MODE": "replace",
+    "TOP_CATEGORIES_CACHE_PATH": "",
+    "METRICS_DIR": "",
+    "PROFILE_STAGE": "",
+}
+
+
+@contextmanager
+def override_settings(**values: Any) -> Generator[None, None, None]:
+    previous_values = {name: getattr(settings, name) for name in values}
+    for name, value in values.items():
+        setattr(settings, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous_values.items():
+            setattr(settings, name, value)
+
+
+def generate_cards(
+    cards_count: int = 3000, domains_count: int = 150, seed: int = 0
+) -> list[OrganizationCard]:
+    return list(generate_organization_cards(cards_count, domains_count, seed=seed))
+
+
+def make_repository(organization_cards: list[OrganizationCard]) -> InMemoryRepository:
+    return InMemoryRepository(
+        organization_cards,
+        social_medias=[SocialMedia(1, "vk", "site0.example.ru")],
+        top_source_categories=["кафе", "ресторан", "аптека"],
+        stop_words=["ооо", "ип"],
+    )
+
+
+def aggregate(
+    repository: InMemoryRepository, resume: bool = False, **values: Any
+) -> dict[str, NamedTuple]:
+    """Run the service over the repository with the settings and return its table"""
+    with override_settings(**{**BASELINE_SETTINGS, **values}):
+        AggregatorService(repository=repository).get_aggregate_domains(resume=resume)
+    return repository.aggregate_domains
+
+
+def normalize(aggregate_domains: dict[str, NamedTuple]) -> dict[str, tuple]:
+    """Rows by domain with sorted lists, the order of names depends on the stream"""
+    return {
+        domain: normalize_row(aggregate_domain)
+        for domain, aggregate_domain in aggregate_domains.items()
+    }
+
+
+def normalize_row(aggregate_domain: Iterable[Any]) -> tuple:
+    return tuple(
+        sorted(value) if isinstance(value, list) else value
+        for value in aggregate_domain
+    )
@@ -0,0 +1,71 @@
+import unittest
+
+from src.config.metrics import metrics
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+MIN_NAMES = 50
+SAMPLE_SIZE = 20
+
+
+class ApproximateTest(unittest.TestCase):
+    def test_matches_exact_aggregation(self):
+        organization_cards = generate_cards(6000, 40)
+        baseline = aggregate(make_repository(organization_cards))
+
+        approximate = aggregate(
+            make_repository(organization_cards),
+            APPROXIMATE_MIN_NAMES=MIN_NAMES,
+            APPROXIMATE_SAMPLE_SIZE=SAMPLE_SIZE,
+        )
+
+        self.assertGreater(metrics.values["approximate_domains"], 0)
+        self.assertEqual(approximate.keys(), baseline.keys())
+        for domain, exact_domain in baseline.items():
+            approximate_domain = approximate[domain]
+            if exact_domain.organization_names_count < MIN_NAMES:
+                self.assertEqual(approximate_domain, exact_domain)
+                continue
+            with self.subTest(domain=domain):
+                # Количества точные, уникальные — оценка HyperLogLog
+                self.assertEqual(
+                    approximate_domain.organization_names_count,
+                    exact_domain.organization_names_count,
+                )
+                self.assertEqual(
+                    approximate_domain.first_word_of_names_count,
+                    exact_domain.first_word_of_names_count,
+                )
+                self.assertAlmostEqual(
+                    approximate_domain.organization_names_unique_count,
+                    exact_domain.organization_names_unique_count,
+                    delta=exact_domain.organization_names_unique_count * 0.03,
+                )
+                self.assertEqual(
+                    approximate_domain.is_aggregator, exact_domain.is_aggregator
+                )
+                self.assertAlmostEqual(
+                    approximate_domain.keyword_score, exact_domain.keyword_score
+                )
+                # Массивы — выборка названий домена размером APPROXIMATE_SAMPLE_SIZE
+                self.assertEqual(
+                    len(approximate_domain.organization_names), SAMPLE_SIZE
+                )
+                self.assertLessEqual(
+                    set(approximate_domain.organization_names),
+                    set(exact_domain.organization_names),
+                )
+
+    def test_settings_are_read_at_run_time(self):
+        organization_cards = generate_cards(1000, 20)
+        baseline = aggregate(make_repository(organization_cards))
+
+        approximate = aggregate(
+            make_repository(organization_cards), APPROXIMATE_MIN_NAMES=100000
+        )
+
+        self.assertEqual(metrics.values["approximate_domains"], 0)
+        self.assertEqual(normalize(approximate), normalize(baseline))
+
+
+if __name__ == "__main__":
+    unittest.main()
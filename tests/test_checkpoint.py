@@ -0,0 +1,112 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.aggregators.checkpoint import Checkpoint
+from src.organization_cards.models import OrganizationCard
+from tests.support import (
+    aggregate,
+    generate_cards,
+    make_repository,
+    normalize,
+    override_settings,
+)
+
+
+def generate_multi_domain_cards() -> list[OrganizationCard]:
+    """Cards with a second url on another domain, so a card spans several rows"""
+    organization_cards: list[OrganizationCard] = []
+    for organization_card in generate_cards():
+        organization_cards.append(organization_card)
+        organization_cards.append(
+            organization_card._replace(
+                link=f"https://site{organization_card.id * 7 % 150}.example.ru/"
+            )
+        )
+    return organization_cards
+
+
+class CheckpointTest(unittest.TestCase):
+    def test_resume_after_crash_matches_full_run(self):
+        organization_cards = generate_multi_domain_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        repository = make_repository(organization_cards)
+        stream_organization_cards = repository.stream_organization_cards
+
+        def crash_mid_stream(*args, **kwargs):
+            for index, organization_card in enumerate(
+                stream_organization_cards(*args, **kwargs)
+            ):
+                if index == len(organization_cards) // 2:
+                    raise RuntimeError("connection lost")
+                yield organization_card
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            checkpoint_settings = {
+                "CHECKPOINT_DIR": checkpoint_dir,
+                # Нечетный интервал, чтобы граница пачки попадала внутрь карточки
+                "CHECKPOINT_INTERVAL": 101,
+            }
+            repository.stream_organization_cards = crash_mid_stream
+            with self.assertRaises(RuntimeError):
+                aggregate(repository, **checkpoint_settings)
+            state = Checkpoint(checkpoint_dir).load()
+            self.assertGreater(state.segments, 0)
+            self.assertFalse(state.computed)
+
+            repository.stream_organization_cards = stream_organization_cards
+            resumed = aggregate(repository, resume=True, **checkpoint_settings)
+            self.assertIsNone(Checkpoint(checkpoint_dir).load())
+
+        self.assertEqual(normalize(resumed), normalize(baseline))
+
+    def test_other_compute_modes_are_rejected(self):
+        repository = make_repository(generate_cards(100, 10))
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            for name, value in (
+                ("AGGREGATION_ENGINE", "numpy"),
+                ("AGGREGATION_WORKERS", 2),
+                ("SPILL_MEMORY_BUDGET_MB", 1),
+                ("APPROXIMATE_MIN_NAMES", 50),
+            ):
+                with self.subTest(name=name), self.assertRaises(ValueError):
+                    aggregate(
+                        repository, CHECKPOINT_DIR=checkpoint_dir, **{name: value}
+                    )
+
+    def test_resume_logs_why_there_is_nothing_to_resume(self):
+        repository = make_repository(generate_cards(100, 10))
+        aggregate(repository, INCREMENTAL=True)
+
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            with self.assertLogs("src.aggregators.services", "WARNING") as logs:
+                aggregate(
+                    repository,
+                    resume=True,
+                    CHECKPOINT_DIR=checkpoint_dir,
+                    INCREMENTAL=True,
+                )
+
+        self.assertIn(
+            "Nothing to resume: INCREMENTAL updates after card id", logs.output[0]
+        )
+
+    def test_clear_keeps_other_files(self):
+        with tempfile.TemporaryDirectory() as checkpoint_dir:
+            other_path = Path(checkpoint_dir) / "notes.txt"
+            other_path.write_text("keep")
+            checkpoint = Checkpoint(checkpoint_dir)
+            checkpoint.start(until_card_id=10)
+            checkpoint.clear()
+
+            self.assertEqual(list(Path(checkpoint_dir).iterdir()), [other_path])
+
+    def test_empty_directory_is_rejected(self):
+        with override_settings(CHECKPOINT_DIR=""):
+            with self.assertRaises(ValueError):
+                Checkpoint()
+
+
+if __name__ == "__main__":
+    unittest.main()
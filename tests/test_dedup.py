@@ -0,0 +1,35 @@
+import random
+import tempfile
+import unittest
+from pathlib import Path
+
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class StreamOrderTest(unittest.TestCase):
+    def test_unordered_stream_falls_back_to_card_id_sets(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        # Последняя карточка остается на месте: по ней определяется верхняя граница
+        shuffled_cards = organization_cards[:-1]
+        random.Random(0).shuffle(shuffled_cards)
+        shuffled_cards.append(organization_cards[-1])
+
+        # Контрольные точки работают только с движком python
+        for engine, uses_checkpoint in (("python", True), ("encoded", False)):
+            with self.subTest(engine=engine):
+                with tempfile.TemporaryDirectory() as checkpoint_dir:
+                    fallback = aggregate(
+                        make_repository(shuffled_cards),
+                        AGGREGATION_ENGINE=engine,
+                        CHECKPOINT_DIR=checkpoint_dir if uses_checkpoint else "",
+                        CHECKPOINT_INTERVAL=100,
+                    )
+                    self.assertEqual(list(Path(checkpoint_dir).iterdir()), [])
+
+                self.assertEqual(normalize(fallback), normalize(baseline))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,32 @@
+import unittest
+
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class DeltaWriteTest(unittest.TestCase):
+    def test_delta_matches_replace(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        repository = make_repository(generate_cards(seed=1))
+        aggregate(repository)
+        repository.organization_cards = organization_cards
+        delta = aggregate(repository, WRITE_MODE="delta")
+
+        self.assertEqual(normalize(delta), normalize(baseline))
+        upserted_count, deleted_count = repository.delta_counts
+        self.assertGreater(upserted_count, 0)
+        self.assertGreater(deleted_count, 0)
+
+    def test_unchanged_table_writes_nothing(self):
+        repository = make_repository(generate_cards())
+        baseline = aggregate(repository)
+
+        delta = aggregate(repository, WRITE_MODE="delta")
+
+        self.assertEqual(normalize(delta), normalize(baseline))
+        self.assertEqual(repository.delta_counts, (0, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+import unittest
+
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class EngineTest(unittest.TestCase):
+    def test_engines_match_python_engine(self):
+        organization_cards = generate_cards()
+        for output_arrays in ("all", "candidates", "none"):
+            baseline = aggregate(
+                make_repository(organization_cards), OUTPUT_ARRAYS=output_arrays
+            )
+            for engine in ("encoded", "numpy"):
+                with self.subTest(engine=engine, output_arrays=output_arrays):
+                    aggregate_domains = aggregate(
+                        make_repository(organization_cards),
+                        AGGREGATION_ENGINE=engine,
+                        OUTPUT_ARRAYS=output_arrays,
+                    )
+                    self.assertEqual(normalize(aggregate_domains), normalize(baseline))
+
+    def test_lean_output_matches_full_output(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        for output_arrays in ("candidates", "none"):
+            with self.subTest(output_arrays=output_arrays):
+                lean = aggregate(
+                    make_repository(organization_cards), OUTPUT_ARRAYS=output_arrays
+                )
+                self.assertEqual(lean.keys(), baseline.keys())
+                for domain, aggregate_domain in lean.items():
+                    full_aggregate_domain = baseline[domain]
+                    self.assertEqual(
+                        aggregate_domain.is_aggregator,
+                        full_aggregate_domain.is_aggregator,
+                    )
+                    self.assertEqual(
+                        aggregate_domain.organization_names_unique_count,
+                        full_aggregate_domain.organization_names_unique_count,
+                    )
+                    if output_arrays == "candidates" and (
+                        aggregate_domain.is_aggregator
+                    ):
+                        self.assertEqual(aggregate_domain, full_aggregate_domain)
+
+    def test_lean_output_drops_arrays(self):
+        aggregate_domains = aggregate(
+            make_repository(generate_cards()),
+            AGGREGATION_ENGINE="numpy",
+            OUTPUT_ARRAYS="candidates",
+        )
+
+        for aggregate_domain in aggregate_domains.values():
+            self.assertEqual(
+                aggregate_domain.organization_names is not None,
+                bool(aggregate_domain.is_aggregator),
+            )
+
+    def test_conflicting_modes_are_rejected(self):
+        repository = make_repository(generate_cards(100, 10))
+        for values in (
+            {"SPILL_MEMORY_BUDGET_MB": 1, "APPROXIMATE_MIN_NAMES": 50},
+            {"SPILL_MEMORY_BUDGET_MB": 1, "AGGREGATION_ENGINE": "encoded"},
+            {"APPROXIMATE_MIN_NAMES": 50, "AGGREGATION_ENGINE": "numpy"},
+        ):
+            with self.subTest(**values), self.assertRaises(ValueError):
+                aggregate(repository, **values)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import unittest
+
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class IncrementalTest(unittest.TestCase):
+    def test_update_matches_full_rebuild(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        repository = make_repository(organization_cards[:1800])
+        aggregate(repository, INCREMENTAL=True)
+        self.assertEqual(repository.watermark, organization_cards[1799].id)
+        repository.organization_cards = organization_cards
+        incremental = aggregate(repository, INCREMENTAL=True)
+
+        self.assertEqual(repository.watermark, organization_cards[-1].id)
+        self.assertEqual(normalize(incremental), normalize(baseline))
+
+    def test_lean_rebuild_is_not_updated(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        # Таблица без массивов у не-агрегаторов не годится для слияния названий
+        repository = make_repository(organization_cards[:1800])
+        aggregate(repository, INCREMENTAL=True)
+        aggregate(repository, OUTPUT_ARRAYS="candidates")
+        self.assertIsNone(repository.watermark)
+        repository.organization_cards = organization_cards
+        incremental = aggregate(repository, INCREMENTAL=True)
+
+        self.assertEqual(repository.watermark, organization_cards[-1].id)
+        self.assertEqual(normalize(incremental), normalize(baseline))
+
+    def test_lean_output_is_rejected(self):
+        repository = make_repository(generate_cards(100, 10))
+        aggregate(repository, INCREMENTAL=True)
+
+        with self.assertRaises(ValueError):
+            aggregate(repository, INCREMENTAL=True, OUTPUT_ARRAYS="none")
+
+    def test_other_sinks_are_rejected(self):
+        repository = make_repository(generate_cards(100, 10))
+        for values in (
+            {"RESULT_SINKS": ["postgres", "summary"]},
+            {"WRITE_MODE": "delta"},
+        ):
+            with self.subTest(**values), self.assertRaises(ValueError):
+                aggregate(repository, INCREMENTAL=True, **values)
+        self.assertIsNone(repository.watermark)
+
+
+if __name__ == "__main__":
+    unittest.main()
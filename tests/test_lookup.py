@@ -0,0 +1,78 @@
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.aggregators.lookup import (
+    AggregatorDomainIndex,
+    DomainSnapshot,
+    write_domain_snapshot,
+)
+from tests.support import aggregate, generate_cards, make_repository
+
+
+class DomainSnapshotTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = str(Path(directory.name) / "snapshots" / "aggregators.bin")
+
+    def test_membership_matches_set(self):
+        domains = {"кафе.рф", "a.example.ru", "b.example.ru", "example.ru", "z.com"}
+        self.assertEqual(write_domain_snapshot(self.path, [*domains, "z.com"]), 5)
+
+        snapshot = DomainSnapshot(self.path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(len(snapshot), len(domains))
+        for domain in [*domains, "", "c.example.ru", "example.r", "zz.com"]:
+            with self.subTest(domain=domain):
+                self.assertEqual(domain in snapshot, domain in domains)
+        self.assertNotIn(None, snapshot)
+
+    def test_empty_snapshot(self):
+        write_domain_snapshot(self.path, [])
+
+        snapshot = DomainSnapshot(self.path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(len(snapshot), 0)
+        self.assertNotIn("example.ru", snapshot)
+
+    def test_other_files_are_rejected(self):
+        Path(self.path).parent.mkdir(parents=True)
+        Path(self.path).write_bytes(b"not a snapshot at all")
+
+        with self.assertRaises(ValueError):
+            DomainSnapshot(self.path)
+
+
+class AggregatorDomainIndexTest(unittest.TestCase):
+    def test_lookup_matches_aggregate_table(self):
+        organization_cards = generate_cards()
+        repository = make_repository(organization_cards)
+        aggregate_domains = aggregate(repository)
+        aggregator_domains = {
+            domain
+            for domain, aggregate_domain in aggregate_domains.items()
+            if aggregate_domain.is_aggregator
+        }
+        self.assertTrue(aggregator_domains)
+        urls = [organization_card.link for organization_card in organization_cards]
+        urls += ["", "not a url", "https://www./", "http://192.168.0.1/"]
+
+        index = AggregatorDomainIndex.from_repository(repository)
+        expected = [index.get_url_domain(url) in aggregator_domains for url in urls]
+        self.assertTrue(any(expected))
+        self.assertEqual(index.lookup(urls), expected)
+        self.assertEqual([index.is_aggregator(url) for url in urls], expected)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / "aggregators.bin")
+            write_domain_snapshot(path, repository.get_aggregator_domains())
+            snapshot_index = AggregatorDomainIndex.from_snapshot(path)
+            try:
+                self.assertEqual(snapshot_index.lookup(urls), expected)
+            finally:
+                snapshot_index.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
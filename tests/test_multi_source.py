@@ -0,0 +1,52 @@
+import unittest
+
+from benchmarks.repository import InMemoryRepository
+from src.meta.models import SocialMedia
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class MultiSourceTest(unittest.TestCase):
+    def test_single_scan_matches_separate_runs(self):
+        organization_cards = generate_cards()
+        organization_cards_by_sources = {
+            1: organization_cards[0::2],
+            2: organization_cards[1::2],
+        }
+        repository = InMemoryRepository(
+            organization_cards_by_sources[1],
+            social_medias=[SocialMedia(1, "vk", "site0.example.ru")],
+            top_source_categories=["кафе", "ресторан", "аптека"],
+            stop_words=["ооо", "ип"],
+            source_id=1,
+            organization_cards_by_sources=organization_cards_by_sources,
+        )
+
+        aggregate(repository, SOURCE_IDS=[1, 2])
+
+        for (
+            source_id,
+            source_organization_cards,
+        ) in organization_cards_by_sources.items():
+            source_repository = repository.for_source(source_id)
+            self.assertEqual(source_repository.watermark, organization_cards[-1].id)
+            self.assertEqual(
+                normalize(source_repository.aggregate_domains),
+                normalize(aggregate(make_repository(source_organization_cards))),
+            )
+
+    def test_other_modes_are_rejected(self):
+        repository = make_repository(generate_cards(100, 10))
+        for values in (
+            {"resume": True},
+            {"INCREMENTAL": True},
+            {"CHECKPOINT_DIR": "checkpoints"},
+            {"AGGREGATION_ENGINE": "numpy"},
+            {"SPILL_MEMORY_BUDGET_MB": 64},
+        ):
+            with self.subTest(**values):
+                with self.assertRaises(ValueError):
+                    aggregate(repository, SOURCE_IDS=[1, 2], **values)
+
+
+if __name__ == "__main__":
+    unittest.main()
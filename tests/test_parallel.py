@@ -0,0 +1,56 @@
+import unittest
+
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class ShardedAggregationTest(unittest.TestCase):
+    def test_matches_serial_aggregation(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(make_repository(organization_cards))
+
+        sharded = aggregate(
+            make_repository(organization_cards),
+            AGGREGATION_WORKERS=3,
+            AGGREGATION_BATCH_SIZE=250,
+        )
+
+        self.assertEqual(sharded.keys(), baseline.keys())
+        # Шард получает названия в порядке потока, поэтому списки совпадают без сортировки
+        for domain, aggregate_domain in sharded.items():
+            self.assertEqual(
+                aggregate_domain.organization_names,
+                baseline[domain].organization_names,
+            )
+            self.assertEqual(
+                aggregate_domain.first_word_of_names,
+                baseline[domain].first_word_of_names,
+            )
+        # Порядок уникальных значений зависит от сида хэша строк в процессе шарда
+        self.assertEqual(normalize(sharded), normalize(baseline))
+
+    def test_lean_output_matches_serial_aggregation(self):
+        organization_cards = generate_cards()
+        baseline = aggregate(
+            make_repository(organization_cards), OUTPUT_ARRAYS="candidates"
+        )
+
+        sharded = aggregate(
+            make_repository(organization_cards),
+            AGGREGATION_WORKERS=2,
+            AGGREGATION_BATCH_SIZE=500,
+            OUTPUT_ARRAYS="candidates",
+        )
+
+        self.assertEqual(normalize(sharded), normalize(baseline))
+
+    def test_rejects_other_engines(self):
+        with self.assertRaises(ValueError):
+            aggregate(
+                make_repository(generate_cards(100, 10)),
+                AGGREGATION_WORKERS=2,
+                AGGREGATION_ENGINE="encoded",
+            )
+
+
+if __name__ == "__main__":
+    unittest.main()
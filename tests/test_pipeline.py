@@ -0,0 +1,40 @@
+import unittest
+
+from src.config.metrics import metrics
+from tests.support import aggregate, generate_cards, make_repository, normalize
+
+
+class AsyncPipelineTest(unittest.TestCase):
+    def setUp(self):
+        self.organization_cards = generate_cards()
+        self.baseline = normalize(aggregate(make_repository(self.organization_cards)))
+
+    def test_pipeline_matches_serial_run(self):
+        with self.assertLogs("src.aggregators.services", "INFO") as logs:
+            aggregate_domains = aggregate(
+                make_repository(self.organization_cards), ASYNC_PIPELINE=True
+            )
+
+        self.assertIn("Aggregating with the async pipeline", "\n".join(logs.output))
+        self.assertEqual(normalize(aggregate_domains), self.baseline)
+
+    def test_unsupported_settings_fall_back_to_serial_run(self):
+        metrics.values.pop("spills", None)
+        with self.assertLogs("src.aggregators.services", "WARNING") as logs:
+            aggregate_domains = aggregate(
+                make_repository(self.organization_cards),
+                ASYNC_PIPELINE=True,
+                SPILL_MEMORY_BUDGET_MB=1,
+                CARD_READERS=2,
+            )
+
+        self.assertIn(
+            "ASYNC_PIPELINE is not used with CARD_READERS, SPILL_MEMORY_BUDGET_MB",
+            "\n".join(logs.output),
+        )
+        self.assertIn("spills", metrics.values)
+        self.assertEqual(normalize(aggregate_domains), self.baseline)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,113 @@
+import unittest
+from itertools import groupby
+
+from src.config.database import DatabaseConnection
+from src.organization_cards.models import OrganizationCard
+from src.organization_cards.repository import (
+    OrganizationCardRepository,
+    split_card_id_range,
+)
+from tests.support import (
+    aggregate,
+    generate_cards,
+    make_repository,
+    normalize,
+    override_settings,
+)
+
+
+def generate_multi_row_cards() -> list[OrganizationCard]:
+    """Every card has two rows, so a batch must not split a card"""
+    organization_cards: list[OrganizationCard] = []
+    for organization_card in generate_cards(500, 20):
+        organization_cards.append(organization_card)
+        organization_cards.append(
+            organization_card._replace(link="https://other.example.ru/")
+        )
+    return organization_cards
+
+
+class SplitCardIdRangeTest(unittest.TestCase):
+    def test_ranges_cover_the_ids_with_equal_width(self):
+        self.assertEqual(split_card_id_range(0, 10, 3), [(0, 4), (4, 8), (8, 10)])
+
+    def test_empty_range_has_no_parts(self):
+        self.assertEqual(split_card_id_range(5, 5, 3), [])
+
+    def test_more_parts_than_ids(self):
+        self.assertEqual(split_card_id_range(0, 2, 5), [(0, 1), (1, 2)])
+
+
+class RangeReaderTest(unittest.TestCase):
+    def setUp(self):
+        self.organization_cards = generate_multi_row_cards()
+        self.card_id_ranges: list[tuple[int, int]] = []
+        self.repository = OrganizationCardRepository(DatabaseConnection(), source_id=1)
+        self.repository.get_min_organization_card_id = self.get_min_card_id
+        self.repository.read_organization_cards = self.read_cards
+
+    def get_min_card_id(self, after_card_id: int = 0) -> int | None:
+        return min(
+            (card.id for card in self.organization_cards if card.id > after_card_id),
+            default=None,
+        )
+
+    def read_cards(self, after_card_id, until_card_id, stage_name=""):
+        self.card_id_ranges.append((after_card_id, until_card_id))
+        for organization_card in self.organization_cards:
+            if after_card_id < organization_card.id <= until_card_id:
+                yield organization_card
+
+    def stream(self, readers: int) -> list[OrganizationCard]:
+        return list(
+            self.repository.stream_organization_card_ranges(
+                0, self.organization_cards[-1].id, readers, batch_size=7
+            )
+        )
+
+    def test_merge_keeps_cards_whole_and_ranges_ordered(self):
+        organization_cards = self.stream(readers=3)
+
+        self.assertEqual(len(self.card_id_ranges), 3)
+        self.assertEqual(sorted(organization_cards), sorted(self.organization_cards))
+        # Строки карточки идут подряд, даже если пакет набрался внутри нее
+        card_ids = [
+            card_id for card_id, _ in groupby(card.id for card in organization_cards)
+        ]
+        self.assertEqual(len(card_ids), len(set(card_ids)))
+        for lower, upper in self.card_id_ranges:
+            range_card_ids = [
+                card_id for card_id in card_ids if lower < card_id <= upper
+            ]
+            self.assertEqual(range_card_ids, sorted(range_card_ids))
+
+    def test_readers_are_capped_by_the_pool(self):
+        with override_settings(DATABASE_POOL_MAX_SIZE=5):
+            with self.assertLogs("src.organization_cards.repository", "WARNING"):
+                organization_cards = self.stream(readers=8)
+
+        self.assertEqual(len(self.card_id_ranges), 2)
+        self.assertEqual(sorted(organization_cards), sorted(self.organization_cards))
+
+
+class InMemoryReadersTest(unittest.TestCase):
+    def test_parallel_readers_match_ordered_stream(self):
+        organization_cards = generate_multi_row_cards()
+        baseline = aggregate(make_repository(organization_cards))
+        repository = make_repository(organization_cards)
+
+        card_ids = [
+            organization_card.id
+            for organization_card in repository.stream_organization_cards(
+                until_card_id=organization_cards[-1].id, readers=3
+            )
+        ]
+        self.assertNotEqual(card_ids, sorted(card_ids))
+        self.assertEqual(sorted(card_ids), [card.id for card in organization_cards])
+
+        aggregate_domains = aggregate(repository, CARD_READERS=3)
+        self.assertEqual(normalize(aggregate_domains), normalize(baseline))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,116 @@
+import importlib.util
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.aggregators.sinks import (
+    JsonLinesSink,
+    ParquetSink,
+    get_sinks,
+    write_to_sinks,
+)
+from tests.support import (
+    aggregate,
+    generate_cards,
+    make_repository,
+    normalize,
+    normalize_row,
+    override_settings,
+)
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+
+class SinksTest(unittest.TestCase):
+    def setUp(self):
+        self.organization_cards = generate_cards(1000, 50)
+        self.baseline = normalize(aggregate(make_repository(self.organization_cards)))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def read_jsonl(self, path: Path) -> dict[str, tuple]:
+        rows = [json.loads(line) for line in path.read_text().splitlines()]
+        return {row["domain"]: normalize_row(row.values()) for row in rows}
+
+    def test_file_sinks_match_postgres_table(self):
+        repository = make_repository(self.organization_cards)
+        with self.assertLogs("src.aggregators.sinks", "INFO") as logs:
+            aggregate(
+                repository,
+                RESULT_SINKS=["postgres", "jsonl", "summary"],
+                RESULT_JSONL_PATH=str(self.directory / "domains_{source_id}.jsonl"),
+                RESULT_BATCH_SIZE=7,
+            )
+
+        self.assertEqual(normalize(repository.aggregate_domains), self.baseline)
+        jsonl_path = self.directory / f"domains_{repository.source_id}.jsonl"
+        self.assertEqual(self.read_jsonl(jsonl_path), self.baseline)
+        self.assertEqual(list(self.directory.iterdir()), [jsonl_path])
+        aggregators_count = sum(row[-1] for row in self.baseline.values())
+        self.assertIn(
+            f"Source {repository.source_id}: {len(self.baseline)} aggregate domains, "
+            f"{aggregators_count} aggregators",
+            "\n".join(logs.output),
+        )
+
+    def test_file_is_published_only_when_complete(self):
+        path = self.directory / "domains.jsonl"
+        path.write_text("previous\n")
+        models = list(aggregate(make_repository(self.organization_cards)).values())
+        temporary_path = self.directory / "domains.jsonl.tmp"
+
+        def iter_models_and_fail():
+            yield from models[:2]
+            # Пока файл пишется, читатели видят прежнюю версию
+            self.assertTrue(temporary_path.exists())
+            self.assertEqual(path.read_text(), "previous\n")
+            raise RuntimeError("connection lost")
+
+        with self.assertRaises(RuntimeError):
+            write_to_sinks([JsonLinesSink(str(path))], iter_models_and_fail(), 1)
+
+        self.assertEqual(path.read_text(), "previous\n")
+        self.assertFalse(temporary_path.exists())
+
+        write_to_sinks([JsonLinesSink(str(path))], models, 2)
+        self.assertEqual(self.read_jsonl(path), self.baseline)
+        self.assertFalse(temporary_path.exists())
+
+    @unittest.skipUnless(HAS_PYARROW, "pyarrow is not installed")
+    def test_parquet_matches_postgres_table(self):
+        import pyarrow.parquet as pq
+
+        repository = make_repository(self.organization_cards)
+        aggregate(
+            repository,
+            RESULT_SINKS=["parquet"],
+            RESULT_PARQUET_PATH=str(self.directory / "domains.parquet"),
+            RESULT_BATCH_SIZE=7,
+        )
+
+        rows = pq.read_table(self.directory / "domains.parquet").to_pylist()
+        self.assertEqual(
+            {row["domain"]: normalize_row(row.values()) for row in rows},
+            self.baseline,
+        )
+
+    @unittest.skipIf(HAS_PYARROW, "pyarrow is installed")
+    def test_parquet_requires_pyarrow(self):
+        with self.assertRaises(ImportError):
+            ParquetSink(str(self.directory / "domains.parquet"))
+
+    def test_sink_settings_are_checked(self):
+        repository = make_repository(self.organization_cards)
+        for values in (
+            {"RESULT_SINKS": ["csv"]},
+            {"RESULT_SINKS": ["jsonl"], "RESULT_JSONL_PATH": ""},
+        ):
+            with self.subTest(**values), override_settings(**values):
+                with self.assertRaises(ValueError):
+                    get_sinks(repository, None)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,74 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from src.aggregators.repository import AggregatorRepository
+from src.config.database import DatabaseConnection
+from src.config.metrics import metrics
+from src.organization_cards.snapshots import TopSourceCategoriesCache
+from tests.support import override_settings
+
+
+class TopSourceCategoriesCacheTest(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = Path(directory.name) / "cache" / "top_categories.json"
+        self.queries = 0
+        self.repository = AggregatorRepository(DatabaseConnection(), source_id=1)
+        self.repository.organization_card_repository.get_top_source_categories = (
+            self.query_top_source_categories
+        )
+
+    def query_top_source_categories(self) -> list[str]:
+        """The query samples the table, so every call returns other categories"""
+        self.queries += 1
+        return [f"категория {self.queries}", "кафе"]
+
+    def get_top_source_categories(self, **values) -> list[str]:
+        with override_settings(
+            **{"TOP_CATEGORIES_CACHE_PATH": str(self.path), **values}
+        ):
+            return self.repository.get_top_source_categories()
+
+    def test_without_cache_path_every_run_queries(self):
+        first = self.get_top_source_categories(TOP_CATEGORIES_CACHE_PATH="")
+        second = self.get_top_source_categories(TOP_CATEGORIES_CACHE_PATH="")
+
+        self.assertEqual(
+            (first, second), (["категория 1", "кафе"], ["категория 2", "кафе"])
+        )
+        self.assertFalse(self.path.exists())
+
+    def test_snapshot_is_reused_until_refreshed(self):
+        first = self.get_top_source_categories()
+        second = self.get_top_source_categories()
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.queries, 1)
+        self.assertEqual(metrics.values["top_source_categories_version"], 1)
+
+        refreshed = self.get_top_source_categories(TOP_CATEGORIES_REFRESH=True)
+
+        self.assertEqual(refreshed, ["категория 2", "кафе"])
+        self.assertEqual(metrics.values["top_source_categories_version"], 2)
+        self.assertEqual(
+            json.loads(self.path.read_text())["top_source_categories"], refreshed
+        )
+
+    def test_expired_snapshot_is_replaced(self):
+        self.get_top_source_categories()
+        snapshot = json.loads(self.path.read_text())
+        snapshot["created_at"] -= 2 * 3600
+        self.path.write_text(json.dumps(snapshot))
+
+        self.assertEqual(
+            self.get_top_source_categories(TOP_CATEGORIES_CACHE_TTL_HOURS=1),
+            ["категория 2", "кафе"],
+        )
+        self.assertEqual(TopSourceCategoriesCache(str(self.path)).load().version, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+
+from src.aggregators.spill import SpillingGrouper
+from src.config.metrics import metrics
+from tests.support import (
+    aggregate,
+    generate_cards,
+    make_repository,
+    normalize,
+    override_settings,
+)
+
+
+class SpillTest(unittest.TestCase):
+    def setUp(self):
+        self.organization_cards = generate_cards(20000, 400)
+        self.baseline = normalize(aggregate(make_repository(self.organization_cards)))
+
+    def test_spilled_output_matches_in_memory_grouping(self):
+        spilled = aggregate(
+            make_repository(self.organization_cards), SPILL_MEMORY_BUDGET_MB=1
+        )
+
+        # Бюджет считается на накопленные группы, а не на каждую карточку
+        self.assertGreater(metrics.values["spills"], 1)
+        self.assertLess(metrics.values["spills"], 10)
+        self.assertEqual(normalize(spilled), self.baseline)
+
+    def test_large_budget_does_not_spill(self):
+        in_memory = aggregate(
+            make_repository(self.organization_cards), SPILL_MEMORY_BUDGET_MB=1024
+        )
+
+        self.assertEqual(metrics.values["spills"], 0)
+        self.assertEqual(normalize(in_memory), self.baseline)
+
+
+class SpillingGrouperTest(unittest.TestCase):
+    def test_opens_only_used_partitions(self):
+        with override_settings(SPILL_MEMORY_BUDGET_MB=1, SPILL_PARTITIONS=64):
+            spilling_grouper = SpillingGrouper()
+        spilling_grouper.memory_budget = 1
+        domain_names = [
+            ("a.example.ru", 1, "кофейня"),
+            ("b.example.ru", 2, "аптека"),
+            ("a.example.ru", 3, "пекарня"),
+        ]
+
+        spilling_grouper.group(domain_names)
+
+        self.assertEqual(spilling_grouper.partitions, 64)
+        self.assertEqual(spilling_grouper.spills, 3)
+        self.assertLessEqual(len(spilling_grouper.partition_files), 2)
+        self.assertEqual(
+            dict(spilling_grouper.iter_groups()),
+            {
+                "a.example.ru": ["кофейня", "пекарня"],
+                "b.example.ru": ["аптека"],
+            },
+        )
+        self.assertEqual(spilling_grouper.partition_files, {})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+import re
+import unittest
+
+from src.aggregators.calculator import AggregatorCalculator
+from src.aggregators.tokenizer import Tokenizer
+from tests.support import generate_cards, override_settings
+
+STOP_WORDS = {"ооо", "ип"}
+
+NAMES = [
+    "ООО Ромашка",
+    "ооо ромашка",
+    "кафе  «Ромашка»",
+    "ип иванов и.и.",
+    "«» кафе",
+    "  пекарня\tу дома ",
+    "bar d'artagnan",
+    "шиномонтаж 24/7",
+    "—",
+    "",
+]
+
+
+def get_baseline_words(
+    names: list[str], stop_words: set[str]
+) -> tuple[list[str], list[str]]:
+    """get_words_out_names before the tokenizer: one regex pass per word"""
+    pattern = re.compile(r"[^\w']+")
+    first_word_of_names: list[str] = []
+    words: list[str] = []
+    for name in names:
+        if not name:
+            continue
+        for index, word in enumerate(name.split()):
+            cleaned_word = pattern.sub("", word)
+            if not cleaned_word or cleaned_word in stop_words:
+                continue
+            words.append(cleaned_word)
+            if index == 0:
+                first_word_of_names.append(cleaned_word)
+    return first_word_of_names, words
+
+
+class TokenizerTest(unittest.TestCase):
+    def test_matches_baseline_words(self):
+        names = NAMES + [
+            organization_card.organization_name
+            for organization_card in generate_cards(500, 20)
+        ]
+
+        self.assertEqual(
+            Tokenizer(STOP_WORDS).tokenize_names(names),
+            get_baseline_words(names, STOP_WORDS),
+        )
+
+    def test_repeated_names_are_memoized(self):
+        with override_settings(TOKENIZER_CACHE_SIZE=3):
+            tokenizer = Tokenizer(STOP_WORDS)
+
+        tokenizer.tokenize_names(["кафе", "аптека", "кафе", "кафе"])
+        cache_info = tokenizer.tokenize.cache_info()
+
+        self.assertEqual((cache_info.hits, cache_info.misses), (2, 2))
+        self.assertEqual(cache_info.maxsize, 3)
+        self.assertEqual(tokenizer.calls, 4)
+
+    def test_distinct_names_bypass_the_cache(self):
+        tokenizer = Tokenizer(STOP_WORDS)
+
+        name_tokens = tokenizer.tokenize_distinct_names(["ооо ромашка", "«» кафе"])
+
+        self.assertEqual(name_tokens, [(None, ("ромашка",)), (None, ("кафе",))])
+        self.assertEqual(tokenizer.tokenize.cache_info().currsize, 0)
+
+    def test_tokenizer_is_reused_for_the_same_stop_words(self):
+        calculator = AggregatorCalculator()
+        tokenizer = calculator.get_tokenizer(STOP_WORDS)
+
+        self.assertIs(calculator.get_tokenizer(set(STOP_WORDS)), tokenizer)
+        self.assertIsNot(calculator.get_tokenizer({"ооо"}), tokenizer)
+
+
+if __name__ == "__main__":
+    unittest.main()
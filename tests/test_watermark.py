@@ -0,0 +1,125 @@
+import unittest
+from contextlib import contextmanager
+
+from src.aggregators.sinks import PostgresSink
+from src.organization_cards import sql
+from src.organization_cards.repository import OrganizationCardRepository
+from tests.support import override_settings
+
+
+class RecordingCopy:
+    def __init__(self, rows: list) -> None:
+        self.rows = rows
+
+    def set_types(self, types) -> None:
+        pass
+
+    def write_row(self, row) -> None:
+        self.rows.append(row)
+
+
+class RecordingCursor:
+    def __init__(self, database: "RecordingDatabase") -> None:
+        self.database = database
+        self.rowcount = 0
+
+    def __enter__(self) -> "RecordingCursor":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        pass
+
+    def execute(self, query: str, params: dict | None = None) -> None:
+        self.database.statements.append((self.database.transaction, query, params))
+
+    @contextmanager
+    def copy(self, query: str):
+        yield RecordingCopy(self.database.rows)
+
+
+class RecordingConnection:
+    def __init__(self, database: "RecordingDatabase") -> None:
+        self.database = database
+
+    def cursor(self) -> RecordingCursor:
+        return RecordingCursor(self.database)
+
+
+class RecordingDatabase:
+    """Records the statements with the transaction they were executed in"""
+
+    def __init__(self) -> None:
+        self.statements: list[tuple[int | None, str, dict | None]] = []
+        self.rows: list = []
+        self.transactions = 0
+        self.transaction: int | None = None
+
+    @contextmanager
+    def connect(self):
+        yield RecordingConnection(self)
+
+    @contextmanager
+    def connect_with_transaction(self):
+        self.transactions += 1
+        self.transaction = self.transactions
+        try:
+            yield RecordingConnection(self)
+        finally:
+            self.transaction = None
+
+
+class PostgresWatermarkTest(unittest.TestCase):
+    def write(self, watermark: int | None, write_mode: str) -> RecordingDatabase:
+        database = RecordingDatabase()
+        repository = OrganizationCardRepository(database, source_id=1)
+        with override_settings(WRITE_MODE=write_mode):
+            with PostgresSink(repository, watermark).open() as write:
+                write([("example.ru",)])
+        return database
+
+    def get_transaction(self, database: RecordingDatabase, query: str) -> int | None:
+        (transaction,) = [
+            transaction
+            for transaction, statement, _ in database.statements
+            if statement == query
+        ]
+        return transaction
+
+    def test_watermark_is_moved_with_the_swap(self):
+        database = self.write(42, "replace")
+
+        swap = self.get_transaction(
+            database,
+            OrganizationCardRepository(database, source_id=1).format_table_names(
+                sql.SWAP_AGGREGATE_DOMAINS_STAGING
+            ),
+        )
+        self.assertIsNotNone(swap)
+        self.assertEqual(
+            self.get_transaction(database, sql.SET_AGGREGATE_DOMAINS_WATERMARK), swap
+        )
+        self.assertEqual(database.statements[-1][2]["last_card_id"], 42)
+
+    def test_delta_moves_the_watermark_in_its_transaction(self):
+        database = self.write(42, "delta")
+
+        transaction = self.get_transaction(
+            database, sql.SET_AGGREGATE_DOMAINS_WATERMARK
+        )
+        self.assertIsNotNone(transaction)
+        self.assertEqual(database.transactions, 1)
+
+    def test_missing_watermark_is_removed_with_the_swap(self):
+        database = self.write(None, "replace")
+
+        self.assertIsNotNone(
+            self.get_transaction(database, sql.DELETE_AGGREGATE_DOMAINS_WATERMARK)
+        )
+        self.assertNotIn(
+            sql.SET_AGGREGATE_DOMAINS_WATERMARK,
+            [statement for _, statement, _ in database.statements],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()